@@ -2,6 +2,7 @@ from rest_framework import generics
 from . import models
 from . import serializers
 from rest_framework.permissions import IsAuthenticated
+from app.campos_dinamicos import CamposDinamicosViewMixin
 from app.permissions import GlobalDefaultPermission
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import authenticate, login, logout
@@ -17,78 +18,78 @@ from principais.models import Terapeuta, Consulta
 # ===== API VIEWS =====
 
 # Abordagem Views
-class AbordagemListCreateAPIView(generics.ListCreateAPIView):
+class AbordagemListCreateAPIView(CamposDinamicosViewMixin, generics.ListCreateAPIView):
     permission_classes = (IsAuthenticated, GlobalDefaultPermission)
     queryset = models.Abordagem.objects.all()
     serializer_class = serializers.AbordagemSerializer
 
 
-class AbordagemRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView):
+class AbordagemRetrieveUpdateDestroyAPIView(CamposDinamicosViewMixin, generics.RetrieveUpdateDestroyAPIView):
     permission_classes = (IsAuthenticated, GlobalDefaultPermission)
     queryset = models.Abordagem.objects.all()
     serializer_class = serializers.AbordagemSerializer
 
 
 # Captação Views
-class CaptacaoListCreateAPIView(generics.ListCreateAPIView):
+class CaptacaoListCreateAPIView(CamposDinamicosViewMixin, generics.ListCreateAPIView):
     permission_classes = (IsAuthenticated, GlobalDefaultPermission)
     queryset = models.Captacao.objects.all()
     serializer_class = serializers.CaptacaoSerializer
 
 
-class CaptacaoRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView):
+class CaptacaoRetrieveUpdateDestroyAPIView(CamposDinamicosViewMixin, generics.RetrieveUpdateDestroyAPIView):
     permission_classes = (IsAuthenticated, GlobalDefaultPermission)
     queryset = models.Captacao.objects.all()
     serializer_class = serializers.CaptacaoSerializer
 
 
 # Clínica Views
-class ClinicaListCreateAPIView(generics.ListCreateAPIView):
+class ClinicaListCreateAPIView(CamposDinamicosViewMixin, generics.ListCreateAPIView):
     permission_classes = (IsAuthenticated, GlobalDefaultPermission)
     queryset = models.Clinica.objects.all()
     serializer_class = serializers.ClinicaSerializer
 
 
-class ClinicaRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView):
+class ClinicaRetrieveUpdateDestroyAPIView(CamposDinamicosViewMixin, generics.RetrieveUpdateDestroyAPIView):
     permission_classes = (IsAuthenticated, GlobalDefaultPermission)
     queryset = models.Clinica.objects.all()
     serializer_class = serializers.ClinicaSerializer
 
 
 # Modalidade Views
-class ModalidadeListCreateAPIView(generics.ListCreateAPIView):
+class ModalidadeListCreateAPIView(CamposDinamicosViewMixin, generics.ListCreateAPIView):
     permission_classes = (IsAuthenticated, GlobalDefaultPermission)
     queryset = models.Modalidade.objects.all()
     serializer_class = serializers.ModalidadeSerializer
 
 
-class ModalidadeRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView):
+class ModalidadeRetrieveUpdateDestroyAPIView(CamposDinamicosViewMixin, generics.RetrieveUpdateDestroyAPIView):
     permission_classes = (IsAuthenticated, GlobalDefaultPermission)
     queryset = models.Modalidade.objects.all()
     serializer_class = serializers.ModalidadeSerializer
 
 
 # Núcleo Views
-class NucleoListCreateAPIView(generics.ListCreateAPIView):
+class NucleoListCreateAPIView(CamposDinamicosViewMixin, generics.ListCreateAPIView):
     permission_classes = (IsAuthenticated, GlobalDefaultPermission)
     queryset = models.Nucleo.objects.all()
     serializer_class = serializers.NucleoSerializer
 
 
-class NucleoRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView):
+class NucleoRetrieveUpdateDestroyAPIView(CamposDinamicosViewMixin, generics.RetrieveUpdateDestroyAPIView):
     permission_classes = (IsAuthenticated, GlobalDefaultPermission)
     queryset = models.Nucleo.objects.all()
     serializer_class = serializers.NucleoSerializer
 
 
 # Setor Views
-class SetorListCreateAPIView(generics.ListCreateAPIView):
+class SetorListCreateAPIView(CamposDinamicosViewMixin, generics.ListCreateAPIView):
     permission_classes = (IsAuthenticated, GlobalDefaultPermission)
     queryset = models.Setor.objects.all()
     serializer_class = serializers.SetorSerializer
 
 
-class SetorRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView):
+class SetorRetrieveUpdateDestroyAPIView(CamposDinamicosViewMixin, generics.RetrieveUpdateDestroyAPIView):
     permission_classes = (IsAuthenticated, GlobalDefaultPermission)
     queryset = models.Setor.objects.all()
     serializer_class = serializers.SetorSerializer
@@ -0,0 +1,141 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.utils.module_loading import import_string
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+PARAMETRO_CAMPOS = 'fields'
+PARAMETRO_EXPANDIR = 'expand'
+
+
+def _lista(request, parametro):
+    valor = request.query_params.get(parametro, '')
+    return [nome.strip() for nome in valor.split(',') if nome.strip()]
+
+
+def campos_pedidos(request):
+    """
+    (campos, expandir) de ?fields=a,b&expand=fk_x nas leituras (GET/HEAD);
+    None quando a requisição não escolhe campos
+    """
+    if request is None or request.method not in SAFE_METHODS:
+        return None
+    campos, expandir = _lista(request, PARAMETRO_CAMPOS), _lista(request, PARAMETRO_EXPANDIR)
+    if not campos and not expandir:
+        return None
+    return campos, expandir
+
+
+class CamposDinamicosSerializerMixin:
+    """
+    Campos escolhidos pelo cliente na leitura: ?fields=a,b devolve só esses
+    campos e ?expand=fk_x troca o ID da relação pelo objeto, com o serializer
+    declarado em Meta.expansiveis (caminho importável). Relação expandida
+    entra nos campos mesmo fora de ?fields=. Vale para o serializer raiz ou o
+    item da lista; os aninhados mantêm os próprios campos.
+    """
+    def get_fields(self):
+        fields = super().get_fields()
+        pedidos = campos_pedidos(self.context.get('request')) if self._eh_raiz() else None
+        if pedidos is None:
+            return fields
+        campos, expandir = pedidos
+
+        expansiveis = getattr(self.Meta, 'expansiveis', {})
+        invalidos = [nome for nome in expandir if nome not in expansiveis]
+        if invalidos:
+            raise serializers.ValidationError({PARAMETRO_EXPANDIR: [
+                f'Não é possível expandir: {", ".join(invalidos)}. Opções: {", ".join(expansiveis) or "nenhuma"}.'
+            ]})
+        invalidos = [nome for nome in campos if nome not in fields]
+        if invalidos:
+            raise serializers.ValidationError({PARAMETRO_CAMPOS: [f'Campo(s) inexistente(s): {", ".join(invalidos)}.']})
+
+        for nome in expandir:
+            fields[nome] = import_string(expansiveis[nome])(read_only=True)
+        if campos:
+            fields = {nome: campo for nome, campo in fields.items() if nome in campos or nome in expandir}
+        return fields
+
+    def _eh_raiz(self):
+        pai = self.parent
+        return pai is None or (isinstance(pai, serializers.ListSerializer) and pai.parent is None)
+
+
+def _caminhos(serializer, modelo, prefixo=''):
+    """
+    (colunas, relações) lidas pelos campos do serializer, como caminhos do ORM
+    a partir do modelo. None quando algum campo não corresponde a colunas
+    (propriedade, método, relação reversa ou many-to-many).
+    """
+    colunas, relacoes = {prefixo + modelo._meta.pk.name}, set()
+    anotados = getattr(getattr(serializer, 'Meta', None), 'campos_anotados', ())
+
+    for nome, campo in serializer.fields.items():
+        if nome in anotados:
+            # Vem da anotação do queryset (CamposDinamicosViewMixin.anotacoes), não de coluna
+            continue
+        if campo.source == '*':
+            return None
+
+        atual, caminho = modelo, prefixo
+        for posicao, atributo in enumerate(campo.source_attrs):
+            try:
+                field = atual._meta.get_field(atributo)
+            except FieldDoesNotExist:
+                return None
+            if not field.concrete or field.many_to_many:
+                return None
+            colunas.add(caminho + atributo)
+            ultimo = posicao == len(campo.source_attrs) - 1
+            if ultimo and not isinstance(campo, serializers.BaseSerializer):
+                break
+            if not field.is_relation:
+                return None
+            relacoes.add(caminho + atributo)
+            atual, caminho = field.related_model, f'{caminho}{atributo}__'
+
+        if isinstance(campo, serializers.BaseSerializer):
+            # Relação expandida: colunas e relações do serializer aninhado, a partir dela
+            aninhado = _caminhos(campo, atual, caminho)
+            if aninhado is None:
+                return None
+            colunas |= aninhado[0]
+            relacoes |= aninhado[1]
+    return colunas, relacoes
+
+
+def otimizar_queryset(queryset, serializer, extras=()):
+    """
+    Queryset com select_related só das relações lidas pelo serializer e only()
+    das colunas usadas (mais `extras`, ex.: a ordenação do cursor). Se algum
+    campo não mapeia para colunas, o queryset volta como está.
+    """
+    caminhos = _caminhos(serializer, queryset.model)
+    if caminhos is None:
+        return queryset
+    colunas, relacoes = caminhos
+
+    queryset = queryset.select_related(None)
+    if relacoes:
+        queryset = queryset.select_related(*sorted(relacoes))
+    return queryset.only(*sorted(colunas | set(extras)))
+
+
+class CamposDinamicosViewMixin:
+    """
+    Com ?fields=/?expand= o queryset da view é derivado dos campos pedidos
+    (otimizar_queryset) e só recebe as anotações pedidas em `anotacoes`
+    (nome do campo -> expressão). Sem esses parâmetros, ou fora das leituras,
+    é o queryset da view com todas as anotações.
+    """
+    anotacoes = {}
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if campos_pedidos(self.request) is None:
+            return queryset.annotate(**self.anotacoes)
+
+        serializer = self.get_serializer()
+        anotacoes = {nome: expressao for nome, expressao in self.anotacoes.items() if nome in serializer.fields}
+        ordenacao = [campo.lstrip('-') for campo in getattr(self, 'keyset_ordering', ())]
+        return otimizar_queryset(queryset, serializer, extras=ordenacao).annotate(**anotacoes)
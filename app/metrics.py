@@ -1,316 +1,657 @@
-from django.db.models import Sum, Count, Avg, Q
-from django.db.models.functions import TruncMonth
+from django.db import connection
+from django.db.models import Sum, Count, F, Q, OuterRef, Subquery
+from django.db.models.functions import TruncMonth, TruncWeek
 from django.utils.formats import number_format
 from django.utils import timezone
 from datetime import datetime, timedelta
 from decimal import Decimal
 from principais import models
+from principais.agregados import fim_do_mes, DIMENSOES
+from .metrics_cache import cached_metric, hoje_metricas
+from .metrics_runner import executar_metricas
+from .metrics_instrumentation import instrumented_metric, registrar_erro_metrica
+import logging
 
+logger = logging.getLogger(__name__)
 
+
+@cached_metric
+@instrumented_metric
 def get_terapeuta_metrics():
+    """
+    Tabela por terapeuta (últimos 31 dias). Erros não são tratados aqui: sobem
+    para executar_metricas, que usa o valor padrão e marca o dashboard como parcial.
+    """
+    # Definir período dos últimos 31 dias
+    hoje = hoje_metricas()
+    data_limite = hoje - timedelta(days=31)
+
+    # Pacientes ativos distintos não são somáveis por dia: subquery em consultas
+    pacientes_ativos = models.Consulta.objects.filter(
+        fk_terapeuta=OuterRef('fk_terapeuta'),
+        fk_paciente__is_active=True,
+        dat_consulta__gte=data_limite
+    ).order_by().values('fk_terapeuta').annotate(
+        total=Count('fk_paciente', distinct=True)
+    ).values('total')
+
+    # Demais métricas vêm do agregado diário (dia × terapeuta)
+    terapeutas_stats = models.ConsultaDiaria.objects.filter(
+        dat_consulta__gte=data_limite,
+        fk_terapeuta__is_active=True
+    ).values(
+        'fk_terapeuta',
+        'fk_terapeuta__fk_associado__nome',
+    ).annotate(
+        total_consultas=Sum('total_marcadas'),
+        total_consultasrealizadas=Sum('total_realizadas'),
+        pacientes_ativos=Subquery(pacientes_ativos),
+        valor_recebido=Sum('soma_vlr_pago'),
+        receita_acordada=Sum('soma_vlr_consulta'),
+    ).order_by('fk_terapeuta__fk_associado__nome')
+
+    metricas_detalhadas = []
+    for stats in terapeutas_stats:
+        total_consultas = stats['total_consultas'] or 0
+        total_realizadas = stats['total_consultasrealizadas'] or 0
+        valor_recebido = stats['valor_recebido'] or Decimal('0.00')
+        receita_acordada = stats['receita_acordada'] or Decimal('0.00')
+
+        taxa_adesao = (total_realizadas / total_consultas * 100) if total_consultas > 0 else 0
+        diferenca = receita_acordada - valor_recebido
+        status_diferenca = "positivo" if diferenca > 0 else ("negativo" if diferenca < 0 else "igual")
+
+        if total_consultas > 0:
+            metricas_detalhadas.append({
+                'nome': stats['fk_terapeuta__fk_associado__nome'],
+                'taxa_adesao': number_format(taxa_adesao, decimal_pos=1),
+                'pacientes_ativos': stats['pacientes_ativos'] or 0,
+                'total_consultas': total_consultas,
+                'total_consultasrealizadas': total_realizadas,
+                'valor_recebido': number_format(valor_recebido, decimal_pos=2, force_grouping=True),
+                'receita_acordada': number_format(receita_acordada, decimal_pos=2, force_grouping=True),
+                'diferenca': number_format(abs(diferenca), decimal_pos=2, force_grouping=True),
+                'status_diferenca': status_diferenca,
+            })
+
+    return metricas_detalhadas
+
+
+# Valores padrão retornados quando o cálculo falha
+DEFAULT_CONSULTA_METRICS = {
+    'taxa_adesao': '0.0',
+    'consultas_realizadas': 0,
+    'consultas_marcadas': 0,
+    'receita_total_recebida': '0,00',
+    'receita_acordada_mensal': '0,00',
+    'captacao_pacientes_mes': 0,
+    'pacientes_ativos': 0,
+    'terapeutas_ativos': 0,
+    'preco_medio_realizado': '0,00',
+    'tempo_medio_match': '0.0',
+    'porcentagem_inadimplentes': '0.0'
+}
+
+DEFAULT_PORCENTAGEM_PACIENTES = {'pacientes_com_consultas': 0, 'total_pacientes_ativos': 0, 'porcentagem': '0.0'}
+
+
+def _sql_dias_entre(coluna_data, coluna_datetime):
+    """Expressão SQL com a diferença em dias entre uma data e a data de um datetime"""
+    if connection.vendor == 'postgresql':
+        return f"({coluna_data} - CAST({coluna_datetime} AS DATE))"
+    # SQLite
+    return f"CAST(julianday({coluna_data}) - julianday(date({coluna_datetime})) AS INTEGER)"
+
+
+def _sql_dias_ate_match():
+    """
+    SELECT com os dias entre o cadastro do paciente e a data do match,
+    para os matches criados a partir de um datetime (parâmetro %s)
+    """
+    ops = connection.ops
+    pacientes = ops.quote_name(models.Paciente._meta.db_table)
+    matches = ops.quote_name(models.Match._meta.db_table)
+    return f"""
+        SELECT {_sql_dias_entre('m.dat_consulta', 'p.created_at')} AS dias
+          FROM {matches} m
+         INNER JOIN {pacientes} p ON p.pk_paciente = m.fk_paciente
+         WHERE m.created_at >= %s
+    """
+
+
+@instrumented_metric
+def _buscar_serie_diaria(data_inicio):
+    """
+    UMA query no agregado diário cobrindo a maior janela do dashboard (180 dias).
+    As métricas de 31 dias e os gráficos mensais/diários saem dessas linhas.
+    """
+    return list(
+        models.ConsultaDiaria.objects.filter(
+            dat_consulta__gte=data_inicio
+        ).values('dat_consulta').annotate(
+            total_marcadas=Sum('total_marcadas'),
+            total_realizadas=Sum('total_realizadas'),
+            soma_vlr_consulta=Sum('soma_vlr_consulta'),
+            soma_vlr_pago=Sum('soma_vlr_pago'),
+            consultas_valor_zero=Sum('consultas_valor_zero'),
+            consultas_valor_positivo=Sum('consultas_valor_positivo'),
+            realizadas_pagas=Sum('realizadas_pagas'),
+            soma_vlr_pago_realizado=Sum('soma_vlr_pago_realizado'),
+        ).order_by('dat_consulta')
+    )
+
+
+@instrumented_metric
+def _buscar_kpis_cadastro(data_limite):
+    """
+    UMA query com subqueries escalares para as métricas que não vêm do agregado
+    diário: pacientes, terapeutas, pacientes com consultas e tempo até o match.
+    """
+    inicio_periodo = timezone.make_aware(datetime.combine(data_limite, datetime.min.time()))
+    ops = connection.ops
+    pacientes = ops.quote_name(models.Paciente._meta.db_table)
+    terapeutas = ops.quote_name(models.Terapeuta._meta.db_table)
+    consultas = ops.quote_name(models.Consulta._meta.db_table)
+
+    sql = f"""
+        SELECT
+            (SELECT COUNT(*) FROM {pacientes} WHERE is_active = %s),
+            (SELECT COUNT(*) FROM {pacientes} WHERE created_at >= %s),
+            (SELECT SUM(vlr_sessao) FROM {pacientes} WHERE is_active = %s),
+            (SELECT COUNT(*) FROM {terapeutas} WHERE is_active = %s),
+            (SELECT COUNT(DISTINCT c.fk_paciente)
+               FROM {consultas} c
+               INNER JOIN {pacientes} p ON p.pk_paciente = c.fk_paciente
+              WHERE c.dat_consulta >= %s AND p.is_active = %s),
+            (SELECT AVG(dias) FROM ({_sql_dias_ate_match()}) dias_match)
+    """
+    inicio_periodo_db = ops.adapt_datetimefield_value(inicio_periodo)
+    params = [
+        True,
+        inicio_periodo_db,
+        True,
+        True,
+        ops.adapt_datefield_value(data_limite), True,
+        inicio_periodo_db,
+    ]
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+
+    return {
+        'pacientes_ativos': row[0] or 0,
+        'captacao_mes': row[1] or 0,
+        'receita_acordada_mensal': row[2] or 0,
+        'terapeutas_ativos': row[3] or 0,
+        'pacientes_com_consultas': row[4] or 0,
+        'tempo_medio_match': float(row[5] or 0),
+    }
+
+
+def _somar_linhas(linhas, campos):
+    totais = {campo: 0 for campo in campos}
+    for linha in linhas:
+        for campo in campos:
+            totais[campo] += linha[campo] or 0
+    return totais
+
+
+def _calcular_consulta_metrics(linhas, kpis, data_limite):
+    """Métricas principais (últimos 31 dias) a partir da série diária e dos KPIs de cadastro"""
+    stats = _somar_linhas(
+        [linha for linha in linhas if linha['dat_consulta'] >= data_limite],
+        ['total_marcadas', 'total_realizadas', 'soma_vlr_pago', 'consultas_valor_zero',
+         'consultas_valor_positivo', 'realizadas_pagas', 'soma_vlr_pago_realizado']
+    )
+
+    total_marcadas = stats['total_marcadas']
+    total_realizadas = stats['total_realizadas']
+    receita_recebida = stats['soma_vlr_pago'] or Decimal('0.00')
+    consultas_valor_zero = stats['consultas_valor_zero']
+    consultas_valor_positivo = stats['consultas_valor_positivo']
+
+    taxa_adesao = (total_realizadas / total_marcadas * 100) if total_marcadas > 0 else 0
+
+    realizadas_pagas = stats['realizadas_pagas']
+    soma_vlr_pago_realizado = stats['soma_vlr_pago_realizado'] or Decimal('0.00')
+    preco_medio_realizado = (soma_vlr_pago_realizado / realizadas_pagas) if realizadas_pagas > 0 else Decimal('0.00')
+
+    total_consultas_valor = consultas_valor_zero + consultas_valor_positivo
+    porcentagem_inadimplentes = (consultas_valor_zero / total_consultas_valor * 100) if total_consultas_valor > 0 else 0
+
+    return {
+        # Taxa de Adesão (últimos 31 dias)
+        'taxa_adesao': number_format(taxa_adesao, decimal_pos=1),
+        'consultas_realizadas': total_realizadas,
+        'consultas_marcadas': total_marcadas,
+
+        # Receitas (últimos 31 dias)
+        'receita_total_recebida': number_format(receita_recebida, decimal_pos=2, force_grouping=True),
+        'receita_acordada_mensal': number_format(kpis['receita_acordada_mensal'], decimal_pos=2, force_grouping=True),
+
+        # Pacientes e Terapeutas
+        'captacao_pacientes_mes': kpis['captacao_mes'],  # Últimos 31 dias
+        'pacientes_ativos': kpis['pacientes_ativos'],    # Total
+        'terapeutas_ativos': kpis['terapeutas_ativos'],  # Total
+
+        # Preço Médio (últimos 31 dias)
+        'preco_medio_realizado': number_format(preco_medio_realizado, decimal_pos=2, force_grouping=True),
+
+        # Novas métricas (últimos 31 dias)
+        'tempo_medio_match': number_format(kpis['tempo_medio_match'], decimal_pos=1),
+        'porcentagem_inadimplentes': number_format(porcentagem_inadimplentes, decimal_pos=1)
+    }
+
+
+def _calcular_porcentagem_pacientes(kpis):
+    total_pacientes_ativos = kpis['pacientes_ativos']
+    pacientes_com_consultas = kpis['pacientes_com_consultas']
+    porcentagem = (pacientes_com_consultas / total_pacientes_ativos * 100) if total_pacientes_ativos > 0 else 0
+    return {
+        'pacientes_com_consultas': pacientes_com_consultas,
+        'total_pacientes_ativos': total_pacientes_ativos,
+        'porcentagem': number_format(porcentagem, decimal_pos=1)
+    }
+
+
+def _calcular_graficos(linhas, hoje):
+    """Séries mensais (6 meses) e diárias (7 dias) a partir da série diária"""
+    meses = {}
+    for linha in linhas:
+        mes = linha['dat_consulta'].replace(day=1)
+        totais = meses.setdefault(mes, {'consultas': 0, 'receita_pix': Decimal('0.00'), 'pagas': 0})
+        totais['consultas'] += linha['total_marcadas'] or 0
+        totais['receita_pix'] += linha['soma_vlr_pago'] or 0
+        totais['pagas'] += linha['consultas_valor_positivo'] or 0
+
+    meses_ordenados = sorted(meses)
+    meses_pix = [mes for mes in meses_ordenados if meses[mes]['pagas'] > 0]
+
+    last_7_days = [hoje - timedelta(days=i) for i in range(6, -1, -1)]
+    por_dia = {linha['dat_consulta']: linha for linha in linhas}
+
+    return {
+        'receita_pix_mensal': {
+            'months': [mes.strftime('%b/%Y') for mes in meses_pix],
+            'values': [float(meses[mes]['receita_pix']) for mes in meses_pix]
+        },
+        'monthly_consultas_data': {
+            'months': [mes.strftime('%b/%Y') for mes in meses_ordenados],
+            'values': [meses[mes]['consultas'] for mes in meses_ordenados]
+        },
+        'daily_consultas_data': {
+            'dates': [str(date) for date in last_7_days],
+            'values': [(por_dia[date]['total_marcadas'] or 0) if date in por_dia else 0 for date in last_7_days]
+        },
+        'daily_valor_data': {
+            'dates': [str(date) for date in last_7_days],
+            'values': [float(por_dia[date]['soma_vlr_consulta'] or 0) if date in por_dia else 0 for date in last_7_days]
+        },
+    }
+
+
+@cached_metric
+@instrumented_metric
+def get_dashboard_metrics():
+    """
+    Motor consolidado do dashboard: todas as métricas e séries dos gráficos
+    em duas queries (série diária + KPIs de cadastro), mais a tabela por terapeuta.
+    """
+    hoje = hoje_metricas()
+    data_limite = hoje - timedelta(days=31)      # Métricas dos últimos 31 dias
+    six_months_ago = hoje - timedelta(days=180)  # Gráficos mensais
+
+    # Partes independentes: podem rodar em paralelo (DASHBOARD_PARALLEL_METRICS)
+    partes, falhas = executar_metricas({
+        'metricas_terapeutas': (get_terapeuta_metrics, (), []),
+        'serie_diaria': (_buscar_serie_diaria, (six_months_ago,), None),
+        'kpis': (_buscar_kpis_cadastro, (data_limite,), None),
+    })
+    if falhas:
+        registrar_erro_metrica(f"parcial: {', '.join(falhas)}")
+    linhas = partes['serie_diaria']
+    kpis = partes['kpis']
+
+    resultado = {
+        'metrics': dict(DEFAULT_CONSULTA_METRICS),
+        'metricas_terapeutas': partes['metricas_terapeutas'],
+        'porcentagem_pacientes_consultas': dict(DEFAULT_PORCENTAGEM_PACIENTES),
+        'receita_pix_mensal': {'months': [], 'values': []},
+        'monthly_consultas_data': {'months': [], 'values': []},
+        'daily_consultas_data': {'dates': [], 'values': []},
+        'daily_valor_data': {'dates': [], 'values': []},
+        # Alguma parte caiu no valor padrão (não é guardado em cache)
+        'parcial': bool(falhas),
+    }
+
     try:
-        # Definir período dos últimos 31 dias
-        hoje = timezone.now().date()
-        data_limite = hoje - timedelta(days=31)
-        
-        terapeutas_stats = models.Terapeuta.objects.select_related('fk_associado').annotate(
-            total_consultas=Count('consulta', filter=Q(consulta__dat_consulta__gte=data_limite)),
-            total_consultasrealizadas=Count('consulta', filter=Q(consulta__is_realizado=True, consulta__dat_consulta__gte=data_limite)),
-            pacientes_ativos=Count('consulta__fk_paciente', distinct=True, filter=Q(
-                consulta__fk_paciente__is_active=True, 
-                consulta__dat_consulta__gte=data_limite
-            )),
-            valor_recebido=Sum('consulta__vlr_pago', filter=Q(consulta__vlr_pago__gt=0, consulta__dat_consulta__gte=data_limite)),
-            receita_acordada=Sum('consulta__vlr_consulta', filter=Q(consulta__dat_consulta__gte=data_limite)),
-        ).filter(
-            is_active=True
-        ).values(
-            'fk_associado__nome',
-            'total_consultas',
-            'total_consultasrealizadas', 
-            'pacientes_ativos',
-            'valor_recebido',
-            'receita_acordada',
-        )
-        
-        metricas_detalhadas = []
-        for stats in terapeutas_stats:
-            total_consultas = stats['total_consultas'] or 0
-            total_realizadas = stats['total_consultasrealizadas'] or 0
-            valor_recebido = stats['valor_recebido'] or Decimal('0.00')
-            receita_acordada = stats['receita_acordada'] or Decimal('0.00')
-            
-            taxa_adesao = (total_realizadas / total_consultas * 100) if total_consultas > 0 else 0
-            diferenca = receita_acordada - valor_recebido
-            status_diferenca = "positivo" if diferenca > 0 else ("negativo" if diferenca < 0 else "igual")
-            
-            if total_consultas > 0:
-                metricas_detalhadas.append({
-                    'nome': stats['fk_associado__nome'],
-                    'taxa_adesao': number_format(taxa_adesao, decimal_pos=1),
-                    'pacientes_ativos': stats['pacientes_ativos'] or 0,
-                    'total_consultas': total_consultas,
-                    'total_consultasrealizadas': total_realizadas,
-                    'valor_recebido': number_format(valor_recebido, decimal_pos=2, force_grouping=True),
-                    'receita_acordada': number_format(receita_acordada, decimal_pos=2, force_grouping=True),
-                    'diferenca': number_format(abs(diferenca), decimal_pos=2, force_grouping=True),
-                    'status_diferenca': status_diferenca,
-                })
-        
-        return metricas_detalhadas
-        
+        if linhas is not None and kpis is not None:
+            resultado['metrics'] = _calcular_consulta_metrics(linhas, kpis, data_limite)
+        if kpis is not None:
+            resultado['porcentagem_pacientes_consultas'] = _calcular_porcentagem_pacientes(kpis)
+        if linhas is not None:
+            resultado.update(_calcular_graficos(linhas, hoje))
     except Exception as e:
-        print(f"Erro ao buscar métricas de terapeutas: {e}")
-        return []
+        logger.error(f"Erro ao buscar métricas do banco: {e}")
+        registrar_erro_metrica(e)
+        resultado['parcial'] = True
 
+    return resultado
 
-def get_receita_pix_mensal():
-    """Receita por Mês (Últimos 6 meses) - MANTIDO PARA GRÁFICOS"""
+
+@cached_metric
+@instrumented_metric
+def get_tempo_match_stats(dias=31):
+    """
+    Estatísticas do tempo entre cadastro do paciente e match (matches criados
+    nos últimos `dias` dias): média, mediana, p90 e histograma por semana.
+    Tudo calculado no banco; o Python só recebe poucas linhas. Erros sobem
+    para quem chama (nada é guardado em cache).
+    """
+    vazio = {'periodo_dias': dias, 'total_matches': 0, 'media': 0.0, 'mediana': 0.0, 'p90': 0, 'histograma': []}
+    data_limite = hoje_metricas() - timedelta(days=dias)
+    inicio_periodo = connection.ops.adapt_datetimefield_value(
+        timezone.make_aware(datetime.combine(data_limite, datetime.min.time()))
+    )
+
+    # Mediana: média das posições centrais; p90: posição ceil(0,9 × total)
+    sql_estatisticas = f"""
+        WITH dias_match AS ({_sql_dias_ate_match()}),
+        ordenados AS (
+            SELECT dias,
+                   ROW_NUMBER() OVER (ORDER BY dias) AS posicao,
+                   COUNT(*) OVER () AS total
+              FROM dias_match
+        )
+        SELECT COUNT(*),
+               AVG(dias),
+               AVG(CASE WHEN posicao IN ((total + 1) / 2, (total + 2) / 2) THEN dias END),
+               MAX(CASE WHEN posicao = (total * 90 + 99) / 100 THEN dias END)
+          FROM ordenados
+    """
+
+    # Histograma por semana (dias negativos entram na semana 0)
+    sql_histograma = f"""
+        WITH dias_match AS ({_sql_dias_ate_match()})
+        SELECT CASE WHEN dias < 0 THEN 0 ELSE dias / 7 END AS semana, COUNT(*)
+          FROM dias_match
+         GROUP BY 1
+         ORDER BY 1
+    """
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql_estatisticas, [inicio_periodo])
+        total, media, mediana, p90 = cursor.fetchone()
+        cursor.execute(sql_histograma, [inicio_periodo])
+        semanas = dict(cursor.fetchall())
+
+    if not total:
+        return vazio
+
+    histograma = [
+        {'semana': semana, 'label': f'{semana * 7}-{semana * 7 + 6} dias', 'total': semanas.get(semana, 0)}
+        for semana in range(0, max(semanas) + 1)
+    ]
+
+    return {
+        'periodo_dias': dias,
+        'total_matches': total,
+        'media': round(float(media or 0), 1),
+        'mediana': round(float(mediana or 0), 1),
+        'p90': int(p90 or 0),
+        'histograma': histograma,
+    }
+
+
+# PERÍODOS ARBITRÁRIOS - respondidos pelos agregados mensal e diário
+GRANULARIDADES = ('day', 'week', 'month')
+COMPARACOES = ('anterior', 'ano_anterior')
+
+
+def _dividir_intervalo(inicio, fim):
+    """
+    Separa [inicio, fim] em meses completos (agregado mensal) e bordas
+    parciais (agregado diário). Retorna ((primeiro_mes, ultimo_mes) ou None, [bordas]).
+    """
+    primeiro_mes = inicio if inicio.day == 1 else fim_do_mes(inicio) + timedelta(days=1)
+    ultimo_dia = fim if fim == fim_do_mes(fim) else fim.replace(day=1) - timedelta(days=1)
+
+    if primeiro_mes > ultimo_dia:
+        return None, [(inicio, fim)]
+
+    bordas = []
+    if inicio < primeiro_mes:
+        bordas.append((inicio, primeiro_mes - timedelta(days=1)))
+    if ultimo_dia < fim:
+        bordas.append((ultimo_dia + timedelta(days=1), fim))
+    return (primeiro_mes, ultimo_dia.replace(day=1)), bordas
+
+
+def _filtro_bordas(bordas):
+    filtro = Q()
+    for inicio, fim in bordas:
+        filtro |= Q(dat_consulta__range=(inicio, fim))
+    return filtro
+
+
+def _somas_medidas():
+    return {campo: Sum(campo) for campo in models.MedidasConsulta.CAMPOS_MEDIDAS}
+
+
+def _acumular(destino, stats):
+    for campo in models.MedidasConsulta.CAMPOS_MEDIDAS:
+        destino[campo] = destino.get(campo, 0) + (stats.get(campo) or 0)
+    return destino
+
+
+def _medidas(stats):
+    """Métricas derivadas (mesmas definições do dashboard) a partir das somas"""
+    marcadas = stats.get('total_marcadas') or 0
+    realizadas = stats.get('total_realizadas') or 0
+    valor_zero = stats.get('consultas_valor_zero') or 0
+    valor_positivo = stats.get('consultas_valor_positivo') or 0
+    realizadas_pagas = stats.get('realizadas_pagas') or 0
+    soma_vlr_pago_realizado = stats.get('soma_vlr_pago_realizado') or 0
+
+    return {
+        'consultas_marcadas': marcadas,
+        'consultas_realizadas': realizadas,
+        'taxa_adesao': round(realizadas / marcadas * 100, 1) if marcadas > 0 else 0.0,
+        'receita_recebida': float(stats.get('soma_vlr_pago') or 0),
+        'receita_acordada': float(stats.get('soma_vlr_consulta') or 0),
+        'porcentagem_inadimplentes': (
+            round(valor_zero / (valor_zero + valor_positivo) * 100, 1) if (valor_zero + valor_positivo) > 0 else 0.0
+        ),
+        'preco_medio_realizado': (
+            round(float(soma_vlr_pago_realizado) / realizadas_pagas, 2) if realizadas_pagas > 0 else 0.0
+        ),
+    }
+
+
+def _totais_periodo(inicio, fim):
+    """Somas do intervalo: no máximo uma query em cada agregado"""
+    meses, bordas = _dividir_intervalo(inicio, fim)
+    totais = {}
+    if meses:
+        _acumular(totais, models.ConsultaMensal.objects.filter(
+            mes__range=meses
+        ).aggregate(**_somas_medidas()))
+    if bordas:
+        _acumular(totais, models.ConsultaDiaria.objects.filter(
+            _filtro_bordas(bordas)
+        ).aggregate(**_somas_medidas()))
+    return totais
+
+
+def _serie_periodo(inicio, fim, granularidade):
+    """Série temporal do intervalo na granularidade pedida (lista ordenada por período)"""
+    diarias = models.ConsultaDiaria.objects.order_by()
+    pontos = {}
+
+    if granularidade == 'month':
+        meses, bordas = _dividir_intervalo(inicio, fim)
+        consultas = []
+        if meses:
+            consultas.append(models.ConsultaMensal.objects.filter(
+                mes__range=meses
+            ).order_by().values(periodo=F('mes')).annotate(**_somas_medidas()))
+        if bordas:
+            consultas.append(diarias.filter(_filtro_bordas(bordas)).annotate(
+                periodo=TruncMonth('dat_consulta')
+            ).values('periodo').annotate(**_somas_medidas()))
+    elif granularidade == 'week':
+        consultas = [diarias.filter(dat_consulta__range=(inicio, fim)).annotate(
+            periodo=TruncWeek('dat_consulta')
+        ).values('periodo').annotate(**_somas_medidas())]
+    else:
+        consultas = [diarias.filter(dat_consulta__range=(inicio, fim)).values(
+            periodo=F('dat_consulta')
+        ).annotate(**_somas_medidas())]
+
+    for linhas in consultas:
+        for linha in linhas:
+            _acumular(pontos.setdefault(linha['periodo'], {}), linha)
+
+    return [
+        {'periodo': periodo.isoformat(), **_medidas(stats)}
+        for periodo, stats in sorted(pontos.items())
+    ]
+
+
+def _variacao(atual, anterior):
+    """Variação percentual de cada medida (None quando o período base é zero)"""
+    return {
+        campo: round((valor - anterior[campo]) / anterior[campo] * 100, 1) if anterior[campo] else None
+        for campo, valor in atual.items()
+    }
+
+
+def _mesmo_periodo_ano_anterior(dia):
     try:
-        today = timezone.now().date()
-        six_months_ago = today - timedelta(days=180)  # Mantido para gráficos
-        
-        # Query para receita PIX mensal
-        monthly_pix = models.Consulta.objects.filter(
-            dat_consulta__gte=six_months_ago,
-            vlr_pago__gt=0
-        ).annotate(
-            month=TruncMonth('dat_consulta')
-        ).values('month').annotate(
-            receita_pix_total=Sum('vlr_pago')
-        ).order_by('month')
-        
-        return {
-            'months': [item['month'].strftime('%b/%Y') for item in monthly_pix],
-            'values': [float(item['receita_pix_total'] or 0) for item in monthly_pix]
+        return dia.replace(year=dia.year - 1)
+    except ValueError:
+        # 29/02 -> 28/02 do ano anterior
+        return dia.replace(year=dia.year - 1, day=28)
+
+
+@cached_metric
+@instrumented_metric
+def get_metricas_periodo(inicio, fim, granularidade='day', comparar=()):
+    """
+    Métricas de consultas para um intervalo arbitrário [inicio, fim].
+
+    Os totais combinam o agregado mensal (meses completos) com o diário
+    (bordas), então o custo não cresce com o tamanho do intervalo. A série
+    usa o diário para 'day'/'week' e o mensal + bordas para 'month'.
+
+    comparar: 'anterior' (mesma duração, imediatamente antes) e/ou
+    'ano_anterior' (mesmas datas um ano antes).
+    """
+    totais = _medidas(_totais_periodo(inicio, fim))
+    resultado = {
+        'inicio': inicio.isoformat(),
+        'fim': fim.isoformat(),
+        'granularidade': granularidade,
+        'totais': totais,
+        'serie': _serie_periodo(inicio, fim, granularidade),
+        'comparacoes': {},
+    }
+
+    intervalos = {}
+    if 'anterior' in comparar:
+        duracao = fim - inicio
+        fim_anterior = inicio - timedelta(days=1)
+        intervalos['anterior'] = (fim_anterior - duracao, fim_anterior)
+    if 'ano_anterior' in comparar:
+        intervalos['ano_anterior'] = (_mesmo_periodo_ano_anterior(inicio), _mesmo_periodo_ano_anterior(fim))
+
+    for nome, (inicio_base, fim_base) in intervalos.items():
+        totais_base = _medidas(_totais_periodo(inicio_base, fim_base))
+        resultado['comparacoes'][nome] = {
+            'inicio': inicio_base.isoformat(),
+            'fim': fim_base.isoformat(),
+            'totais': totais_base,
+            'variacao': _variacao(totais, totais_base),
         }
-    except Exception as e:
-        print(f"Erro ao buscar receita PIX mensal: {e}")
-        return {'months': [], 'values': []}
+
+    return resultado
+
+
+# DRILL-DOWN - cubo mensal por clínica × núcleo × abordagem × modalidade
+@cached_metric
+@instrumented_metric
+def get_metricas_dimensoes(inicio, fim, agrupar=('clinica',), filtros=()):
+    """
+    KPIs de consultas quebrados por dimensões do terapeuta, lidos do cubo
+    ConsultaDimensaoMensal (uma query). O intervalo é arredondado para meses inteiros.
+
+    agrupar: dimensões da quebra (qualquer combinação de DIMENSOES)
+    filtros: pares (dimensão, id) que fatiam o cubo
+    """
+    mes_inicio = inicio.replace(day=1)
+    mes_fim = fim.replace(day=1)
+    cubo = models.ConsultaDimensaoMensal.objects.filter(mes__range=(mes_inicio, mes_fim)).order_by()
+    for nome, valor in filtros:
+        cubo = cubo.filter(**{f'{DIMENSOES[nome][0]}_id': valor})
+
+    if agrupar:
+        colunas = []
+        for nome in agrupar:
+            campo, descricao = DIMENSOES[nome]
+            colunas += [f'{campo}_id', f'{campo}__{descricao}']
+        linhas = list(cubo.values(*colunas).annotate(**_somas_medidas()))
+    else:
+        linhas = [cubo.aggregate(**_somas_medidas())]
+
+    totais = {}
+    resultado = []
+    for linha in linhas:
+        _acumular(totais, linha)
+        item = {}
+        for nome in agrupar:
+            campo, descricao = DIMENSOES[nome]
+            item[nome] = {'id': linha[f'{campo}_id'], 'nome': linha[f'{campo}__{descricao}']}
+        item.update(_medidas(linha))
+        resultado.append(item)
+
+    resultado.sort(key=lambda item: item['consultas_marcadas'], reverse=True)
+
+    return {
+        'inicio': mes_inicio.isoformat(),
+        'fim': fim_do_mes(mes_fim).isoformat(),
+        'agrupar': list(agrupar),
+        'filtros': dict(filtros),
+        'linhas': resultado,
+        'totais': _medidas(totais),
+    }
+
+
+# FUNÇÕES INDIVIDUAIS - recortes do motor consolidado
+def get_receita_pix_mensal():
+    """Receita por Mês (Últimos 6 meses) - MANTIDO PARA GRÁFICOS"""
+    return get_dashboard_metrics()['receita_pix_mensal']
 
 
 def get_porcentagem_pacientes_com_consultas():
-    try:
-        hoje = timezone.now().date()
-        data_limite = hoje - timedelta(days=31)  # Mudado para 31 dias
-
-        # Total de pacientes ativos
-        total_pacientes_ativos = models.Paciente.objects.filter(is_active=True).count()
-        
-        # Pacientes únicos com consultas nos últimos 31 dias
-        pacientes_com_consultas = models.Paciente.objects.filter(
-            consulta__dat_consulta__gte=data_limite,
-            is_active=True
-        ).distinct().count()
-        
-        # Calcular porcentagem
-        porcentagem = (pacientes_com_consultas / total_pacientes_ativos * 100) if total_pacientes_ativos > 0 else 0
-        
-        return {
-            'pacientes_com_consultas': pacientes_com_consultas,
-            'total_pacientes_ativos': total_pacientes_ativos,
-            'porcentagem': number_format(porcentagem, decimal_pos=1)
-        }
-    except Exception as e:
-        print(f"Erro ao calcular porcentagem de pacientes com consultas: {e}")
-        return {'pacientes_com_consultas': 0, 'total_pacientes_ativos': 0, 'porcentagem': '0.0'}
+    return get_dashboard_metrics()['porcentagem_pacientes_consultas']
 
 
 def get_consulta_metrics():
     """Obter métricas principais do dashboard - ÚLTIMOS 31 DIAS"""
-    try:
-        hoje = timezone.now().date()
-        data_limite = hoje - timedelta(days=31)  # Últimos 31 dias
-        primeiro_dia_mes = hoje.replace(day=1)
-
-        # Query principal para métricas de consultas (ÚLTIMOS 31 DIAS)
-        consulta_stats = models.Consulta.objects.filter(
-            dat_consulta__gte=data_limite  # Filtro para últimos 31 dias
-        ).aggregate(
-            # Taxa de Adesão
-            total_consultas_marcadas=Count('pk_consulta'),
-            total_consultas_realizadas=Count('pk_consulta', filter=Q(is_realizado=True)),
-            
-            # Receitas
-            receita_total_recebida=Sum('vlr_pago', filter=Q(vlr_pago__gt=0)),
-            
-            # Porcentagem de inadimplentes
-            consultas_valor_zero=Count('pk_consulta', filter=Q(vlr_pago=0)),
-            consultas_valor_positivo=Count('pk_consulta', filter=Q(vlr_pago__gt=0))
-        )
-        
-        # Query para métricas de pacientes (ÚLTIMOS 31 DIAS para alguns campos)
-        paciente_stats = models.Paciente.objects.aggregate(
-            # Pacientes ativos (total, não apenas 31 dias)
-            pacientes_ativos=Count('pk_paciente', filter=Q(is_active=True)),
-            
-            # Captação dos últimos 31 dias (mudado de mês atual para 31 dias)
-            captacao_mes=Count('pk_paciente', filter=Q(
-                created_at__gte=timezone.make_aware(datetime.combine(data_limite, datetime.min.time()))
-            )),
-            
-            # Receita acordada de pacientes ativos com consultas nos últimos 31 dias
-            receita_acordada_mensal=Sum('vlr_sessao', filter=Q(
-                is_active=True,
-            ))
-        )
-        
-        # Tempo médio entre cadastro e match nos últimos 31 dias
-        try:
-            matches_periodo = models.Match.objects.filter(
-                created_at__gte=timezone.make_aware(datetime.combine(data_limite, datetime.min.time()))
-            ).select_related('fk_paciente')
-            
-            tempo_total_dias = 0
-            count_matches = 0
-            for match in matches_periodo:
-                if match.fk_paciente.created_at and match.dat_consulta:
-                    diferenca = match.dat_consulta - match.fk_paciente.created_at.date()
-                    tempo_total_dias += diferenca.days
-                    count_matches += 1
-            
-            tempo_medio_match = tempo_total_dias / count_matches if count_matches > 0 else 0
-        except Exception:
-            tempo_medio_match = 0
-        
-        # Contagem de terapeutas ativos (total, não apenas 31 dias)
-        total_terapeutas = models.Terapeuta.objects.filter(is_active=True).count()
-        
-        # Cálculos
-        total_marcadas = consulta_stats['total_consultas_marcadas'] or 0
-        total_realizadas = consulta_stats['total_consultas_realizadas'] or 0
-        receita_recebida = consulta_stats['receita_total_recebida'] or Decimal('0.00')
-        consultas_valor_zero = consulta_stats['consultas_valor_zero'] or 0
-        consultas_valor_positivo = consulta_stats['consultas_valor_positivo'] or 0
-        
-        # Taxa de adesão (últimos 31 dias)
-        taxa_adesao = (total_realizadas / total_marcadas * 100) if total_marcadas > 0 else 0
-        
-        # Preço médio realizado (apenas consultas pagas e realizadas nos últimos 31 dias)
-        preco_medio_realizado_query = models.Consulta.objects.filter(
-            dat_consulta__gte=data_limite,  # Últimos 31 dias
-            is_realizado=True,
-            vlr_pago__gt=0
-        ).aggregate(
-            media=Avg('vlr_pago')
-        )
-        preco_medio_realizado = preco_medio_realizado_query['media'] or Decimal('0.00')
-        
-        # Porcentagem de inadimplentes (últimos 31 dias)
-        total_consultas_valor = consultas_valor_zero + consultas_valor_positivo
-        porcentagem_inadimplentes = (consultas_valor_zero / total_consultas_valor * 100) if total_consultas_valor > 0 else 0
-        
-        return {
-            # Taxa de Adesão (últimos 31 dias)
-            'taxa_adesao': number_format(taxa_adesao, decimal_pos=1),
-            'consultas_realizadas': total_realizadas,
-            'consultas_marcadas': total_marcadas,
-            
-            # Receitas (últimos 31 dias)
-            'receita_total_recebida': number_format(receita_recebida, decimal_pos=2, force_grouping=True),
-            'receita_acordada_mensal': number_format(paciente_stats['receita_acordada_mensal'] or 0, decimal_pos=2, force_grouping=True),
-            
-            # Pacientes e Terapeutas
-            'captacao_pacientes_mes': paciente_stats['captacao_mes'] or 0,  # Últimos 31 dias
-            'pacientes_ativos': paciente_stats['pacientes_ativos'] or 0,    # Total
-            'terapeutas_ativos': total_terapeutas,                          # Total
-            
-            # Preço Médio (últimos 31 dias)
-            'preco_medio_realizado': number_format(preco_medio_realizado, decimal_pos=2, force_grouping=True),
-            
-            # Novas métricas (últimos 31 dias)
-            'tempo_medio_match': number_format(tempo_medio_match, decimal_pos=1),
-            'porcentagem_inadimplentes': number_format(porcentagem_inadimplentes, decimal_pos=1)
-        }
-        
-    except Exception as e:
-        print(f"Erro ao buscar métricas do banco: {e}")
-        # Retorna valores padrão em caso de erro
-        return {
-            'taxa_adesao': '0.0',
-            'consultas_realizadas': 0,
-            'consultas_marcadas': 0,
-            'receita_total_recebida': '0,00',
-            'receita_acordada_mensal': '0,00',
-            'captacao_pacientes_mes': 0,
-            'pacientes_ativos': 0,
-            'terapeutas_ativos': 0,
-            'preco_medio_realizado': '0,00',
-            'tempo_medio_match': '0.0',
-            'porcentagem_inadimplentes': '0.0'
-        }
+    return get_dashboard_metrics()['metrics']
 
 
-# FUNÇÕES DOS GRÁFICOS - MANTIDAS SEM ALTERAÇÃO
 def get_monthly_consultas_data():
     """Obter dados mensais de consultas - MANTIDO PARA GRÁFICOS"""
-    try:
-        today = timezone.now().date()
-        six_months_ago = today - timedelta(days=180)
-        
-        # UMA query para todos os meses
-        monthly_stats = models.Consulta.objects.filter(
-            dat_consulta__gte=six_months_ago
-        ).annotate(
-            month=TruncMonth('dat_consulta')
-        ).values('month').annotate(
-            consultas_count=Count('pk_consulta')
-        ).order_by('month')
-        
-        return {
-            'months': [item['month'].strftime('%b/%Y') for item in monthly_stats],
-            'values': [item['consultas_count'] for item in monthly_stats]
-        }
-    except Exception as e:
-        print(f"Erro ao buscar dados mensais de consultas: {e}")
-        return {'months': [], 'values': []}
+    return get_dashboard_metrics()['monthly_consultas_data']
 
 
 def get_daily_consultas_data():
     """Obter dados diários de consultas - MANTIDO PARA GRÁFICOS"""
-    try:
-        today = timezone.now().date()
-        last_7_days = [today - timedelta(days=i) for i in range(6, -1, -1)]
-        
-        # UMA query para todos os dias
-        daily_stats = models.Consulta.objects.filter(
-            dat_consulta__in=last_7_days
-        ).values('dat_consulta').annotate(
-            consultas_count=Count('pk_consulta')
-        ).order_by('dat_consulta')
-        
-        # Criar dicionário para lookup rápido
-        daily_dict = {str(item['dat_consulta']): item['consultas_count'] for item in daily_stats}
-        
-        return {
-            'dates': [str(date) for date in last_7_days],
-            'values': [daily_dict.get(str(date), 0) for date in last_7_days]
-        }
-    except Exception as e:
-        print(f"Erro ao buscar dados diários de consultas: {e}")
-        return {'dates': [], 'values': []}
+    return get_dashboard_metrics()['daily_consultas_data']
 
 
 def get_daily_valor_data():
     """Obter dados diários de valor - MANTIDO PARA GRÁFICOS"""
-    try:
-        today = timezone.now().date()
-        last_7_days = [today - timedelta(days=i) for i in range(6, -1, -1)]
-        
-        # UMA query para todos os dias
-        daily_stats = models.Consulta.objects.filter(
-            dat_consulta__in=last_7_days
-        ).values('dat_consulta').annotate(
-            valor_total=Sum('vlr_consulta')
-        ).order_by('dat_consulta')
-        
-        # Criar dicionário para lookup rápido
-        daily_dict = {str(item['dat_consulta']): float(item['valor_total'] or 0) for item in daily_stats}
-        
-        return {
-            'dates': [str(date) for date in last_7_days],
-            'values': [daily_dict.get(str(date), 0) for date in last_7_days]
-        }
-    except Exception as e:
-        print(f"Erro ao buscar dados diários de valor: {e}")
-        return {'dates': [], 'values': []}
\ No newline at end of file
+    return get_dashboard_metrics()['daily_valor_data']
@@ -0,0 +1,145 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from principais.models import VersaoDados
+import functools
+import hashlib
+import threading
+
+
+CACHE_ALIAS = 'metrics'
+DATA_VERSION_KEY = 'metrics:data_version'
+MODEL_VERSION_KEY = 'metrics:model_version:{}'
+
+# Contadores de acerto/erro do cache (por processo)
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0}
+
+
+def _get_cache():
+    return caches[CACHE_ALIAS]
+
+
+def _get_versions(chaves):
+    """Versão de cada chave (1 quando ainda não houve escrita), em uma query"""
+    versoes = dict(VersaoDados.objects.filter(chave__in=chaves).values_list('chave', 'versao'))
+    return {chave: versoes.get(chave, 1) for chave in chaves}
+
+
+def _bump_version(chave):
+    # UPDATE atômico no banco: vale para todos os processos e sobrevive a reinícios
+    agora = timezone.now()
+    if VersaoDados.objects.filter(chave=chave).update(versao=F('versao') + 1, modificado_em=agora):
+        return
+    try:
+        with transaction.atomic():
+            # Primeira escrita: acima da versão implícita 1
+            VersaoDados.objects.create(chave=chave, versao=2, modificado_em=agora)
+    except IntegrityError:
+        # Criada por outro processo ao mesmo tempo
+        VersaoDados.objects.filter(chave=chave).update(versao=F('versao') + 1, modificado_em=agora)
+
+
+def get_data_version():
+    """Versão atual dos dados do dashboard (incrementada a cada escrita relevante)"""
+    return _get_versions([DATA_VERSION_KEY])[DATA_VERSION_KEY]
+
+
+def get_data_version_info():
+    """(versão, momento da última alteração) dos dados do dashboard, em uma query; momento None se nenhuma"""
+    info = VersaoDados.objects.filter(chave=DATA_VERSION_KEY).values_list('versao', 'modificado_em').first()
+    return info or (1, None)
+
+
+def hoje_metricas():
+    """
+    Data de referência das janelas das métricas (31 dias, 7 dias...): a data
+    UTC. É a mesma nas métricas, nas chaves do cache e no ETag do dashboard.
+    """
+    return timezone.now().date()
+
+
+def bump_data_version():
+    """Invalida todas as métricas em cache incrementando a versão dos dados"""
+    _bump_version(DATA_VERSION_KEY)
+
+
+def get_model_version(label):
+    """Versão dos dados de um modelo ('app.modelo'), incrementada a cada escrita nele"""
+    return get_model_versions([label])[label]
+
+
+def get_model_versions(labels):
+    """Versões de vários modelos em uma query: label -> versão"""
+    versoes = _get_versions([MODEL_VERSION_KEY.format(label) for label in labels])
+    return {label: versoes[MODEL_VERSION_KEY.format(label)] for label in labels}
+
+
+def bump_model_version(label):
+    _bump_version(MODEL_VERSION_KEY.format(label))
+
+
+def _registrar(resultado):
+    with _stats_lock:
+        _stats[resultado] += 1
+
+
+def get_cache_stats():
+    """Contadores de hit/miss do cache de métricas neste processo"""
+    with _stats_lock:
+        hits = _stats['hits']
+        misses = _stats['misses']
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / total * 100, 1) if total > 0 else 0.0,
+        'data_version': get_data_version(),
+        'ttl': settings.METRICS_CACHE_TTL,
+        'backend': settings.METRICS_CACHE_BACKEND,
+    }
+
+
+def reset_cache_stats():
+    with _stats_lock:
+        _stats['hits'] = 0
+        _stats['misses'] = 0
+
+
+def _montar_chave(func, args, kwargs):
+    # A data entra na chave porque as janelas (31 dias, 7 dias...) dependem de "hoje"
+    partes = repr((args, sorted(kwargs.items()))).encode('utf-8')
+    assinatura = hashlib.md5(partes).hexdigest()
+    return (
+        f'metrics:{func.__module__}.{func.__name__}:v{get_data_version()}:'
+        f'{hoje_metricas().isoformat()}:{assinatura}'
+    )
+
+
+def cached_metric(func):
+    """
+    Decorator que guarda o resultado de uma função de métrica sob uma chave
+    versionada. A versão (VersaoDados, no banco) é incrementada pelos signals
+    de escrita, então nenhum processo devolve dados anteriores à última alteração.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        cache = _get_cache()
+        chave = _montar_chave(func, args, kwargs)
+
+        resultado = cache.get(chave)
+        if resultado is not None:
+            _registrar('hits')
+            return resultado
+
+        _registrar('misses')
+        resultado = func(*args, **kwargs)
+        # Resultados parciais (métrica expirada/falhou) não são guardados
+        if not (isinstance(resultado, dict) and resultado.get('parcial')):
+            cache.set(chave, resultado, timeout=settings.METRICS_CACHE_TTL)
+        return resultado
+
+    wrapper.uncached = func
+    return wrapper
@@ -0,0 +1,184 @@
+from collections import deque
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+import functools
+import json
+import logging
+import math
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Limites (ms) das faixas do histograma de tempo total
+FAIXAS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# Últimas N chamadas de cada função instrumentada (por processo)
+_amostras_lock = threading.Lock()
+_amostras = {}
+
+# Chamadas instrumentadas em andamento na thread (a última é a mais interna)
+_em_andamento = threading.local()
+
+
+class _MedidorQueries:
+    """execute_wrapper que soma tempo de banco, número de queries e linhas retornadas"""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_segundos = 0.0
+        self.linhas = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_segundos += time.perf_counter() - inicio
+            self.queries += 1
+            # PostgreSQL informa as linhas do SELECT; SQLite devolve -1
+            linhas = getattr(context['cursor'], 'rowcount', -1)
+            if linhas and linhas > 0:
+                self.linhas += linhas
+
+
+def _registrar(nome, amostra):
+    with _amostras_lock:
+        if nome not in _amostras:
+            _amostras[nome] = deque(maxlen=settings.METRICS_INSTRUMENTATION_WINDOW)
+        _amostras[nome].append(amostra)
+
+    # Uma linha JSON por chamada, para agregação externa dos logs
+    logger.info(json.dumps({'evento': 'metrica', 'funcao': nome, **amostra}))
+
+
+def registrar_erro_metrica(erro):
+    """
+    Marca como erro a chamada instrumentada em andamento nesta thread. Para
+    funções que tratam a falha e devolvem um valor padrão: sem isso a chamada
+    contaria como sucesso na coluna de erros.
+    """
+    chamadas = getattr(_em_andamento, 'chamadas', None)
+    if chamadas:
+        chamadas[-1]['erro'] = erro if isinstance(erro, str) else type(erro).__name__
+
+
+def instrumented_metric(func):
+    """
+    Decorator que mede cada chamada da função de métrica: tempo total, tempo
+    de banco, número de queries e linhas retornadas. As medidas vão para o
+    histograma em memória (get_instrumentation_stats) e para o log. A chamada
+    conta como erro quando a função levanta exceção ou chama registrar_erro_metrica.
+
+    Deve ficar abaixo de @cached_metric: só o cálculo real é medido. Queries
+    feitas em outras threads (métricas paralelas) contam para a própria função.
+    """
+    nome = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not settings.METRICS_INSTRUMENTATION:
+            return func(*args, **kwargs)
+
+        medidor = _MedidorQueries()
+        resultado = None
+        chamada = {'erro': None}
+        if not hasattr(_em_andamento, 'chamadas'):
+            _em_andamento.chamadas = []
+        _em_andamento.chamadas.append(chamada)
+        inicio = time.perf_counter()
+        try:
+            with connection.execute_wrapper(medidor):
+                resultado = func(*args, **kwargs)
+            return resultado
+        except Exception as e:
+            chamada['erro'] = type(e).__name__
+            raise
+        finally:
+            _em_andamento.chamadas.pop()
+            linhas = medidor.linhas
+            if not linhas and isinstance(resultado, list):
+                # Banco sem rowcount no SELECT (SQLite): usa o tamanho da lista devolvida
+                linhas = len(resultado)
+            _registrar(nome, {
+                'wall_ms': round((time.perf_counter() - inicio) * 1000, 2),
+                'db_ms': round(medidor.db_segundos * 1000, 2),
+                'queries': medidor.queries,
+                'linhas': linhas,
+                'erro': chamada['erro'],
+                'em': timezone.now().isoformat(),
+            })
+
+    return wrapper
+
+
+def _percentil(valores_ordenados, percentil):
+    # Nearest-rank
+    indice = max(math.ceil(percentil / 100 * len(valores_ordenados)) - 1, 0)
+    return valores_ordenados[indice]
+
+
+def _resumo(valores):
+    ordenados = sorted(valores)
+    return {
+        'media': round(sum(ordenados) / len(ordenados), 2),
+        'p50': _percentil(ordenados, 50),
+        'p90': _percentil(ordenados, 90),
+        'p99': _percentil(ordenados, 99),
+        'max': ordenados[-1],
+    }
+
+
+def _histograma(valores):
+    faixas = {f'<={limite}': 0 for limite in FAIXAS_MS}
+    faixas[f'>{FAIXAS_MS[-1]}'] = 0
+    for valor in valores:
+        for limite in FAIXAS_MS:
+            if valor <= limite:
+                faixas[f'<={limite}'] += 1
+                break
+        else:
+            faixas[f'>{FAIXAS_MS[-1]}'] += 1
+    return faixas
+
+
+def get_instrumentation_stats():
+    """
+    Resumo por função na janela atual, ordenado pela participação no tempo
+    total (a primeira é a que mais pesa na latência do dashboard). Funções
+    que chamam outras instrumentadas (get_dashboard_metrics) incluem o tempo delas.
+    """
+    with _amostras_lock:
+        copia = {nome: list(amostras) for nome, amostras in _amostras.items()}
+
+    tempo_total = sum(a['wall_ms'] for amostras in copia.values() for a in amostras)
+    funcoes = []
+    for nome, amostras in copia.items():
+        if not amostras:
+            continue
+        wall = [a['wall_ms'] for a in amostras]
+        funcoes.append({
+            'funcao': nome,
+            'chamadas': len(amostras),
+            'erros': sum(1 for a in amostras if a['erro']),
+            'wall_ms': _resumo(wall),
+            'db_ms': _resumo([a['db_ms'] for a in amostras]),
+            'queries_media': round(sum(a['queries'] for a in amostras) / len(amostras), 2),
+            'linhas_media': round(sum(a['linhas'] for a in amostras) / len(amostras), 2),
+            'histograma_wall_ms': _histograma(wall),
+            'participacao': round(sum(wall) / tempo_total * 100, 1) if tempo_total > 0 else 0.0,
+            'ultima_chamada': amostras[-1]['em'],
+        })
+
+    funcoes.sort(key=lambda f: f['participacao'], reverse=True)
+    return {
+        'janela': settings.METRICS_INSTRUMENTATION_WINDOW,
+        'habilitado': settings.METRICS_INSTRUMENTATION,
+        'funcoes': funcoes,
+    }
+
+
+def reset_instrumentation_stats():
+    with _amostras_lock:
+        _amostras.clear()
@@ -0,0 +1,113 @@
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from django.conf import settings
+from django.db import close_old_connections, connection
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Pool compartilhado pelo processo: limita o número de conexões extras ao banco
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.DASHBOARD_METRICS_MAX_WORKERS,
+                thread_name_prefix='dashboard-metrics'
+            )
+        return _executor
+
+
+class _Execucao:
+    """Momento em que a métrica começou a rodar na thread do pool"""
+
+    def __init__(self):
+        self.iniciada = threading.Event()
+        self.inicio = None
+
+
+def _executar_na_thread(funcao, args, timeout, execucao):
+    """
+    Executa a métrica na thread do pool. Cada thread usa a sua própria conexão
+    (o Django mantém conexões por thread); no PostgreSQL a query também recebe
+    statement_timeout para não seguir rodando depois que a métrica expirou.
+    """
+    execucao.inicio = time.monotonic()
+    execucao.iniciada.set()
+    close_old_connections()
+    try:
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET statement_timeout = %s', [int(timeout * 1000)])
+        return funcao(*args)
+    finally:
+        if connection.vendor == 'postgresql' and connection.connection is not None:
+            try:
+                # Volta ao padrão do servidor/usuário (a conexão pode ser reaproveitada)
+                with connection.cursor() as cursor:
+                    cursor.execute('RESET statement_timeout')
+            except Exception:
+                connection.close()
+        close_old_connections()
+
+
+def executar_metricas(tarefas):
+    """
+    Executa as métricas independentes e devolve (resultados, falhas).
+
+    tarefas: dict nome -> (funcao, args, valor_padrao)
+
+    Com DASHBOARD_PARALLEL_METRICS as métricas rodam em paralelo no pool de
+    threads, cada uma com DASHBOARD_METRIC_TIMEOUT segundos contados de quando
+    começa a rodar; a espera na fila do pool (outras requisições ocupando as
+    threads) tem o mesmo limite. A latência total fica próxima da métrica mais
+    lenta. Métricas que falham ou expiram devolvem o valor padrão e aparecem em `falhas`.
+    """
+    resultados = {}
+    falhas = []
+
+    if not settings.DASHBOARD_PARALLEL_METRICS:
+        for nome, (funcao, args, padrao) in tarefas.items():
+            try:
+                resultados[nome] = funcao(*args)
+            except Exception as e:
+                logger.error(f"Erro na métrica '{nome}': {e}")
+                resultados[nome] = padrao
+                falhas.append(nome)
+        return resultados, falhas
+
+    timeout = settings.DASHBOARD_METRIC_TIMEOUT
+    executor = _get_executor()
+    submissao = time.monotonic()
+    execucoes = {nome: _Execucao() for nome in tarefas}
+    futures = {
+        nome: executor.submit(_executar_na_thread, funcao, args, timeout, execucoes[nome])
+        for nome, (funcao, args, _) in tarefas.items()
+    }
+
+    for nome, future in futures.items():
+        padrao = tarefas[nome][2]
+        execucao = execucoes[nome]
+        try:
+            if not execucao.iniciada.wait(max(timeout - (time.monotonic() - submissao), 0)):
+                raise FuturesTimeoutError
+            # O prazo da métrica conta a partir do início da execução, não da fila
+            restante = max(timeout - (time.monotonic() - execucao.inicio), 0)
+            resultados[nome] = future.result(timeout=restante)
+        except FuturesTimeoutError:
+            situacao = 'excedeu' if execucao.iniciada.is_set() else 'esperou na fila do pool mais de'
+            logger.warning(f"Métrica '{nome}' {situacao} {timeout}s; usando valor padrão")
+            future.cancel()
+            resultados[nome] = padrao
+            falhas.append(nome)
+        except Exception as e:
+            logger.error(f"Erro na métrica '{nome}': {e}")
+            resultados[nome] = padrao
+            falhas.append(nome)
+
+    return resultados, falhas
@@ -0,0 +1,133 @@
+import base64
+import binascii
+import json
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginação por cursor (keyset) na ordenação única definida na view em
+    `keyset_ordering` (ex.: ('dat_consulta', 'pk_consulta')). Cada página
+    filtra as linhas depois da última da página anterior e lê só page_size + 1
+    linhas pelo índice da ordenação: sem COUNT(*) nem OFFSET, uma página
+    profunda custa o mesmo que a primeira. O cursor é opaco (base64).
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Cursor inválido'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = tuple(view.keyset_ordering)
+        self.page_size = self.get_page_size(request)
+        valores, anterior = self.decode_cursor(request, queryset.model)
+
+        # Página anterior: lê na ordem inversa a partir do primeiro item da página atual
+        ordering = tuple(_inverter(campo) for campo in self.ordering) if anterior else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if valores is not None:
+            queryset = queryset.filter(_depois(ordering, valores))
+
+        resultados = list(queryset[:self.page_size + 1])
+        tem_mais = len(resultados) > self.page_size
+        resultados = resultados[:self.page_size]
+        if anterior:
+            resultados.reverse()
+
+        veio_de_cursor = valores is not None
+        self.has_next = tem_mais if not anterior else veio_de_cursor
+        self.has_previous = tem_mais if anterior else veio_de_cursor
+        self.primeiro = self._valores(resultados[0]) if resultados else None
+        self.ultimo = self._valores(resultados[-1]) if resultados else None
+        if not resultados and valores is not None:
+            # Página vazia depois de um cursor: volta a partir do mesmo ponto
+            self.primeiro = self.ultimo = valores
+        return resultados
+
+    def get_page_size(self, request):
+        valor = request.query_params.get(self.page_size_query_param)
+        if valor and valor.isdigit() and int(valor) > 0:
+            return min(int(valor), self.max_page_size)
+        return self.page_size
+
+    def _valores(self, objeto):
+        return [getattr(objeto, campo.lstrip('-')) for campo in self.ordering]
+
+    def decode_cursor(self, request, modelo):
+        """(valores da ordenação, é página anterior) do cursor; (None, False) na primeira página"""
+        codificado = request.query_params.get(self.cursor_query_param)
+        if not codificado:
+            return None, False
+        try:
+            dados = json.loads(base64.urlsafe_b64decode(codificado.encode('ascii')))
+            campos = [modelo._meta.get_field(campo.lstrip('-')) for campo in self.ordering]
+            if len(dados['v']) != len(campos):
+                raise ValueError
+            valores = [campo.to_python(valor) for campo, valor in zip(campos, dados['v'])]
+            return valores, bool(dados.get('a'))
+        except (ValueError, KeyError, TypeError, binascii.Error, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, valores, anterior):
+        dados = {'v': valores}
+        if anterior:
+            dados['a'] = 1
+        codificado = base64.urlsafe_b64encode(json.dumps(dados, cls=DjangoJSONEncoder).encode('utf-8')).decode('ascii')
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, codificado)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(self.ultimo, anterior=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.encode_cursor(self.primeiro, anterior=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+def _inverter(campo):
+    return campo[1:] if campo.startswith('-') else f'-{campo}'
+
+
+def _depois(ordering, valores):
+    """
+    Linhas depois de `valores` na ordenação: (a, b) > (x, y) como
+    a > x OR (a = x AND b > y), com o limite a >= x à parte para o índice.
+    """
+    primeiro = ordering[0].lstrip('-')
+    operador = 'lte' if ordering[0].startswith('-') else 'gte'
+    condicao = Q()
+    iguais = {}
+    for campo, valor in zip(ordering, valores):
+        nome = campo.lstrip('-')
+        comparacao = 'lt' if campo.startswith('-') else 'gt'
+        condicao |= Q(**iguais, **{f'{nome}__{comparacao}': valor})
+        iguais[nome] = valor
+    return Q(**{f'{primeiro}__{operador}': valores[0]}) & condicao
@@ -135,6 +135,84 @@ STATICFILES_DIRS = [
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Cache das métricas do dashboard (sem serviço externo). Padrão 'file', compartilhado
+# pelos workers do gunicorn; 'db' compartilha também entre servidores (exige
+# `python manage.py createcachetable`); 'locmem' fica em cada processo. A versão dos
+# dados que invalida o cache fica no banco (VersaoDados), igual para todos os backends.
+METRICS_CACHE_BACKEND = os.getenv('METRICS_CACHE_BACKEND', 'file')  # file, db ou locmem
+METRICS_CACHE_TTL = int(os.getenv('METRICS_CACHE_TTL', '300'))  # segundos
+
+# Execução paralela das métricas do dashboard (pool de threads, uma conexão por thread)
+DASHBOARD_PARALLEL_METRICS = os.getenv('DASHBOARD_PARALLEL_METRICS', 'false').lower() in ('1', 'true', 'yes')
+DASHBOARD_METRICS_MAX_WORKERS = int(os.getenv('DASHBOARD_METRICS_MAX_WORKERS', '3'))
+DASHBOARD_METRIC_TIMEOUT = float(os.getenv('DASHBOARD_METRIC_TIMEOUT', '10'))  # segundos por métrica
+
+# Instrumentação das funções de métricas (tempo, tempo de banco, queries, linhas)
+METRICS_INSTRUMENTATION = os.getenv('METRICS_INSTRUMENTATION', 'true').lower() in ('1', 'true', 'yes')
+METRICS_INSTRUMENTATION_WINDOW = int(os.getenv('METRICS_INSTRUMENTATION_WINDOW', '500'))  # chamadas por função
+
+# Relatórios leem views materializadas quando o banco é PostgreSQL e elas já existem
+# (comando atualizar_views_materializadas); caso contrário usam as queries ao vivo
+RELATORIOS_VIEWS_MATERIALIZADAS = os.getenv('RELATORIOS_VIEWS_MATERIALIZADAS', 'true').lower() in ('1', 'true', 'yes')
+
+# Linhas lidas do banco por bloco nas exportações de relatórios (queryset.iterator)
+RELATORIOS_CHUNK_SIZE = int(os.getenv('RELATORIOS_CHUNK_SIZE', '2000'))
+
+# CSV de consultas, pacientes e avaliações gerado pelo COPY do PostgreSQL (nos demais
+# bancos, ou com False, as linhas são formatadas em Python)
+RELATORIOS_COPY = os.getenv('RELATORIOS_COPY', 'true').lower() in ('1', 'true', 'yes')
+
+# Relatórios em segundo plano (RelatorioJob): pasta dos arquivos gerados, espera do
+# worker com a fila vazia, tempo sem progresso para considerar um job abandonado e
+# por quanto tempo o arquivo de um job concluído fica disponível para download
+RELATORIOS_DIR = os.getenv('RELATORIOS_DIR', str(BASE_DIR / 'relatorios_gerados'))
+RELATORIOS_JOB_INTERVALO = float(os.getenv('RELATORIOS_JOB_INTERVALO', '5'))  # segundos
+RELATORIOS_JOB_TIMEOUT = int(os.getenv('RELATORIOS_JOB_TIMEOUT', '1800'))  # segundos
+RELATORIOS_JOB_RETENCAO = int(os.getenv('RELATORIOS_JOB_RETENCAO', '86400'))  # segundos
+
+# Relatório completo (tipo=completo): queries das planilhas executadas em paralelo,
+# cada uma em uma thread com conexão própria ao banco
+RELATORIOS_COMPLETO_THREADS = int(os.getenv('RELATORIOS_COMPLETO_THREADS', '4'))
+
+# Exportação incremental (API de delta): registros alterados há menos que esta margem
+# ficam para a próxima chamada, pois podem pertencer a transações ainda não confirmadas.
+# updated_at é a hora do save(), não do commit: ao fim de cada ciclo o cursor relê a
+# janela, que deve cobrir a transação de escrita mais longa (ex.: lotes da API)
+RELATORIOS_DELTA_MARGEM = int(os.getenv('RELATORIOS_DELTA_MARGEM', '5'))  # segundos
+RELATORIOS_DELTA_JANELA = int(os.getenv('RELATORIOS_DELTA_JANELA', '900'))  # segundos
+
+# Cache em disco dos arquivos de relatório, chaveado pela versão dos modelos lidos
+# (incrementada pelos signals); os arquivos usados há mais tempo saem primeiro
+RELATORIOS_CACHE = os.getenv('RELATORIOS_CACHE', 'true').lower() in ('1', 'true', 'yes')
+RELATORIOS_CACHE_DIR = os.getenv('RELATORIOS_CACHE_DIR', str(BASE_DIR / '.cache' / 'relatorios'))
+RELATORIOS_CACHE_MAX_MB = int(os.getenv('RELATORIOS_CACHE_MAX_MB', '500'))
+
+# API em lote: máximo de itens por requisição (lista JSON no POST de /consulta/)
+API_LOTE_MAX = int(os.getenv('API_LOTE_MAX', '5000'))
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'metrics': {
+        'file': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('METRICS_CACHE_DIR', str(BASE_DIR / '.cache' / 'metrics')),
+            'TIMEOUT': METRICS_CACHE_TTL,
+        },
+        'db': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'metrics_cache',
+            'TIMEOUT': METRICS_CACHE_TTL,
+        },
+        'locmem': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'metrics',
+            'TIMEOUT': METRICS_CACHE_TTL,
+        },
+    }[METRICS_CACHE_BACKEND],
+}
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
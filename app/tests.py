@@ -0,0 +1,303 @@
+import base64
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from acessorios.models import Abordagem, Captacao, Clinica, Modalidade, Nucleo
+from principais.models import Associado, Consulta, Match, Paciente, Selecao, Terapeuta
+from principais.relatorios import CAMPOS_AVALIACAO_SELECAO
+from .metrics import get_dashboard_metrics
+from .metrics_instrumentation import get_instrumentation_stats, reset_instrumentation_stats
+
+# Queries de uma requisição ao dashboard com o cache de métricas vazio:
+# sessão e usuário (2), versão dos dados nas chaves do cache do motor e da
+# tabela por terapeuta (2) e as queries do motor: série diária, KPIs de
+# cadastro e tabela por terapeuta (3)
+DASHBOARD_QUERIES = 7
+
+
+def criar_terapeutas(quantidade, inicio=0):
+    """
+    Terapeutas com um paciente, consultas nos últimos dias e um match cada.
+    Chamar dentro de captureOnCommitCallbacks(execute=True) para os signals
+    atualizarem os agregados diários.
+    """
+    clinica = Clinica.objects.get_or_create(clinica='Centro')[0]
+    modalidade = Modalidade.objects.get_or_create(modalidade='Online')[0]
+    nucleo = Nucleo.objects.get_or_create(nucleo='Núcleo Teste')[0]
+    abordagem = Abordagem.objects.get_or_create(abordagem='Abordagem Teste')[0]
+    captacao = Captacao.objects.get_or_create(nome='Instagram')[0]
+    decano = Associado.objects.get_or_create(
+        nome='Decano', defaults={'telefone': '31988553344', 'sexo': 'M', 'endereco': 'Rua A'}
+    )[0]
+    hoje = timezone.now().date()
+
+    for i in range(inicio, inicio + quantidade):
+        associado = Associado.objects.create(
+            nome=f'Terapeuta {i}', telefone='31988553344', sexo='F', endereco='Rua A', email=f'terapeuta{i}@teste.com'
+        )
+        terapeuta = Terapeuta.objects.create(
+            fk_associado=associado, fk_decano=decano, fk_abordagem=abordagem, fk_nucleo=nucleo,
+            fk_clinica=clinica, fk_modalidade=modalidade
+        )
+        paciente = Paciente.objects.create(
+            nome=f'Paciente {i}', fk_clinica=clinica, fk_captacao=captacao,
+            fk_modalidade=modalidade, telefone='31988553344', vlr_sessao=Decimal('60.00')
+        )
+        for dias in range(3):
+            Consulta.objects.create(
+                fk_terapeuta=terapeuta, fk_paciente=paciente, vlr_consulta=Decimal('60.00'),
+                vlr_pago=Decimal('60.00') if dias else Decimal('0.00'), is_realizado=True,
+                dat_consulta=hoje - timedelta(days=dias)
+            )
+        Match.objects.create(fk_terapeuta=terapeuta, fk_paciente=paciente, dat_consulta=hoje)
+
+
+@override_settings(DASHBOARD_PARALLEL_METRICS=False)
+class DashboardQueriesTest(TestCase):
+    """
+    Orçamento de queries do dashboard: um N+1 ou um scan extra no motor de
+    métricas muda a contagem e quebra o teste
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_superuser('admin', 'admin@teste.com', 'senha')
+        with cls.captureOnCommitCallbacks(execute=True):
+            criar_terapeutas(3)
+
+    def setUp(self):
+        caches['metrics'].clear()
+        self.client.force_login(self.usuario)
+
+    def test_dashboard_dentro_do_orcamento(self):
+        with self.assertNumQueries(DASHBOARD_QUERIES):
+            response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('error_message', response.context)
+        self.assertEqual(len(response.context['metricas_terapeutas']), 3)
+
+    def test_queries_nao_crescem_com_os_terapeutas(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            criar_terapeutas(5, inicio=3)
+        with self.assertNumQueries(DASHBOARD_QUERIES):
+            response = self.client.get(reverse('dashboard'))
+        self.assertEqual(len(response.context['metricas_terapeutas']), 8)
+
+    def test_cache_evita_o_motor(self):
+        self.client.get(reverse('dashboard'))
+        # Só sessão, usuário e versão dos dados
+        with self.assertNumQueries(3):
+            self.client.get(reverse('dashboard'))
+
+
+class DashboardETagTest(TestCase):
+    """ETag do dashboard: versão dos dados (no banco) e a mesma data das métricas"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_superuser('admin', 'admin@teste.com', 'senha')
+        with cls.captureOnCommitCallbacks(execute=True):
+            criar_terapeutas(1)
+
+    def setUp(self):
+        caches['metrics'].clear()
+        self.client.force_login(self.usuario)
+
+    def test_revalidacao(self):
+        etag = self.client.get(reverse('dashboard-api'))['ETag']
+        response = self.client.get(reverse('dashboard-api'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # Escrita (em qualquer processo) muda a versão guardada no banco
+        with self.captureOnCommitCallbacks(execute=True):
+            criar_terapeutas(1, inicio=1)
+        response = self.client.get(reverse('dashboard-api'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_data_do_etag_e_das_metricas(self):
+        # 22h de 10/03 em São Paulo já é 11/03 em UTC: o ETag acompanha as janelas
+        agora = datetime(2026, 3, 11, 1, 0, tzinfo=dt_timezone.utc)
+        with mock.patch('django.utils.timezone.now', return_value=agora):
+            response = self.client.get(reverse('dashboard-api'))
+        self.assertTrue(response['ETag'].endswith('-2026-03-11"'))
+        self.assertEqual(response.json()['daily_consultas_data']['dates'][-1], '2026-03-11')
+
+
+@override_settings(DASHBOARD_PARALLEL_METRICS=False, METRICS_INSTRUMENTATION=True)
+class InstrumentacaoErrosTest(TestCase):
+    """Falhas tratadas pelas funções de métrica aparecem na coluna de erros"""
+
+    def setUp(self):
+        caches['metrics'].clear()
+        reset_instrumentation_stats()
+
+    def _erros(self):
+        return {f['funcao']: f['erros'] for f in get_instrumentation_stats()['funcoes']}
+
+    def test_metrica_parcial_conta_como_erro(self):
+        with mock.patch('app.metrics._buscar_kpis_cadastro', side_effect=RuntimeError('falhou')):
+            dados = get_dashboard_metrics()
+        self.assertTrue(dados['parcial'])
+        self.assertEqual(self._erros()['get_dashboard_metrics'], 1)
+
+    def test_erro_da_tabela_por_terapeuta(self):
+        with mock.patch('principais.models.ConsultaDiaria.objects.filter', side_effect=RuntimeError('falhou')):
+            dados = get_dashboard_metrics()
+        self.assertEqual(dados['metricas_terapeutas'], [])
+        erros = self._erros()
+        self.assertEqual(erros['get_terapeuta_metrics'], 1)
+        self.assertEqual(erros['get_dashboard_metrics'], 1)
+
+
+class KeysetPaginationTest(TestCase):
+    """
+    Paginação por cursor das listagens: empates na primeira coluna da
+    ordenação, ida e volta pelos links e cursores inválidos
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_superuser('admin', 'admin@teste.com', 'senha')
+        with cls.captureOnCommitCallbacks(execute=True):
+            # 3 consultas por dia: páginas de 2 cortam os empates em dat_consulta
+            criar_terapeutas(3)
+        hoje = timezone.now().date()
+        for i, terapeuta in enumerate(Terapeuta.objects.select_related('fk_associado')):
+            for dias in (0, 0, 1):
+                Selecao.objects.create(
+                    fk_terapeuta_avaliador=terapeuta, fk_associado_avaliado=terapeuta.fk_associado,
+                    dat_avaliacao=hoje - timedelta(days=dias + i % 2),
+                    **{campo: 0 for campo in CAMPOS_AVALIACAO_SELECAO}
+                )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def _paginas(self, url, link):
+        """Páginas (lista de pks) seguindo o link `link` até o fim, e a última resposta"""
+        paginas = []
+        while url:
+            # Cursor que não avança repetiria páginas para sempre
+            self.assertLess(len(paginas), 10)
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            dados = response.json()
+            paginas.append([item[self.pk] for item in dados['results']])
+            url = dados[link]
+        return paginas, dados
+
+    def _ida_e_volta(self, url, esperado):
+        paginas, ultima = self._paginas(url, 'next')
+        self.assertEqual([pk for pagina in paginas for pk in pagina], esperado)
+        self.assertTrue(all(len(pagina) == 2 for pagina in paginas[:-1]))
+        self.assertIsNone(ultima['next'])
+
+        # De volta pelos links previous: as mesmas páginas, na ordem da listagem
+        volta, primeira = self._paginas(ultima['previous'], 'previous')
+        self.assertEqual(volta, paginas[-2::-1])
+        self.assertIsNone(primeira['previous'])
+        self.assertIsNotNone(primeira['next'])
+
+    def test_consultas_com_empates(self):
+        self.pk = 'pk_consulta'
+        esperado = list(Consulta.objects.order_by('dat_consulta', 'pk_consulta').values_list('pk', flat=True))
+        self.assertEqual(len(esperado), 9)
+        url = reverse('consulta-list-create-api') + '?page_size=2'
+        self._ida_e_volta(url, esperado)
+
+        primeira = self.client.get(url).json()
+        self.assertIsNone(primeira['previous'])
+
+    def test_selecoes_em_ordem_decrescente(self):
+        self.pk = 'pk_selecao'
+        esperado = list(Selecao.objects.order_by('-dat_avaliacao', '-pk_selecao').values_list('pk', flat=True))
+        self.assertEqual(len(esperado), 9)
+        self._ida_e_volta(reverse('selecao-list-create-api') + '?page_size=2', esperado)
+
+    def test_cursor_invalido(self):
+        url = reverse('consulta-list-create-api')
+        for cursor in ('nao-e-cursor', _cursor({'v': ['2025-03-10']}), _cursor({'v': ['ontem', 1]}), _cursor([1])):
+            response = self.client.get(url, {'cursor': cursor})
+            self.assertEqual(response.status_code, 404, cursor)
+            self.assertEqual(response.json()['detail'], 'Cursor inválido')
+
+
+class CamposDinamicosTest(TestCase):
+    """?fields=/?expand= nas listagens: campos, erros, anotações e queries"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_superuser('admin', 'admin@teste.com', 'senha')
+        with cls.captureOnCommitCallbacks(execute=True):
+            criar_terapeutas(2)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def _get(self, nome, **parametros):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(nome), parametros)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()['results'], [query['sql'] for query in queries]
+
+    def test_subconjunto_de_campos(self):
+        resultados, queries = self._get('consulta-list-create-api', fields='pk_consulta,dat_consulta,paciente_nome')
+        self.assertEqual(len(resultados), 6)
+        self.assertTrue(all(set(item) == {'pk_consulta', 'dat_consulta', 'paciente_nome'} for item in resultados))
+        # only(): colunas não pedidas ficam fora do SELECT
+        self.assertNotIn('vlr_consulta', queries[-1])
+
+    def test_expand_entra_nos_campos(self):
+        resultados, _ = self._get('consulta-list-create-api', fields='pk_consulta', expand='fk_paciente')
+        self.assertEqual(set(resultados[0]), {'pk_consulta', 'fk_paciente'})
+        self.assertEqual(resultados[0]['fk_paciente']['nome'], Consulta.objects.get(pk=resultados[0]['pk_consulta']).fk_paciente.nome)
+
+    def test_campo_ou_expand_invalido_e_400(self):
+        for parametros, chave in (
+            ({'fields': 'pk_consulta,inexistente'}, 'fields'),
+            ({'expand': 'fk_clinica'}, 'expand'),
+            ({'fields': 'pk_consulta', 'expand': 'dat_consulta'}, 'expand'),
+        ):
+            response = self.client.get(reverse('consulta-list-create-api'), parametros)
+            self.assertEqual(response.status_code, 400, parametros)
+            self.assertIn(chave, response.json())
+
+    def test_anotacoes_so_quando_pedidas(self):
+        resultados, queries = self._get('terapeuta-list-create-api', fields='pk_terapeuta,associado_nome')
+        self.assertNotIn('total_consultas', resultados[0])
+        self.assertNotIn('COUNT(', queries[-1].upper())
+
+        resultados, queries = self._get('terapeuta-list-create-api', fields='pk_terapeuta,total_consultas')
+        self.assertEqual({item['total_consultas'] for item in resultados}, {3})
+        self.assertIn('COUNT(', queries[-1].upper())
+        self.assertNotIn('total_pacientes', queries[-1])
+
+        # Sem ?fields=, todas as anotações
+        resultados, _ = self._get('terapeuta-list-create-api')
+        self.assertEqual((resultados[0]['total_consultas'], resultados[0]['total_pacientes']), (3, 1))
+
+    def test_queries_nao_crescem_com_os_registros(self):
+        parametros = {'fields': 'pk_consulta,terapeuta_nome,fk_terapeuta', 'expand': 'fk_paciente'}
+        _, antes = self._get('consulta-list-create-api', **parametros)
+        with self.captureOnCommitCallbacks(execute=True):
+            criar_terapeutas(3, inicio=2)
+        resultados, depois = self._get('consulta-list-create-api', **parametros)
+        self.assertEqual(len(resultados), 15)
+        self.assertEqual(len(depois), len(antes))
+        self.assertTrue(all(isinstance(item['fk_paciente'], dict) for item in resultados))
+
+
+def _cursor(dados):
+    return base64.urlsafe_b64encode(json.dumps(dados).encode('utf-8')).decode('ascii')
@@ -10,10 +10,16 @@ urlpatterns = [
     path('login/', auth_views.LoginView.as_view(), name='login'),
     path('logout/', auth_views.LogoutView.as_view(), name='logout'),
     path('dashboard/', views.dashboard_view, name='dashboard'),
+    path('dashboard/cache/', views.metrics_cache_stats_view, name='dashboard-cache-stats'),
+    path('dashboard/instrumentacao/', views.metrics_instrumentation_view, name='dashboard-instrumentacao'),
+    path('dashboard/tempo-match/', views.tempo_match_view, name='dashboard-tempo-match'),
+    path('dashboard/periodo/', views.metricas_periodo_view, name='dashboard-periodo'),
+    path('dashboard/dimensoes/', views.metricas_dimensoes_view, name='dashboard-dimensoes'),
     path('', auth_views.LoginView.as_view(), name='login'),
 
 
 #Api
+    path('api/v1/dashboard/', views.dashboard_api_view, name='dashboard-api'),
     path('api/v1/', include('principais.urls')),
     path('api/v1/', include('acessorios.urls')),
 ]
@@ -1,14 +1,16 @@
 from django.shortcuts import render
+from django.http import JsonResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
 from django.contrib.auth.decorators import login_required, permission_required
+from django.contrib.admin.views.decorators import staff_member_required
 from .metrics import (
-    get_consulta_metrics, 
-    get_terapeuta_metrics,
-    get_receita_pix_mensal,
-    get_porcentagem_pacientes_com_consultas,
-    get_monthly_consultas_data,
-    get_daily_consultas_data,
-    get_daily_valor_data
+    get_dashboard_metrics, get_tempo_match_stats, get_metricas_periodo, get_metricas_dimensoes,
+    GRANULARIDADES, COMPARACOES, DIMENSOES,
 )
+from .metrics_cache import get_cache_stats, get_data_version_info, hoje_metricas
+from .metrics_instrumentation import get_instrumentation_stats, reset_instrumentation_stats
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
 import json
 
 
@@ -19,26 +21,20 @@ def dashboard_view(request):
     View principal do dashboard com métricas completas
     """
     try:
-        # Buscar todas as métricas
-        metrics = get_consulta_metrics()
-        metricas_terapeutas = get_terapeuta_metrics()
-        porcentagem_pacientes_consultas = get_porcentagem_pacientes_com_consultas()
-        receita_pix_mensal = get_receita_pix_mensal()
-        monthly_consultas_data = get_monthly_consultas_data()
-        daily_consultas_data = get_daily_consultas_data()
-        daily_valor_data = get_daily_valor_data()
+        # Buscar todas as métricas (motor consolidado)
+        dados = get_dashboard_metrics()
         
         context = {
             # Métricas principais
-            'metrics': metrics,
-            'metricas_terapeutas': metricas_terapeutas,
-            'porcentagem_pacientes_consultas': porcentagem_pacientes_consultas,
+            'metrics': dados['metrics'],
+            'metricas_terapeutas': dados['metricas_terapeutas'],
+            'porcentagem_pacientes_consultas': dados['porcentagem_pacientes_consultas'],
             
             # Dados para gráficos (convertidos para JSON)
-            'receita_pix_mensal': json.dumps(receita_pix_mensal),
-            'monthly_consultas_data': json.dumps(monthly_consultas_data),
-            'daily_consultas_data': json.dumps(daily_consultas_data),
-            'daily_valor_data': json.dumps(daily_valor_data),
+            'receita_pix_mensal': json.dumps(dados['receita_pix_mensal']),
+            'monthly_consultas_data': json.dumps(dados['monthly_consultas_data']),
+            'daily_consultas_data': json.dumps(dados['daily_consultas_data']),
+            'daily_valor_data': json.dumps(dados['daily_valor_data']),
         }
         
         return render(request, 'dashboard.html', context)
@@ -75,4 +71,149 @@ def dashboard_view(request):
             'error_message': 'Erro ao carregar métricas. Verifique o banco de dados.',
         }
         
-        return render(request, 'dashboard.html', context)
\ No newline at end of file
+        return render(request, 'dashboard.html', context)
+
+
+def _versao_dashboard(request):
+    # ETag e Last-Modified saem da mesma leitura de VersaoDados
+    if not hasattr(request, '_versao_dashboard'):
+        request._versao_dashboard = get_data_version_info()
+    return request._versao_dashboard
+
+
+def _dashboard_etag(request):
+    # As janelas das métricas (31 dias, 7 dias...) mudam com a data: ela entra no ETag
+    versao, _ = _versao_dashboard(request)
+    return f'dashboard-v{versao}-{hoje_metricas().isoformat()}'
+
+
+def _dashboard_last_modified(request):
+    # Na virada do dia (mesma data das métricas) as janelas mudam mesmo sem escrita nova
+    _, modificado = _versao_dashboard(request)
+    inicio_do_dia = datetime.combine(hoje_metricas(), time.min, tzinfo=dt_timezone.utc)
+    return max(modificado or inicio_do_dia, inicio_do_dia)
+
+
+@login_required
+@permission_required('auth.view_user', raise_exception=True)
+@condition(etag_func=_dashboard_etag, last_modified_func=_dashboard_last_modified)
+def dashboard_api_view(request):
+    """
+    Métricas e séries dos gráficos do dashboard em JSON.
+
+    O ETag (forte) vem da versão dos dados: se o cliente envia If-None-Match
+    com o valor atual, a resposta é 304 sem calcular nenhuma métrica.
+    """
+    dados = get_dashboard_metrics()
+    response = JsonResponse(dados)
+    if dados.get('parcial'):
+        # Métrica expirou/falhou: o cliente não deve reaproveitar esta resposta
+        patch_cache_control(response, private=True, no_store=True)
+    else:
+        # O navegador guarda a resposta, mas sempre revalida com o ETag
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+@login_required
+@permission_required('auth.view_user', raise_exception=True)
+def metrics_cache_stats_view(request):
+    """
+    Contadores de hit/miss do cache de métricas (por processo)
+    """
+    return JsonResponse(get_cache_stats())
+
+
+@staff_member_required
+def metrics_instrumentation_view(request):
+    """
+    Tempo total, tempo de banco, queries e linhas por função de métrica
+    (janela móvel por processo). POST zera as amostras.
+    """
+    if request.method == 'POST':
+        reset_instrumentation_stats()
+    return JsonResponse(get_instrumentation_stats())
+
+
+@login_required
+@permission_required('auth.view_user', raise_exception=True)
+def tempo_match_view(request):
+    """
+    Estatísticas do tempo entre cadastro e match (média, mediana, p90 e histograma semanal)
+    """
+    try:
+        dias = int(request.GET.get('dias', 31))
+    except ValueError:
+        return JsonResponse({'error': 'Parâmetro "dias" inválido'}, status=400)
+
+    if not 1 <= dias <= 3650:
+        return JsonResponse({'error': 'O parâmetro "dias" deve estar entre 1 e 3650'}, status=400)
+
+    return JsonResponse(get_tempo_match_stats(dias))
+
+
+@login_required
+@permission_required('auth.view_user', raise_exception=True)
+def metricas_periodo_view(request):
+    """
+    Métricas de consultas para um intervalo arbitrário.
+
+    ?inicio=AAAA-MM-DD&fim=AAAA-MM-DD&granularidade=day|week|month&comparar=anterior,ano_anterior
+    """
+    hoje = hoje_metricas()
+    try:
+        fim = date.fromisoformat(request.GET['fim']) if request.GET.get('fim') else hoje
+        inicio = date.fromisoformat(request.GET['inicio']) if request.GET.get('inicio') else fim - timedelta(days=30)
+    except ValueError:
+        return JsonResponse({'error': 'Datas devem estar no formato AAAA-MM-DD'}, status=400)
+
+    if inicio > fim:
+        return JsonResponse({'error': 'A data inicial deve ser anterior à data final'}, status=400)
+
+    granularidade = request.GET.get('granularidade', 'day')
+    if granularidade not in GRANULARIDADES:
+        return JsonResponse({'error': f'Granularidade inválida. Use: {", ".join(GRANULARIDADES)}'}, status=400)
+
+    comparar = tuple(sorted({c.strip() for c in request.GET.get('comparar', '').split(',') if c.strip()}))
+    invalidas = [c for c in comparar if c not in COMPARACOES]
+    if invalidas:
+        return JsonResponse({'error': f'Comparação inválida: {", ".join(invalidas)}. Use: {", ".join(COMPARACOES)}'}, status=400)
+
+    return JsonResponse(get_metricas_periodo(inicio, fim, granularidade, comparar))
+
+
+@login_required
+@permission_required('auth.view_user', raise_exception=True)
+def metricas_dimensoes_view(request):
+    """
+    Drill-down dos KPIs por clínica, núcleo, abordagem e modalidade.
+
+    ?inicio=AAAA-MM-DD&fim=AAAA-MM-DD&agrupar=clinica,nucleo&clinica=1&modalidade=2
+    O intervalo é arredondado para meses inteiros (padrão: mês atual).
+    """
+    hoje = hoje_metricas()
+    try:
+        fim = date.fromisoformat(request.GET['fim']) if request.GET.get('fim') else hoje
+        inicio = date.fromisoformat(request.GET['inicio']) if request.GET.get('inicio') else fim.replace(day=1)
+    except ValueError:
+        return JsonResponse({'error': 'Datas devem estar no formato AAAA-MM-DD'}, status=400)
+
+    if inicio > fim:
+        return JsonResponse({'error': 'A data inicial deve ser anterior à data final'}, status=400)
+
+    agrupar = [nome.strip() for nome in request.GET.get('agrupar', 'clinica').split(',') if nome.strip()]
+    invalidas = [nome for nome in agrupar if nome not in DIMENSOES]
+    if invalidas:
+        return JsonResponse({'error': f'Dimensão inválida: {", ".join(invalidas)}. Use: {", ".join(DIMENSOES)}'}, status=400)
+    # Ordem canônica: a mesma quebra sempre cai na mesma chave de cache
+    agrupar = tuple(nome for nome in DIMENSOES if nome in agrupar)
+
+    filtros = []
+    for nome in DIMENSOES:
+        if request.GET.get(nome):
+            try:
+                filtros.append((nome, int(request.GET[nome])))
+            except ValueError:
+                return JsonResponse({'error': f'Parâmetro "{nome}" inválido'}, status=400)
+
+    return JsonResponse(get_metricas_dimensoes(inicio, fim, agrupar, tuple(filtros)))
@@ -2,6 +2,7 @@ from django.contrib import admin
 from django.utils.html import format_html
 from django.db.models import Count, Max, Q
 from .models import Associado, Paciente, Selecao, Terapeuta, Consulta, Avaliacao, Altadesistencia, Match
+from .signals import registros_alterados_em_lote
 from django.utils import timezone
 from django.utils.safestring import mark_safe
 from django.contrib.admin import SimpleListFilter
@@ -271,7 +272,9 @@ class PacienteAdmin(BaseAdmin):
     # Ações personalizadas
     def ativar_pacientes(self, request, queryset):
         """Ativa pacientes selecionados"""
-        updated = queryset.update(is_active=True)
+        # update() não passa pelo auto_now: updated_at explícito para a exportação incremental
+        updated = queryset.update(is_active=True, updated_at=timezone.now())
+        registros_alterados_em_lote(Paciente)
         self.message_user(
             request, 
             f'{updated} paciente(s) ativado(s) com sucesso.'
@@ -280,7 +283,8 @@ class PacienteAdmin(BaseAdmin):
     
     def desativar_pacientes(self, request, queryset):
         """Desativa pacientes selecionados"""
-        updated = queryset.update(is_active=False)
+        updated = queryset.update(is_active=False, updated_at=timezone.now())
+        registros_alterados_em_lote(Paciente)
         self.message_user(
             request, 
             f'{updated} paciente(s) desativado(s) com sucesso.'
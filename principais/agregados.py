@@ -0,0 +1,440 @@
+from django.db import connection, transaction
+from django.db.models import Sum, Count, Q, F
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+from datetime import date, timedelta
+from decimal import Decimal
+from . import models
+import logging
+
+logger = logging.getLogger('principais')
+
+CAMPOS_MEDIDAS = models.MedidasConsulta.CAMPOS_MEDIDAS
+
+# Dimensões do drill-down: nome -> (campo em ConsultaDimensaoMensal/Terapeuta, campo de descrição)
+DIMENSOES = {
+    'clinica': ('fk_clinica', 'clinica'),
+    'nucleo': ('fk_nucleo', 'nucleo'),
+    'abordagem': ('fk_abordagem', 'abordagem'),
+    'modalidade': ('fk_modalidade', 'modalidade'),
+}
+CAMPOS_DIMENSAO = tuple(campo for campo, _ in DIMENSOES.values())
+
+
+# Agregações aplicadas sobre Consulta para montar cada linha de ConsultaDiaria
+def _agregacoes_consulta():
+    pago = Q(vlr_pago__gt=0)
+    return {
+        'total_marcadas': Count('pk_consulta'),
+        'total_realizadas': Count('pk_consulta', filter=Q(is_realizado=True)),
+        'soma_vlr_consulta': Sum('vlr_consulta'),
+        'soma_vlr_pago': Sum('vlr_pago', filter=pago),
+        'consultas_valor_zero': Count('pk_consulta', filter=Q(vlr_pago=0)),
+        'consultas_valor_positivo': Count('pk_consulta', filter=pago),
+        'realizadas_pagas': Count('pk_consulta', filter=Q(is_realizado=True) & pago),
+        'soma_vlr_pago_realizado': Sum('vlr_pago', filter=Q(is_realizado=True) & pago),
+    }
+
+
+# Agregações que somam linhas de ConsultaDiaria (para ConsultaMensal)
+def _agregacoes_diarias():
+    return {campo: Sum(campo) for campo in CAMPOS_MEDIDAS}
+
+
+def _valores_agregado(stats):
+    """Converte o resultado da agregação nos campos do agregado"""
+    return {
+        'total_marcadas': stats['total_marcadas'] or 0,
+        'total_realizadas': stats['total_realizadas'] or 0,
+        'soma_vlr_consulta': stats['soma_vlr_consulta'] or Decimal('0.00'),
+        'soma_vlr_pago': stats['soma_vlr_pago'] or Decimal('0.00'),
+        'consultas_valor_zero': stats['consultas_valor_zero'] or 0,
+        'consultas_valor_positivo': stats['consultas_valor_positivo'] or 0,
+        'realizadas_pagas': stats['realizadas_pagas'] or 0,
+        'soma_vlr_pago_realizado': stats['soma_vlr_pago_realizado'] or Decimal('0.00'),
+    }
+
+
+def _como_data(valor):
+    # Views salvam dat_consulta direto do POST (string)
+    if isinstance(valor, str):
+        return date.fromisoformat(valor[:10])
+    return valor
+
+
+def fim_do_mes(dia):
+    proximo_mes = (dia.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return proximo_mes - timedelta(days=1)
+
+
+def _chave_mensal(mes, terapeuta_id):
+    return f'agregado_mensal:{terapeuta_id}:{mes:%Y-%m}'
+
+
+def _chave_dimensao(valores):
+    return 'agregado_dimensao:' + ':'.join(str(valor) for valor in valores)
+
+
+def _travar_chaves(chaves):
+    """
+    Trava as chaves dos agregados até o fim da transação (pg_advisory_xact_lock):
+    o recálculo lê as consultas e grava o resultado, e duas transações na mesma
+    chave não podem se intercalar (a gravação mais antiga venceria) nem criar a
+    mesma linha ao mesmo tempo. A chave mensal (mês × terapeuta) cobre os dias
+    do mês; a de dimensões cobre a combinação em todos os meses do cubo.
+    Ordem fixa (pelo hash) para duas transações não travarem uma à outra.
+    """
+    if not chaves or connection.vendor != 'postgresql':
+        # SQLite: o banco já aceita uma transação de escrita por vez
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT pg_advisory_xact_lock(h) FROM ('
+            ' SELECT DISTINCT hashtextextended(c, 0) AS h FROM unnest(%s::text[]) AS c ORDER BY h'
+            ') AS chaves',
+            [sorted(chaves)]
+        )
+
+
+def _travar_terapeuta(mes, terapeuta_id):
+    """Trava as chaves mensal e de dimensões do terapeuta; devolve o terapeuta (None se excluído)"""
+    terapeuta = models.Terapeuta.objects.filter(pk=terapeuta_id).only(*CAMPOS_DIMENSAO).first()
+    chaves = [_chave_mensal(mes, terapeuta_id)]
+    if terapeuta is not None:
+        chaves.append(_chave_dimensao(dimensoes_terapeuta(terapeuta).values()))
+    _travar_chaves(chaves)
+    return terapeuta
+
+
+def _gravar_agregado(modelo, filtros, stats):
+    """Cria/atualiza a linha do agregado ou a remove quando não há consultas"""
+    valores = _valores_agregado(stats)
+
+    if valores['total_marcadas'] == 0:
+        modelo.objects.filter(**filtros).delete()
+        return None
+
+    agregado, _ = modelo.objects.update_or_create(defaults=valores, **filtros)
+    return agregado
+
+
+def atualizar_consulta_mensal(mes, terapeuta_id):
+    """Recalcula a linha (mês × terapeuta) a partir das linhas diárias do mês"""
+    mes = _como_data(mes).replace(day=1)
+    with transaction.atomic():
+        terapeuta = _travar_terapeuta(mes, terapeuta_id)
+        return _recalcular_mensal(mes, terapeuta_id, terapeuta)
+
+
+def _recalcular_mensal(mes, terapeuta_id, terapeuta):
+    stats = models.ConsultaDiaria.objects.filter(
+        fk_terapeuta_id=terapeuta_id,
+        dat_consulta__range=(mes, fim_do_mes(mes))
+    ).aggregate(**_agregacoes_diarias())
+
+    agregado = _gravar_agregado(
+        models.ConsultaMensal,
+        {'fk_terapeuta_id': terapeuta_id, 'mes': mes},
+        stats
+    )
+
+    # Terapeuta excluído: o signal de Terapeuta reconstrói as dimensões dele
+    if terapeuta is not None:
+        atualizar_consulta_dimensao(mes, dimensoes_terapeuta(terapeuta))
+    return agregado
+
+
+def dimensoes_terapeuta(terapeuta):
+    """Chave do cubo (fk_clinica_id, fk_nucleo_id, ...) de um terapeuta"""
+    return {f'{campo}_id': getattr(terapeuta, f'{campo}_id') for campo in CAMPOS_DIMENSAO}
+
+
+def atualizar_consulta_dimensao(mes, dimensoes):
+    """Recalcula a linha (mês × clínica × núcleo × abordagem × modalidade) a partir de ConsultaMensal"""
+    filtros_terapeuta = {f'fk_terapeuta__{campo}': valor for campo, valor in dimensoes.items()}
+    stats = models.ConsultaMensal.objects.filter(
+        mes=mes, **filtros_terapeuta
+    ).aggregate(**_agregacoes_diarias())
+
+    return _gravar_agregado(
+        models.ConsultaDimensaoMensal,
+        {'mes': mes, **dimensoes},
+        stats
+    )
+
+
+def atualizar_consulta_diaria(dat_consulta, terapeuta_id):
+    """
+    Recalcula a linha (dia × terapeuta) a partir das consultas e, em seguida,
+    a linha mensal correspondente. Remove linhas que ficam sem consultas.
+    """
+    dat_consulta = _como_data(dat_consulta)
+    mes = dat_consulta.replace(day=1)
+    with transaction.atomic():
+        # Trava antes de ler as consultas: quem esperar relê depois do commit desta
+        terapeuta = _travar_terapeuta(mes, terapeuta_id)
+        stats = models.Consulta.objects.filter(
+            fk_terapeuta_id=terapeuta_id,
+            dat_consulta=dat_consulta
+        ).aggregate(**_agregacoes_consulta())
+
+        agregado = _gravar_agregado(
+            models.ConsultaDiaria,
+            {'fk_terapeuta_id': terapeuta_id, 'dat_consulta': dat_consulta},
+            stats
+        )
+        _recalcular_mensal(mes, terapeuta_id, terapeuta)
+    return agregado
+
+
+def _inserir_em_lotes(modelo, linhas, construir, batch_size):
+    total = 0
+    lote = []
+    for stats in linhas.iterator(chunk_size=batch_size):
+        lote.append(construir(stats))
+        if len(lote) >= batch_size:
+            modelo.objects.bulk_create(lote)
+            total += len(lote)
+            lote = []
+
+    if lote:
+        modelo.objects.bulk_create(lote)
+        total += len(lote)
+    return total
+
+
+def reconstruir_consultas_dimensoes(inicio=None, fim=None, dimensoes=None, batch_size=1000):
+    """
+    Reconstrói ConsultaDimensaoMensal a partir de ConsultaMensal (opcionalmente
+    só uma combinação de dimensões). Retorna o número de linhas criadas.
+    """
+    mensais = models.ConsultaMensal.objects.all()
+    cubo = models.ConsultaDimensaoMensal.objects.all()
+    if inicio:
+        inicio = inicio.replace(day=1)
+        mensais = mensais.filter(mes__gte=inicio)
+        cubo = cubo.filter(mes__gte=inicio)
+    if fim:
+        mensais = mensais.filter(mes__lte=fim)
+        cubo = cubo.filter(mes__lte=fim)
+    if dimensoes:
+        mensais = mensais.filter(**{f'fk_terapeuta__{campo}': valor for campo, valor in dimensoes.items()})
+        cubo = cubo.filter(**dimensoes)
+
+    colunas = [f'fk_terapeuta__{campo}' for campo in CAMPOS_DIMENSAO]
+    linhas = mensais.order_by().values('mes', *colunas).annotate(**_agregacoes_diarias())
+
+    with transaction.atomic():
+        if dimensoes:
+            _travar_chaves([_chave_dimensao(dimensoes.values())])
+        cubo.delete()
+        total = _inserir_em_lotes(
+            models.ConsultaDimensaoMensal,
+            linhas,
+            lambda stats: models.ConsultaDimensaoMensal(
+                mes=stats['mes'],
+                **{f'{campo}_id': stats[f'fk_terapeuta__{campo}'] for campo in CAMPOS_DIMENSAO},
+                **_valores_agregado(stats)
+            ),
+            batch_size
+        )
+
+    logger.info(f"ConsultaDimensaoMensal reconstruída: {total} linha(s)")
+    return total
+
+
+def reconstruir_consultas_mensais(inicio=None, fim=None, batch_size=1000):
+    """
+    Reconstrói ConsultaMensal a partir de ConsultaDiaria (meses completos que
+    tocam o intervalo) e, depois, o cubo por dimensões desses meses.
+    Retorna o número de linhas criadas.
+    """
+    diarias = models.ConsultaDiaria.objects.all()
+    mensais = models.ConsultaMensal.objects.all()
+    if inicio:
+        inicio = inicio.replace(day=1)
+        diarias = diarias.filter(dat_consulta__gte=inicio)
+        mensais = mensais.filter(mes__gte=inicio)
+    if fim:
+        fim = fim_do_mes(fim)
+        diarias = diarias.filter(dat_consulta__lte=fim)
+        mensais = mensais.filter(mes__lte=fim)
+
+    linhas = diarias.order_by().annotate(
+        mes=TruncMonth('dat_consulta')
+    ).values('mes', 'fk_terapeuta').annotate(**_agregacoes_diarias())
+
+    with transaction.atomic():
+        mensais.delete()
+        total = _inserir_em_lotes(
+            models.ConsultaMensal,
+            linhas,
+            lambda stats: models.ConsultaMensal(
+                mes=stats['mes'],
+                fk_terapeuta_id=stats['fk_terapeuta'],
+                **_valores_agregado(stats)
+            ),
+            batch_size
+        )
+        reconstruir_consultas_dimensoes(inicio=inicio, fim=fim, batch_size=batch_size)
+
+    logger.info(f"ConsultaMensal reconstruída: {total} linha(s)")
+    return total
+
+
+def reconstruir_consultas_diarias(inicio=None, fim=None, batch_size=1000):
+    """
+    Reconstrói ConsultaDiaria a partir de consultas (opcionalmente em um intervalo
+    de datas) e, depois, os meses afetados de ConsultaMensal.
+    Retorna o número de linhas diárias criadas.
+    """
+    consultas = models.Consulta.objects.all()
+    agregados = models.ConsultaDiaria.objects.all()
+    if inicio:
+        consultas = consultas.filter(dat_consulta__gte=inicio)
+        agregados = agregados.filter(dat_consulta__gte=inicio)
+    if fim:
+        consultas = consultas.filter(dat_consulta__lte=fim)
+        agregados = agregados.filter(dat_consulta__lte=fim)
+
+    # UMA query agrupada por dia × terapeuta
+    linhas = consultas.order_by().values('dat_consulta', 'fk_terapeuta').annotate(
+        **_agregacoes_consulta()
+    )
+
+    with transaction.atomic():
+        agregados.delete()
+        total = _inserir_em_lotes(
+            models.ConsultaDiaria,
+            linhas,
+            lambda stats: models.ConsultaDiaria(
+                dat_consulta=stats['dat_consulta'],
+                fk_terapeuta_id=stats['fk_terapeuta'],
+                **_valores_agregado(stats)
+            ),
+            batch_size
+        )
+        reconstruir_consultas_mensais(inicio=inicio, fim=fim, batch_size=batch_size)
+
+    logger.info(f"ConsultaDiaria reconstruída: {total} linha(s)")
+    return total
+
+
+def _gravar_chaves(modelo, campos_chave, valores, existentes):
+    """
+    Grava de uma vez as chaves tocadas de um agregado: `valores` (chave ->
+    medidas recalculadas) e `existentes` (chave -> linha atual). Atualiza as
+    existentes, cria as novas e remove as que ficaram sem consultas.
+    """
+    agora = timezone.now()
+    atualizar, remover = [], []
+    for chave, agregado in existentes.items():
+        if chave not in valores:
+            remover.append(agregado.pk)
+            continue
+        for campo, valor in valores[chave].items():
+            setattr(agregado, campo, valor)
+        agregado.updated_at = agora
+        atualizar.append(agregado)
+
+    criar = [
+        modelo(**dict(zip(campos_chave, chave)), **medidas)
+        for chave, medidas in valores.items() if chave not in existentes
+    ]
+    if remover:
+        modelo.objects.filter(pk__in=remover).delete()
+    modelo.objects.bulk_update(atualizar, [*CAMPOS_MEDIDAS, 'updated_at'], batch_size=1000)
+    modelo.objects.bulk_create(criar, batch_size=1000)
+
+
+def _agrupar_chaves(linhas, campos_chave, chaves):
+    """Medidas das linhas agrupadas cujas chaves estão em `chaves`"""
+    valores = {}
+    for stats in linhas:
+        chave = tuple(stats[campo] for campo in campos_chave)
+        if chave in chaves:
+            valores[chave] = _valores_agregado(stats)
+    return valores
+
+
+def _existentes(queryset, campos_chave, chaves):
+    existentes = {}
+    for agregado in queryset:
+        chave = tuple(getattr(agregado, campo) for campo in campos_chave)
+        if chave in chaves:
+            existentes[chave] = agregado
+    return existentes
+
+
+def atualizar_consultas_em_lote(chaves):
+    """
+    Atualiza os agregados depois de um lote de consultas (bulk_create/bulk_update):
+    recalcula só as chaves (dia, terapeuta) tocadas, e os meses e combinações de
+    dimensões delas, com uma query agrupada por nível. O número de queries não
+    depende do número de chaves nem da distância entre as datas.
+    """
+    chaves = {(_como_data(dat_consulta), terapeuta_id) for dat_consulta, terapeuta_id in chaves}
+    if not chaves:
+        return
+    datas = {dat_consulta for dat_consulta, _ in chaves}
+    terapeutas = {terapeuta_id for _, terapeuta_id in chaves}
+    chaves_mensais = {(dat_consulta.replace(day=1), terapeuta_id) for dat_consulta, terapeuta_id in chaves}
+    meses = {mes for mes, _ in chaves_mensais}
+
+    with transaction.atomic():
+        dimensoes = {
+            terapeuta.pk: tuple(dimensoes_terapeuta(terapeuta).values())
+            for terapeuta in models.Terapeuta.objects.filter(pk__in=terapeutas).only(*CAMPOS_DIMENSAO)
+        }
+        _travar_chaves(
+            [_chave_mensal(mes, terapeuta_id) for mes, terapeuta_id in chaves_mensais]
+            + [_chave_dimensao(valores) for valores in dimensoes.values()]
+        )
+
+        # Diário: consultas das datas × terapeutas do lote, filtradas para as chaves tocadas
+        campos = ('dat_consulta', 'fk_terapeuta_id')
+        linhas = models.Consulta.objects.filter(
+            dat_consulta__in=datas, fk_terapeuta_id__in=terapeutas
+        ).order_by().values(*campos).annotate(**_agregacoes_consulta())
+        _gravar_chaves(
+            models.ConsultaDiaria,
+            campos,
+            _agrupar_chaves(linhas, campos, chaves),
+            _existentes(
+                models.ConsultaDiaria.objects.filter(dat_consulta__in=datas, fk_terapeuta_id__in=terapeutas),
+                campos,
+                chaves
+            )
+        )
+
+        # Mensal: linhas diárias dos meses × terapeutas tocados
+        campos = ('mes', 'fk_terapeuta_id')
+        linhas = models.ConsultaDiaria.objects.annotate(mes=TruncMonth('dat_consulta')).filter(
+            mes__in=meses, fk_terapeuta_id__in=terapeutas
+        ).order_by().values(*campos).annotate(**_agregacoes_diarias())
+        _gravar_chaves(
+            models.ConsultaMensal,
+            campos,
+            _agrupar_chaves(linhas, campos, chaves_mensais),
+            _existentes(
+                models.ConsultaMensal.objects.filter(mes__in=meses, fk_terapeuta_id__in=terapeutas),
+                campos,
+                chaves_mensais
+            )
+        )
+
+        # Cubo: combinações de dimensões (atuais) dos terapeutas tocados, nos meses tocados
+        chaves_cubo = {
+            (mes, *dimensoes[terapeuta_id])
+            for mes, terapeuta_id in chaves_mensais if terapeuta_id in dimensoes
+        }
+        campos = ('mes', *(f'{campo}_id' for campo in CAMPOS_DIMENSAO))
+        linhas = models.ConsultaMensal.objects.filter(mes__in=meses).order_by().annotate(
+            **{f'{campo}_id': F(f'fk_terapeuta__{campo}') for campo in CAMPOS_DIMENSAO}
+        ).values(*campos).annotate(**_agregacoes_diarias())
+        _gravar_chaves(
+            models.ConsultaDimensaoMensal,
+            campos,
+            _agrupar_chaves(linhas, campos, chaves_cubo),
+            _existentes(models.ConsultaDimensaoMensal.objects.filter(mes__in=meses), campos, chaves_cubo)
+        )
@@ -0,0 +1,133 @@
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from . import models
+from .filtros_relatorio import ler_data_hora
+from .relatorios import MODELOS_RELATORIO
+import base64
+import binascii
+import json
+
+# Modelos com exportação incremental: todos têm updated_at e as exclusões são registradas
+MODELOS_DELTA = MODELOS_RELATORIO
+LIMITE_PADRAO = 1000
+LIMITE_MAXIMO = 10000
+
+
+# Cursor: posição (data/hora, id) em cada fluxo, alterações e exclusões, e o horizonte
+# da primeira página do ciclo (enquanto tem_mais). id None significa "desde esta
+# data/hora, inclusive"; o cliente recebe o cursor codificado.
+def codificar_cursor(alterados, excluidos, horizonte=None):
+    dados = {
+        'a': [alterados[0].isoformat(), alterados[1]],
+        'e': [excluidos[0].isoformat(), excluidos[1]],
+        'h': horizonte.isoformat() if horizonte else None,
+    }
+    return base64.urlsafe_b64encode(json.dumps(dados).encode('utf-8')).decode('ascii')
+
+
+def ler_cursor(valor):
+    try:
+        dados = json.loads(base64.urlsafe_b64decode(valor.encode('ascii')))
+        horizonte = dados.get('h')
+        return (
+            (datetime.fromisoformat(dados['a'][0]), dados['a'][1]),
+            (datetime.fromisoformat(dados['e'][0]), dados['e'][1]),
+            datetime.fromisoformat(horizonte) if horizonte else None,
+        )
+    except (ValueError, KeyError, TypeError, IndexError, binascii.Error):
+        raise ValueError('Cursor inválido')
+
+
+def ler_parametros(parametros):
+    """
+    (posição das alterações, posição das exclusões, horizonte, limite) a partir
+    de cursor (chamadas seguintes) ou desde (primeira chamada). Levanta ValueError.
+    """
+    if parametros.get('cursor'):
+        alterados, excluidos, horizonte = ler_cursor(parametros['cursor'])
+    elif parametros.get('desde'):
+        desde = ler_data_hora(parametros['desde'])
+        alterados = excluidos = (desde, None)
+        horizonte = None
+    else:
+        raise ValueError('Informe desde (primeira sincronização) ou cursor')
+
+    limite = parametros.get('limite') or str(LIMITE_PADRAO)
+    if not limite.isdigit() or not 1 <= int(limite) <= LIMITE_MAXIMO:
+        raise ValueError(f'limite deve estar entre 1 e {LIMITE_MAXIMO}')
+    return alterados, excluidos, horizonte, int(limite)
+
+
+def _depois(campo_data, campo_id, posicao):
+    data_hora, ultimo_id = posicao
+    if ultimo_id is None:
+        return Q(**{f'{campo_data}__gte': data_hora})
+    return Q(**{f'{campo_data}__gt': data_hora}) | Q(**{campo_data: data_hora, f'{campo_id}__gt': ultimo_id})
+
+
+def _pagina(queryset, campo_data, campo_id, posicao, limite, ate):
+    """
+    Linhas seguintes à posição em ordem (data/hora, id) e a nova posição:
+    a da última linha se a página encheu, senão `ate` (nada ficou para trás).
+    """
+    linhas = list(queryset.filter(_depois(campo_data, campo_id, posicao)).order_by(campo_data, campo_id)[:limite + 1])
+    tem_mais = len(linhas) > limite
+    linhas = linhas[:limite]
+    if tem_mais:
+        posicao = (linhas[-1][campo_data], linhas[-1][campo_id])
+    else:
+        posicao = (ate, None)
+    return linhas, posicao, tem_mais
+
+
+def pagina_delta(tipo, alterados, excluidos, limite, horizonte=None):
+    """
+    Registros criados/alterados e exclusões (tombstones) do modelo do relatório
+    desde as posições informadas, com o cursor para a próxima chamada.
+
+    updated_at é gravado no save(), não no commit: uma transação longa pode
+    confirmar linhas com data anterior à posição já entregue. Por isso, ao fim
+    de cada ciclo (tem_mais falso) o cursor volta RELATORIOS_DELTA_JANELA
+    segundos antes do horizonte da primeira página do ciclo, e a próxima
+    chamada relê essa janela. Linhas já entregues podem voltar: o cliente
+    aplica pelo id (upsert/exclusão), então a repetição não altera o resultado.
+    """
+    modelo = MODELOS_DELTA[tipo]
+    campos = [campo.attname for campo in modelo._meta.concrete_fields]
+    campo_id = modelo._meta.pk.attname
+    # Margem para transações ainda abertas: o que for mais recente sai na próxima chamada
+    ate = timezone.now() - timedelta(seconds=settings.RELATORIOS_DELTA_MARGEM)
+    horizonte = horizonte or ate
+
+    linhas, alterados, mais_alterados = _pagina(
+        modelo.objects.filter(updated_at__lt=ate).values(*campos),
+        'updated_at', campo_id, alterados, limite, ate
+    )
+    exclusoes, excluidos, mais_excluidos = _pagina(
+        models.RegistroExclusao.objects.filter(modelo=modelo._meta.label_lower, excluido_em__lt=ate).values(
+            'pk_registro_exclusao', 'registro_id', 'excluido_em'
+        ),
+        'excluido_em', 'pk_registro_exclusao', excluidos, limite, ate
+    )
+    tem_mais = mais_alterados or mais_excluidos
+    if tem_mais:
+        cursor = codificar_cursor(alterados, excluidos, horizonte)
+    else:
+        # Transações confirmadas depois do início do ciclo entram na releitura da janela
+        retomada = (horizonte - timedelta(seconds=settings.RELATORIOS_DELTA_JANELA), None)
+        cursor = codificar_cursor(retomada, retomada)
+    return {
+        'tipo': tipo,
+        'alterados': linhas,
+        'excluidos': [
+            {'id': exclusao['registro_id'], 'excluido_em': exclusao['excluido_em']} for exclusao in exclusoes
+        ],
+        'cursor': cursor,
+        'tem_mais': tem_mais,
+    }
+
+
+def registrar_exclusao(instance):
+    models.RegistroExclusao.objects.create(modelo=instance._meta.label_lower, registro_id=instance.pk)
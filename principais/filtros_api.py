@@ -0,0 +1,92 @@
+from datetime import date
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from .filtros_relatorio import VERDADEIRO, FALSO
+
+
+def _pago(pago):
+    # Mesmo critério das métricas: pago = vlr_pago > 0 (sem valor conta como não pago)
+    q = Q(vlr_pago__gt=0)
+    return q if pago else ~q
+
+
+def _inadimplente(inadimplente):
+    # Mesmo critério de porcentagem_inadimplentes: vlr_pago = 0
+    q = Q(vlr_pago=0)
+    return q if inadimplente else ~q
+
+
+# Filtros via query params das listagens da API: parâmetro -> (tipo do valor, lookup).
+# Lookups chamáveis recebem o valor já convertido e devolvem o Q.
+# Índices que atendem cada filtro: ver Meta.indexes dos modelos e o comando explicar_filtros_api.
+FILTROS_CONSULTA = {
+    'terapeuta': ('id', 'fk_terapeuta'),
+    'paciente': ('id', 'fk_paciente'),
+    'data_inicio': ('data', 'dat_consulta__gte'),
+    'data_fim': ('data', 'dat_consulta__lte'),
+    'is_realizado': ('booleano', 'is_realizado'),
+    'pago': ('booleano', _pago),
+    'inadimplente': ('booleano', _inadimplente),
+}
+FILTROS_PACIENTE = {
+    'is_active': ('booleano', 'is_active'),
+    'clinica': ('id', 'fk_clinica'),
+    'captacao': ('id', 'fk_captacao'),
+    'modalidade': ('id', 'fk_modalidade'),
+}
+FILTROS_TERAPEUTA = {
+    'is_active': ('booleano', 'is_active'),
+    'decano': ('id', 'fk_decano'),
+    'nucleo': ('id', 'fk_nucleo'),
+}
+FILTROS_SELECAO = {
+    'avaliador': ('id', 'fk_terapeuta_avaliador'),
+    'avaliado': ('id', 'fk_associado_avaliado'),
+    'data_inicio': ('data', 'dat_avaliacao__gte'),
+    'data_fim': ('data', 'dat_avaliacao__lte'),
+}
+
+
+def ler_valor(tipo, nome, valor):
+    """Converte o valor do parâmetro conforme o tipo. Levanta ValueError"""
+    if tipo == 'id':
+        if not valor.isdigit():
+            raise ValueError(f'Valor inválido em {nome}: informe o ID')
+        return int(valor)
+    if tipo == 'data':
+        try:
+            return date.fromisoformat(valor)
+        except ValueError:
+            raise ValueError(f'Data inválida em {nome}: use AAAA-MM-DD')
+    if valor.lower() in VERDADEIRO:
+        return True
+    if valor.lower() in FALSO:
+        return False
+    raise ValueError(f'Valor inválido em {nome}: use true ou false')
+
+
+def q_filtros_api(filtros, parametros):
+    """
+    Q com os filtros de `filtros` presentes em `parametros` (vazios são
+    ignorados). Valor inválido levanta ValidationError (400) com a mensagem
+    no parâmetro.
+    """
+    q = Q()
+    for nome, (tipo, lookup) in filtros.items():
+        valor = parametros.get(nome)
+        if not valor:
+            continue
+        try:
+            valor = ler_valor(tipo, nome, valor)
+        except ValueError as e:
+            raise ValidationError({nome: str(e)})
+        q &= lookup(valor) if callable(lookup) else Q(**{lookup: valor})
+    return q
+
+
+class FiltrosAPIMixin:
+    """Aplica ao queryset da listagem os filtros declarados em `filtros_api`"""
+    filtros_api = {}
+
+    def get_queryset(self):
+        return super().get_queryset().filter(q_filtros_api(self.filtros_api, self.request.query_params))
@@ -0,0 +1,202 @@
+from datetime import date, datetime, time, timedelta
+from django.db.models import Q
+from django.utils import timezone
+from . import models
+
+VERDADEIRO = ('1', 'true', 'sim')
+FALSO = ('0', 'false', 'nao', 'não')
+
+
+def _pacientes_do_terapeuta(prefixo, terapeuta):
+    # Subquery em vez de join: o join com consultas repetiria o paciente por consulta
+    consultas = models.Consulta.objects.filter(fk_terapeuta=terapeuta).values('fk_paciente')
+    return Q(**{f'{prefixo}pk_paciente__in': consultas})
+
+
+# Campo de cada filtro em cada relatório. 'data' é um DateField; 'data_hora' um
+# DateTimeField (o intervalo vira limites de início/fim do dia, sem __date, para usar o índice).
+# 'desde' (modo delta) é o updated_at dos relatórios lidos direto de uma tabela.
+# Valores chamáveis recebem (prefixo, valor) e devolvem o Q.
+CAMPOS_FILTRO_CONSULTA = {
+    'data': 'dat_consulta',
+    'clinica': 'fk_terapeuta__fk_clinica',
+    'terapeuta': 'fk_terapeuta',
+    'modalidade': 'fk_terapeuta__fk_modalidade',
+    'paciente_ativo': 'fk_paciente__is_active',
+}
+CAMPOS_FILTRO_PACIENTE = {
+    'data_hora': 'created_at',
+    'clinica': 'fk_clinica',
+    'terapeuta': _pacientes_do_terapeuta,
+    'modalidade': 'fk_modalidade',
+    'paciente_ativo': 'is_active',
+}
+CAMPOS_FILTRO_TERAPEUTA = {
+    'data_hora': 'created_at',
+    'clinica': 'fk_clinica',
+    'terapeuta': 'pk_terapeuta',
+    'modalidade': 'fk_modalidade',
+}
+DELTA = {'desde': 'updated_at'}
+CAMPOS_FILTRO = {
+    'associado': {'data_hora': 'created_at', **DELTA},
+    'paciente': {**CAMPOS_FILTRO_PACIENTE, **DELTA},
+    'terapeuta': {**CAMPOS_FILTRO_TERAPEUTA, **DELTA},
+    'avaliacao': {**CAMPOS_FILTRO_CONSULTA, **DELTA},
+    'consulta': {**CAMPOS_FILTRO_CONSULTA, **DELTA},
+    # Totais de consultas (e contagens de pacientes/terapeutas ativos pelos mesmos filtros)
+    'dashboard': CAMPOS_FILTRO_CONSULTA,
+    # Terapeutas por clínica/modalidade; período e status do paciente limitam as consultas somadas
+    'metricas_terapeuta': CAMPOS_FILTRO_CONSULTA,
+    'altadesistencia': {**CAMPOS_FILTRO_CONSULTA, 'data': 'dat_sessao', **DELTA},
+    'selecao': {
+        'data': 'dat_avaliacao',
+        'clinica': 'fk_terapeuta_avaliador__fk_clinica',
+        'terapeuta': 'fk_terapeuta_avaliador',
+        'modalidade': 'fk_terapeuta_avaliador__fk_modalidade',
+        **DELTA,
+    },
+    # Pacientes contados em cada captação
+    'captacao': CAMPOS_FILTRO_PACIENTE,
+}
+
+# Relatórios reunidos no tipo 'completo' (uma planilha/arquivo por relatório, nesta ordem)
+RELATORIO_COMPLETO = (
+    'associado', 'paciente', 'terapeuta', 'consulta', 'avaliacao', 'altadesistencia', 'selecao', 'captacao'
+)
+
+
+def _aceita(campos, nome):
+    if nome in ('inicio', 'fim'):
+        return 'data' in campos or 'data_hora' in campos
+    return nome in campos
+
+
+def _campos_do_tipo(tipo):
+    """Especificações que o filtro precisa atender: no completo, as de todas as planilhas"""
+    if tipo == 'completo':
+        return [CAMPOS_FILTRO[membro] for membro in RELATORIO_COMPLETO]
+    return [CAMPOS_FILTRO[tipo]]
+
+
+def ler_data_hora(valor, nome='desde'):
+    """Data ou data/hora ISO 8601 (sem fuso: horário local). Levanta ValueError"""
+    try:
+        data_hora = datetime.fromisoformat(valor)
+    except ValueError:
+        raise ValueError(f'Data inválida em {nome}: use AAAA-MM-DD ou AAAA-MM-DDTHH:MM:SS')
+    if timezone.is_naive(data_hora):
+        data_hora = timezone.make_aware(data_hora)
+    return data_hora
+
+
+def ler_filtros(tipo, parametros):
+    """
+    Valida os filtros recebidos (querystring/POST) para o relatório e os
+    devolve normalizados e serializáveis em JSON: datas AAAA-MM-DD, ids
+    inteiros, paciente_ativo booleano e desde em ISO 8601 com fuso.
+    Parâmetros vazios são ignorados. Levanta ValueError com a mensagem
+    para o usuário.
+    """
+    filtros = {}
+    for nome in ('inicio', 'fim'):
+        valor = parametros.get(nome)
+        if valor:
+            try:
+                filtros[nome] = date.fromisoformat(valor).isoformat()
+            except ValueError:
+                raise ValueError(f'Data inválida em {nome}: use AAAA-MM-DD')
+
+    if parametros.get('desde'):
+        # Modo delta: só registros criados/alterados a partir deste instante
+        filtros['desde'] = ler_data_hora(parametros['desde']).isoformat()
+
+    for nome in ('clinica', 'terapeuta', 'modalidade'):
+        valor = parametros.get(nome)
+        if valor:
+            if not valor.isdigit():
+                raise ValueError(f'Valor inválido em {nome}: informe o ID')
+            filtros[nome] = int(valor)
+
+    valor = parametros.get('paciente_ativo')
+    if valor:
+        if valor.lower() in VERDADEIRO:
+            filtros['paciente_ativo'] = True
+        elif valor.lower() in FALSO:
+            filtros['paciente_ativo'] = False
+        else:
+            raise ValueError('Valor inválido em paciente_ativo: use true ou false')
+
+    if 'inicio' in filtros and 'fim' in filtros and filtros['inicio'] > filtros['fim']:
+        raise ValueError('A data inicial deve ser anterior à data final.')
+
+    especificacoes = _campos_do_tipo(tipo)
+    nao_aplicaveis = [nome for nome in filtros if not all(_aceita(campos, nome) for campos in especificacoes)]
+    if nao_aplicaveis:
+        raise ValueError(f'Filtro(s) não aplicável(is) ao relatório {tipo}: {", ".join(nao_aplicaveis)}')
+    return filtros
+
+
+def _inicio_do_dia(dia):
+    return timezone.make_aware(datetime.combine(dia, time.min))
+
+
+def q_filtros(campos, filtros, prefixo=''):
+    """Q com os filtros informados que existem em `campos` (prefixo para usar via relação)"""
+    q = Q()
+    inicio, fim = filtros.get('inicio'), filtros.get('fim')
+    if 'data' in campos:
+        campo = f'{prefixo}{campos["data"]}'
+        if inicio:
+            q &= Q(**{f'{campo}__gte': inicio})
+        if fim:
+            q &= Q(**{f'{campo}__lte': fim})
+    elif 'data_hora' in campos:
+        campo = f'{prefixo}{campos["data_hora"]}'
+        if inicio:
+            q &= Q(**{f'{campo}__gte': _inicio_do_dia(date.fromisoformat(inicio))})
+        if fim:
+            q &= Q(**{f'{campo}__lt': _inicio_do_dia(date.fromisoformat(fim) + timedelta(days=1))})
+
+    if 'desde' in filtros and 'desde' in campos:
+        q &= Q(**{f'{prefixo}{campos["desde"]}__gte': datetime.fromisoformat(filtros['desde'])})
+
+    for nome in ('clinica', 'terapeuta', 'modalidade', 'paciente_ativo'):
+        if nome in filtros and nome in campos:
+            campo = campos[nome]
+            if callable(campo):
+                q &= campo(prefixo, filtros[nome])
+            else:
+                q &= Q(**{f'{prefixo}{campo}': filtros[nome]})
+    return q
+
+
+def filtro_relatorio(tipo, filtros):
+    """Q aplicado ao modelo principal do relatório"""
+    return q_filtros(CAMPOS_FILTRO[tipo], filtros)
+
+
+def filtro_pacientes_captacao(filtros):
+    """Q a partir de Captacao limitando os pacientes contados"""
+    return q_filtros(CAMPOS_FILTRO_PACIENTE, filtros, prefixo='paciente__')
+
+
+def filtros_dashboard(filtros):
+    """
+    (consultas, pacientes, terapeutas): o período vale para as consultas; as
+    contagens de ativos usam só clínica/terapeuta/modalidade/status do paciente.
+    """
+    sem_periodo = {nome: valor for nome, valor in filtros.items() if nome not in ('inicio', 'fim')}
+    return (
+        filtro_relatorio('dashboard', filtros),
+        q_filtros(CAMPOS_FILTRO_PACIENTE, sem_periodo),
+        q_filtros(CAMPOS_FILTRO_TERAPEUTA, sem_periodo),
+    )
+
+
+def filtros_metricas_terapeuta(filtros):
+    """(terapeutas, consultas somadas a partir de Terapeuta)"""
+    return (
+        q_filtros(CAMPOS_FILTRO_TERAPEUTA, {nome: valor for nome, valor in filtros.items() if nome not in ('inicio', 'fim')}),
+        q_filtros({'data': 'dat_consulta', 'paciente_ativo': 'fk_paciente__is_active'}, filtros, prefixo='consulta__'),
+    )
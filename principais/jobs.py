@@ -0,0 +1,150 @@
+from datetime import timedelta
+from pathlib import Path
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from . import models, relatorios
+import logging
+import os
+
+logger = logging.getLogger('principais')
+
+def pasta_relatorios():
+    pasta = Path(settings.RELATORIOS_DIR)
+    pasta.mkdir(parents=True, exist_ok=True)
+    return pasta
+
+
+def caminho_arquivo(job):
+    """Caminho absoluto do arquivo gerado (None enquanto o job não terminou)"""
+    if not job.arquivo:
+        return None
+    return Path(settings.RELATORIOS_DIR) / job.arquivo
+
+
+def enfileirar_relatorio(tipo, formato, usuario=None, filtros=None):
+    """Cria o job pendente; o arquivo é gerado pelo comando processar_relatorios"""
+    timestamp = timezone.now().strftime('%Y%m%d_%H%M%S')
+    return models.RelatorioJob.objects.create(
+        tipo=tipo,
+        formato=formato,
+        fk_usuario=usuario if usuario is not None and usuario.is_authenticated else None,
+        filtros=filtros or {},
+        nome_arquivo=f'{tipo}_{timestamp}.{relatorios.extensao(tipo, formato)}',
+    )
+
+
+def reivindicar_proximo_job():
+    """
+    Marca como 'processando' o job pendente mais antigo e o devolve (None se
+    a fila está vazia). No PostgreSQL a linha é travada com FOR UPDATE SKIP
+    LOCKED; nos bancos sem suporte (SQLite) o UPDATE condicionado ao status
+    garante que só um worker fica com o job. Jobs 'processando' sem progresso
+    há mais de RELATORIOS_JOB_TIMEOUT (worker encerrado) voltam para a fila.
+    """
+    agora = timezone.now()
+    abandonado = Q(
+        status=models.RelatorioJob.PROCESSANDO,
+        updated_at__lt=agora - timedelta(seconds=settings.RELATORIOS_JOB_TIMEOUT)
+    )
+    disponiveis = models.RelatorioJob.objects.filter(Q(status=models.RelatorioJob.PENDENTE) | abandonado)
+
+    with transaction.atomic():
+        job = disponiveis.select_for_update(skip_locked=True).order_by('created_at').first()
+        if job is None:
+            return None
+
+        reivindicado = disponiveis.filter(pk=job.pk, status=job.status, updated_at=job.updated_at).update(
+            status=models.RelatorioJob.PROCESSANDO,
+            linhas_processadas=0,
+            erro=None,
+            iniciado_em=agora,
+            updated_at=agora,
+        )
+    if not reivindicado:
+        # Outro worker levou o job entre a leitura e o UPDATE
+        return None
+
+    job.refresh_from_db()
+    return job
+
+
+def processar_job(job):
+    """
+    Gera o arquivo do job em RELATORIOS_DIR (primeiro em .parcial, renomeado
+    ao terminar) e registra o resultado. Retorna True quando concluído.
+    """
+    jobs = models.RelatorioJob.objects.filter(pk=job.pk)
+    nome = f'{job.pk}_{job.nome_arquivo}'
+    destino = pasta_relatorios() / nome
+    parcial = destino.with_name(f'{nome}.parcial')
+    linhas = 0
+
+    def progresso(total):
+        nonlocal linhas
+        linhas = total
+        # Também renova updated_at, que indica que o worker segue vivo
+        jobs.update(linhas_processadas=total, updated_at=timezone.now())
+
+    try:
+        with open(parcial, 'wb') as arquivo:
+            relatorios.gravar_relatorio(job.tipo, job.formato, arquivo, progresso, filtros=job.filtros)
+        os.replace(parcial, destino)
+    except Exception as e:
+        logger.exception(f"ERRO ao gerar relatório do job {job.pk}: {str(e)}")
+        parcial.unlink(missing_ok=True)
+        jobs.update(
+            status=models.RelatorioJob.ERRO,
+            erro=str(e),
+            concluido_em=timezone.now(),
+            updated_at=timezone.now(),
+        )
+        return False
+
+    jobs.update(
+        status=models.RelatorioJob.CONCLUIDO,
+        arquivo=nome,
+        linhas_processadas=linhas,
+        concluido_em=timezone.now(),
+        updated_at=timezone.now(),
+    )
+    logger.info(f"Relatório do job {job.pk} gerado: {nome} ({linhas} linha(s))")
+    return True
+
+
+def expirar_relatorios():
+    """
+    Apaga de RELATORIOS_DIR os arquivos dos jobs concluídos há mais de
+    RELATORIOS_JOB_RETENCAO segundos e marca esses jobs como expirados (o
+    download responde 410). Também remove arquivos .parcial esquecidos por
+    workers encerrados. Retorna o número de jobs expirados.
+    """
+    agora = timezone.now()
+    limite = agora - timedelta(seconds=settings.RELATORIOS_JOB_RETENCAO)
+    vencidos = models.RelatorioJob.objects.filter(status=models.RelatorioJob.CONCLUIDO, concluido_em__lt=limite)
+
+    expirados = 0
+    for job in vencidos.only('pk', 'arquivo'):
+        # Condicionado ao status: outro worker pode ter expirado o job antes
+        if models.RelatorioJob.objects.filter(pk=job.pk, status=models.RelatorioJob.CONCLUIDO).update(
+            status=models.RelatorioJob.EXPIRADO,
+            arquivo='',
+            updated_at=agora,
+        ):
+            caminho = caminho_arquivo(job)
+            if caminho is not None:
+                caminho.unlink(missing_ok=True)
+            expirados += 1
+
+    # Um .parcial em uso é regravado a cada bloco; parado há tanto tempo, foi abandonado
+    for parcial in pasta_relatorios().glob('*.parcial'):
+        try:
+            if parcial.stat().st_mtime < limite.timestamp():
+                parcial.unlink(missing_ok=True)
+        except FileNotFoundError:
+            pass
+
+    if expirados:
+        logger.info(f"Relatórios em segundo plano: {expirados} arquivo(s) expirado(s)")
+    return expirados
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from principais.materializadas import criar_views_materializadas, atualizar_views_materializadas
+
+
+class Command(BaseCommand):
+    help = 'Cria (se necessário) e atualiza as views materializadas dos relatórios (somente PostgreSQL)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recriar', action='store_true', help='Remove e recria as views (após mudar o SQL)')
+        parser.add_argument(
+            '--sem-concorrencia',
+            action='store_true',
+            help='Usa REFRESH sem CONCURRENTLY (mais rápido, mas bloqueia leituras durante o refresh)'
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            self.stdout.write(self.style.WARNING(
+                'Views materializadas só existem no PostgreSQL; os relatórios usam as queries ao vivo.'
+            ))
+            return
+
+        try:
+            criar_views_materializadas(recriar=options['recriar'])
+            tempos = atualizar_views_materializadas(concorrente=not options['sem_concorrencia'])
+        except Exception as e:
+            raise CommandError(f'Erro ao atualizar views materializadas: {e}')
+
+        for nome, segundos in tempos:
+            self.stdout.write(f'{nome}: {segundos:.2f}s')
+        self.stdout.write(self.style.SUCCESS(f'{len(tempos)} view(s) materializada(s) atualizada(s).'))
@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from principais.jobs import expirar_relatorios
+
+
+class Command(BaseCommand):
+    help = (
+        'Apaga os arquivos dos relatórios em segundo plano concluídos há mais de '
+        'RELATORIOS_JOB_RETENCAO segundos e marca os jobs como expirados (para cron, '
+        'quando o worker processar_relatorios não está rodando)'
+    )
+
+    def handle(self, *args, **options):
+        expirados = expirar_relatorios()
+        self.stdout.write(self.style.SUCCESS(
+            f'{expirados} relatório(s) expirado(s) (retenção: {settings.RELATORIOS_JOB_RETENCAO}s).'
+        ))
@@ -0,0 +1,91 @@
+import statistics
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.http import QueryDict
+from app.pagination import KeysetPagination
+from principais import views
+from principais.filtros_api import q_filtros_api
+
+# Listagens da API com filtros: nome -> view (queryset, keyset_ordering e filtros_api)
+LISTAGENS = {
+    'consulta': views.ConsultaListCreateAPIView,
+    'paciente': views.PacienteListCreateAPIView,
+    'terapeuta': views.TerapeutaListCreateAPIView,
+    'selecao': views.SelecaoListCreateAPIView,
+}
+
+
+def valores_exemplo(modelo, tipo, lookup):
+    """
+    Valores usados no benchmark do filtro: o ID mais frequente (pior caso do
+    filtro), a data mediana ou true e false. Vazio quando a tabela está vazia.
+    """
+    if tipo == 'booleano':
+        return ['true', 'false']
+    campo = lookup.split('__')[0]
+    valores = modelo.objects.exclude(**{f'{campo}__isnull': True})
+    if tipo == 'id':
+        mais_frequente = valores.values(campo).annotate(total=Count('pk')).order_by('-total').first()
+        return [str(mais_frequente[campo])] if mais_frequente else []
+    total = valores.count()
+    if not total:
+        return []
+    return [valores.order_by(campo).values_list(campo, flat=True)[total // 2].isoformat()]
+
+
+def primeira_pagina(view, parametros):
+    """Mesma query da primeira página da listagem (sem cursor) com os filtros informados"""
+    queryset = view.queryset.annotate(**view.anotacoes).filter(q_filtros_api(view.filtros_api, parametros))
+    return queryset.order_by(*view.keyset_ordering)[:KeysetPagination.page_size + 1]
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark dos filtros das listagens da API: plano (EXPLAIN) e tempo da '
+        'primeira página para cada filtro, para conferir o índice usado'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('listagens', nargs='*', help=f'Entre {", ".join(LISTAGENS)} (padrão: todas)')
+        parser.add_argument('--repeticoes', type=int, default=5, help='Execuções por filtro (mediana em ms)')
+        parser.add_argument(
+            '--analisar',
+            action='store_true',
+            help='EXPLAIN ANALYZE, com tempos e linhas reais (somente PostgreSQL)'
+        )
+
+    def handle(self, *args, **options):
+        if options['analisar'] and connection.vendor != 'postgresql':
+            raise CommandError('--analisar só é suportado no PostgreSQL.')
+        desconhecidas = [nome for nome in options['listagens'] if nome not in LISTAGENS]
+        if desconhecidas:
+            raise CommandError(f'Listagem(ns) desconhecida(s): {", ".join(desconhecidas)}')
+        opcoes_explain = {'analyze': True, 'buffers': True} if options['analisar'] else {}
+
+        for nome in options['listagens'] or LISTAGENS:
+            view = LISTAGENS[nome]
+            casos = [('(sem filtro)', QueryDict())]
+            for parametro, (tipo, lookup) in view.filtros_api.items():
+                valores = valores_exemplo(view.queryset.model, tipo, lookup)
+                if not valores:
+                    self.stdout.write(self.style.WARNING(f'{nome}?{parametro}: sem dados para o exemplo, ignorado'))
+                for valor in valores:
+                    parametros = QueryDict(mutable=True)
+                    parametros[parametro] = valor
+                    casos.append((f'?{parametros.urlencode()}', parametros))
+
+            for descricao, parametros in casos:
+                queryset = primeira_pagina(view, parametros)
+                tempos = []
+                for _ in range(max(options['repeticoes'], 1)):
+                    inicio = time.perf_counter()
+                    list(queryset.all())
+                    tempos.append((time.perf_counter() - inicio) * 1000)
+
+                self.stdout.write(self.style.MIGRATE_HEADING(
+                    f'{nome}{descricao}: {statistics.median(tempos):.2f} ms (mediana de {len(tempos)})'
+                ))
+                for linha in queryset.explain(**opcoes_explain).splitlines():
+                    self.stdout.write(f'    {linha}')
@@ -0,0 +1,52 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from principais.jobs import reivindicar_proximo_job, processar_job, expirar_relatorios
+
+# Segundos entre as limpezas dos arquivos expirados feitas pelo worker
+INTERVALO_LIMPEZA = 3600
+
+
+class Command(BaseCommand):
+    help = (
+        'Worker dos relatórios em segundo plano: gera em disco os arquivos dos RelatorioJob '
+        'pendentes e, a cada hora, apaga os que passaram de RELATORIOS_JOB_RETENCAO'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--uma-vez', action='store_true', help='Processa os jobs pendentes e encerra')
+        parser.add_argument(
+            '--intervalo',
+            type=float,
+            default=settings.RELATORIOS_JOB_INTERVALO,
+            help='Segundos de espera quando a fila está vazia'
+        )
+
+    def handle(self, *args, **options):
+        processados = 0
+        proxima_limpeza = 0
+        try:
+            while True:
+                if time.monotonic() >= proxima_limpeza:
+                    expirados = expirar_relatorios()
+                    if expirados:
+                        self.stdout.write(f'{expirados} relatório(s) expirado(s) removido(s).')
+                    proxima_limpeza = time.monotonic() + INTERVALO_LIMPEZA
+
+                job = reivindicar_proximo_job()
+                if job is None:
+                    if options['uma_vez']:
+                        break
+                    time.sleep(options['intervalo'])
+                    continue
+
+                self.stdout.write(f'Job {job.pk}: {job.tipo} ({job.formato})...')
+                if processar_job(job):
+                    self.stdout.write(self.style.SUCCESS(f'Job {job.pk} concluído.'))
+                else:
+                    self.stdout.write(self.style.ERROR(f'Job {job.pk} terminou com erro.'))
+                processados += 1
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(f'{processados} job(s) processado(s).')
@@ -0,0 +1,25 @@
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from principais.agregados import reconstruir_consultas_diarias
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói os agregados diário e mensal de consultas (ConsultaDiaria/ConsultaMensal) usados pelo dashboard'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--inicio', type=str, help='Data inicial (AAAA-MM-DD). Padrão: todo o histórico')
+        parser.add_argument('--fim', type=str, help='Data final (AAAA-MM-DD). Padrão: todo o histórico')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Tamanho do lote de inserção')
+
+    def handle(self, *args, **options):
+        try:
+            inicio = date.fromisoformat(options['inicio']) if options['inicio'] else None
+            fim = date.fromisoformat(options['fim']) if options['fim'] else None
+        except ValueError as e:
+            raise CommandError(f'Data inválida: {e}')
+
+        if inicio and fim and inicio > fim:
+            raise CommandError('A data inicial deve ser anterior à data final.')
+
+        total = reconstruir_consultas_diarias(inicio=inicio, fim=fim, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'ConsultaDiaria reconstruída: {total} linha(s) criada(s).'))
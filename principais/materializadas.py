@@ -0,0 +1,200 @@
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, Q, Sum, F, Value, DecimalField
+from django.db.models.functions import Coalesce
+from acessorios.models import Captacao
+from app.metrics_cache import bump_model_version
+from . import models
+import logging
+import time
+
+logger = logging.getLogger('principais')
+
+# Views materializadas (PostgreSQL) dos relatórios: nome -> (SELECT, colunas do índice único).
+# O índice único é exigido pelo REFRESH MATERIALIZED VIEW CONCURRENTLY.
+VIEWS_MATERIALIZADAS = {
+    'mv_relatorio_terapeuta': (
+        '''
+        SELECT t.pk_terapeuta AS fk_terapeuta,
+               COUNT(c.pk_consulta) AS consultas_marcadas,
+               COUNT(c.pk_consulta) FILTER (WHERE c.is_realizado) AS consultas_realizadas,
+               COALESCE(SUM(c.vlr_pago), 0) AS valor_recebido,
+               COUNT(DISTINCT c.fk_paciente) AS pacientes_atendidos,
+               COALESCE(SUM(p.vlr_sessao), 0) AS receita_acordada
+        FROM terapeutas t
+        LEFT JOIN consultas c ON c.fk_terapeuta = t.pk_terapeuta
+        LEFT JOIN pacientes p ON p.pk_paciente = c.fk_paciente
+        GROUP BY t.pk_terapeuta
+        ''',
+        ['fk_terapeuta'],
+    ),
+    'mv_relatorio_captacao': (
+        '''
+        SELECT cap.pk_captacao AS fk_captacao,
+               COUNT(p.pk_paciente) FILTER (WHERE p.is_active) AS total_pacientes,
+               COUNT(p.pk_paciente) FILTER (WHERE NOT p.is_active) AS total_pacientes_inativos,
+               COUNT(p.pk_paciente) AS total_geral
+        FROM captacoes cap
+        LEFT JOIN pacientes p ON p.fk_captacao = cap.pk_captacao
+        GROUP BY cap.pk_captacao
+        ''',
+        ['fk_captacao'],
+    ),
+    'mv_relatorio_resumo': (
+        '''
+        SELECT 1 AS id,
+               COUNT(*) AS total_consultas_marcadas,
+               COUNT(*) FILTER (WHERE is_realizado) AS total_consultas_realizadas,
+               COALESCE(SUM(vlr_pago), 0) AS receita_total
+        FROM consultas
+        ''',
+        ['id'],
+    ),
+}
+
+# Só guarda o resultado positivo: depois do primeiro refresh o processo passa a usar as views
+_disponiveis = False
+
+
+def views_materializadas_disponiveis():
+    """
+    True quando o banco é PostgreSQL, o uso está habilitado e todas as views
+    já foram criadas e populadas. Caso contrário os relatórios usam as queries ao vivo.
+    """
+    global _disponiveis
+    if not settings.RELATORIOS_VIEWS_MATERIALIZADAS or connection.vendor != 'postgresql':
+        return False
+
+    if not _disponiveis:
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT COUNT(*) FROM pg_matviews WHERE matviewname = ANY(%s) AND ispopulated',
+                    [list(VIEWS_MATERIALIZADAS)]
+                )
+                _disponiveis = cursor.fetchone()[0] == len(VIEWS_MATERIALIZADAS)
+        except Exception as e:
+            logger.error(f"ERRO ao verificar views materializadas: {str(e)}")
+            return False
+    return _disponiveis
+
+
+def criar_views_materializadas(recriar=False):
+    """Cria as views materializadas (e os índices únicos) que ainda não existem"""
+    with connection.cursor() as cursor:
+        for nome, (sql, colunas_unicas) in VIEWS_MATERIALIZADAS.items():
+            if recriar:
+                cursor.execute(f'DROP MATERIALIZED VIEW IF EXISTS {nome}')
+            cursor.execute(f'CREATE MATERIALIZED VIEW IF NOT EXISTS {nome} AS {sql} WITH DATA')
+            cursor.execute(
+                f'CREATE UNIQUE INDEX IF NOT EXISTS {nome}_unico ON {nome} ({", ".join(colunas_unicas)})'
+            )
+
+
+def atualizar_views_materializadas(concorrente=True):
+    """
+    Executa REFRESH MATERIALIZED VIEW (CONCURRENTLY por padrão, sem bloquear
+    leituras). Retorna uma lista de (nome, segundos).
+    """
+    global _disponiveis
+    tempos = []
+    modo = ' CONCURRENTLY' if concorrente else ''
+    with connection.cursor() as cursor:
+        for nome in VIEWS_MATERIALIZADAS:
+            inicio = time.monotonic()
+            cursor.execute(f'REFRESH MATERIALIZED VIEW{modo} {nome}')
+            tempos.append((nome, time.monotonic() - inicio))
+    _disponiveis = True
+    # Relatórios em cache que leem as views passam a ter outra chave
+    bump_model_version('materializadas')
+    return tempos
+
+
+# LEITURAS - view materializada no PostgreSQL, query ao vivo nos demais casos
+def resumo_consultas(filtro=None):
+    """
+    Totais gerais de consultas: marcadas, realizadas e receita recebida.
+    Com filtro (Q sobre Consulta) a query é sempre ao vivo.
+    """
+    if not filtro and views_materializadas_disponiveis():
+        resumo = models.RelatorioResumo.objects.values(
+            'total_consultas_marcadas', 'total_consultas_realizadas', 'receita_total'
+        ).first()
+        if resumo:
+            return resumo
+
+    return models.Consulta.objects.filter(filtro or Q()).aggregate(
+        total_consultas_marcadas=Count('pk_consulta'),
+        total_consultas_realizadas=Count('pk_consulta', filter=Q(is_realizado=True)),
+        receita_total=Coalesce(Sum('vlr_pago'), Value(0), output_field=DecimalField()),
+    )
+
+
+def captacoes_com_contagem(filtro_pacientes=None):
+    """
+    Captações anotadas com total_pacientes, total_pacientes_inativos e total_geral.
+    filtro_pacientes (Q a partir de Captacao, ex.: paciente__fk_clinica=1) limita
+    os pacientes contados e usa sempre a query ao vivo.
+    """
+    if not filtro_pacientes and views_materializadas_disponiveis():
+        captacoes = Captacao.objects.annotate(
+            total_pacientes=Coalesce(F('relatorio_materializado__total_pacientes'), 0),
+            total_pacientes_inativos=Coalesce(F('relatorio_materializado__total_pacientes_inativos'), 0),
+            total_geral=Coalesce(F('relatorio_materializado__total_geral'), 0),
+        )
+    else:
+        filtro_pacientes = filtro_pacientes or Q()
+        captacoes = Captacao.objects.annotate(
+            total_pacientes=Count('paciente', filter=Q(paciente__is_active=True) & filtro_pacientes),
+            total_pacientes_inativos=Count('paciente', filter=Q(paciente__is_active=False) & filtro_pacientes),
+            total_geral=Count('paciente', filter=filtro_pacientes or None)
+        )
+    return captacoes.order_by('-total_pacientes')
+
+
+def metricas_por_terapeuta(filtro_terapeutas=None, filtro_consultas=None):
+    """
+    Métricas históricas dos terapeutas ativos, uma linha (dict) por terapeuta:
+    nome, pacientes_ativos, consultas_marcadas, consultas_realizadas,
+    valor_recebido e receita_acordada. Sempre UMA query, qualquer que seja
+    o número de terapeutas. filtro_terapeutas (Q sobre Terapeuta) escolhe os
+    terapeutas; filtro_consultas (Q a partir de Terapeuta, ex.:
+    consulta__dat_consulta__gte) limita as consultas somadas e usa a query ao vivo.
+    """
+    terapeutas = models.Terapeuta.objects.filter(filtro_terapeutas or Q(), is_active=True)
+    zero = Value(0, output_field=DecimalField())
+
+    if not filtro_consultas and views_materializadas_disponiveis():
+        linhas = terapeutas.annotate(
+            pacientes_ativos=Coalesce(F('relatorio_materializado__pacientes_atendidos'), 0),
+            consultas_marcadas=Coalesce(F('relatorio_materializado__consultas_marcadas'), 0),
+            consultas_realizadas=Coalesce(F('relatorio_materializado__consultas_realizadas'), 0),
+            valor_recebido=Coalesce(F('relatorio_materializado__valor_recebido'), zero),
+            receita_acordada=Coalesce(F('relatorio_materializado__receita_acordada'), zero),
+        )
+    else:
+        # Agrupado por terapeuta sobre o join consulta -> paciente; a receita
+        # acordada soma o valor da sessão do paciente em cada consulta
+        filtro = filtro_consultas or None
+        linhas = terapeutas.annotate(
+            pacientes_ativos=Count('consulta__fk_paciente', distinct=True, filter=filtro),
+            consultas_marcadas=Count('consulta', filter=filtro),
+            consultas_realizadas=Count('consulta', filter=Q(consulta__is_realizado=True) & (filtro or Q())),
+            valor_recebido=Coalesce(Sum('consulta__vlr_pago', filter=filtro), zero),
+            receita_acordada=Coalesce(Sum('consulta__fk_paciente__vlr_sessao', filter=filtro), zero),
+        )
+
+    return [
+        {
+            'nome': linha['fk_associado__nome'],
+            'pacientes_ativos': linha['pacientes_ativos'],
+            'consultas_marcadas': linha['consultas_marcadas'],
+            'consultas_realizadas': linha['consultas_realizadas'],
+            'valor_recebido': linha['valor_recebido'],
+            'receita_acordada': linha['receita_acordada'],
+        }
+        for linha in linhas.values(
+            'pk_terapeuta', 'fk_associado__nome', 'pacientes_ativos', 'consultas_marcadas',
+            'consultas_realizadas', 'valor_recebido', 'receita_acordada'
+        ).order_by('fk_associado__nome', 'pk_terapeuta')
+    ]
@@ -110,6 +110,12 @@ class Associado(models.Model):
         db_table = "associados"
         verbose_name = "Associado"
         verbose_name_plural = "Associados"
+        indexes = [
+            # Filtro de período dos relatórios
+            models.Index(fields=['created_at'], name='idx_associado_created_at'),
+            # Exportação incremental (delta)
+            models.Index(fields=['updated_at'], name='idx_associado_updated_at'),
+        ]
     
     def __str__(self):
         return self.nome
@@ -189,6 +195,21 @@ class Paciente(models.Model):
         db_table = "pacientes"
         verbose_name = "Paciente"
         verbose_name_plural = "Pacientes"
+        indexes = [
+            # Filtros dos relatórios: clínica + status e período de cadastro
+            models.Index(fields=['fk_clinica', 'is_active'], name='idx_paciente_clinica_ativo'),
+            models.Index(fields=['created_at'], name='idx_paciente_created_at'),
+            # Ordenação padrão e paginação por cursor da API
+            models.Index(fields=['nome', 'pk_paciente'], name='idx_paciente_nome'),
+            # Filtro is_active=false da API (poucos inativos; parcial)
+            models.Index(
+                fields=['nome', 'pk_paciente'],
+                condition=models.Q(is_active=False),
+                name='idx_paciente_inativo_nome'
+            ),
+            # Exportação incremental (delta)
+            models.Index(fields=['updated_at'], name='idx_paciente_updated_at'),
+        ]
 
 
 class Terapeuta(models.Model):
@@ -243,6 +264,12 @@ class Terapeuta(models.Model):
         db_table = "terapeutas"
         verbose_name = "Terapeuta"
         verbose_name_plural = "Terapeutas"
+        indexes = [
+            # Filtro de período dos relatórios
+            models.Index(fields=['created_at'], name='idx_terapeuta_created_at'),
+            # Exportação incremental (delta)
+            models.Index(fields=['updated_at'], name='idx_terapeuta_updated_at'),
+        ]
     
     def __str__(self):
         return f"{self.fk_associado.nome} (Decano: {self.fk_decano.nome})"
@@ -289,11 +316,251 @@ class Consulta(models.Model):
                 name='check_vlr_pago_greater_equal_0'
             ),
         ]
-    
+        indexes = [
+            # Recalculo do agregado diário (dia × terapeuta) e API filtrada por terapeuta
+            models.Index(fields=['fk_terapeuta', 'dat_consulta', 'pk_consulta'], name='idx_consulta_terapeuta_data'),
+            # Relatórios filtrados só por período e paginação por cursor da API
+            models.Index(fields=['dat_consulta', 'pk_consulta'], name='idx_consulta_data'),
+            # Filtros da API na ordem do cursor: por paciente e os seletivos (parciais)
+            models.Index(fields=['fk_paciente', 'dat_consulta', 'pk_consulta'], name='idx_consulta_paciente_data'),
+            models.Index(
+                fields=['dat_consulta', 'pk_consulta'],
+                condition=models.Q(vlr_pago=0),
+                name='idx_consulta_inadimplente'
+            ),
+            models.Index(
+                fields=['dat_consulta', 'pk_consulta'],
+                condition=models.Q(is_realizado=False),
+                name='idx_consulta_nao_realizada'
+            ),
+            # Exportação incremental (delta)
+            models.Index(fields=['updated_at'], name='idx_consulta_updated_at'),
+        ]
+
     def __str__(self):
         return f"Consulta do {self.fk_paciente} pelo {self.fk_terapeuta}"
 
 
+class MedidasConsulta(models.Model):
+    """Medidas somáveis comuns a todos os agregados de consultas"""
+    total_marcadas = models.IntegerField(default=0, verbose_name="Consultas Marcadas")
+    total_realizadas = models.IntegerField(default=0, verbose_name="Consultas Realizadas")
+    soma_vlr_consulta = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+        verbose_name="Soma do Valor das Consultas"
+    )
+    soma_vlr_pago = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+        verbose_name="Soma do Valor Pago"
+    )
+    consultas_valor_zero = models.IntegerField(default=0, verbose_name="Consultas com Valor Pago Zero")
+    consultas_valor_positivo = models.IntegerField(default=0, verbose_name="Consultas com Valor Pago Positivo")
+    # Consultas realizadas e pagas (base do preço médio realizado)
+    realizadas_pagas = models.IntegerField(default=0, verbose_name="Consultas Realizadas e Pagas")
+    soma_vlr_pago_realizado = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+        verbose_name="Soma do Valor Pago (Realizadas)"
+    )
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Data de Atualização")
+
+    # Campos somáveis, na ordem usada pelos agregados e métricas
+    CAMPOS_MEDIDAS = (
+        'total_marcadas', 'total_realizadas', 'soma_vlr_consulta', 'soma_vlr_pago',
+        'consultas_valor_zero', 'consultas_valor_positivo', 'realizadas_pagas', 'soma_vlr_pago_realizado',
+    )
+
+    class Meta:
+        abstract = True
+
+
+class AgregadoConsulta(MedidasConsulta):
+    """Agregados de consultas por terapeuta (diário e mensal)"""
+    fk_terapeuta = models.ForeignKey(
+        Terapeuta,
+        on_delete=models.CASCADE,
+        db_column='fk_terapeuta',
+        verbose_name="Terapeuta"
+    )
+
+    class Meta:
+        abstract = True
+
+
+class ConsultaDiaria(AgregadoConsulta):
+    """
+    Agregado diário de consultas (uma linha por dia × terapeuta).
+    Mantido pelos signals de Consulta e reconstruído pelo comando
+    reconstruir_consultas_diarias. É a fonte das métricas do dashboard.
+    """
+    pk_consulta_diaria = models.AutoField(primary_key=True, verbose_name="ID")
+    dat_consulta = models.DateField(verbose_name="Data da Consulta")
+
+    class Meta:
+        db_table = "consultas_diarias"
+        verbose_name = "Consulta Diária"
+        verbose_name_plural = "Consultas Diárias"
+        ordering = ['dat_consulta']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['dat_consulta', 'fk_terapeuta'],
+                name='unique_consulta_diaria_data_terapeuta'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.dat_consulta} - {self.fk_terapeuta_id}: {self.total_marcadas} consulta(s)"
+
+
+class ConsultaMensal(AgregadoConsulta):
+    """
+    Agregado mensal de consultas (uma linha por mês × terapeuta), derivado de
+    ConsultaDiaria. Atende intervalos longos com um custo por mês, não por dia.
+    """
+    pk_consulta_mensal = models.AutoField(primary_key=True, verbose_name="ID")
+    mes = models.DateField(verbose_name="Mês", help_text="Primeiro dia do mês")
+
+    class Meta:
+        db_table = "consultas_mensais"
+        verbose_name = "Consulta Mensal"
+        verbose_name_plural = "Consultas Mensais"
+        ordering = ['mes']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['mes', 'fk_terapeuta'],
+                name='unique_consulta_mensal_mes_terapeuta'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.mes:%m/%Y} - {self.fk_terapeuta_id}: {self.total_marcadas} consulta(s)"
+
+
+class ConsultaDimensaoMensal(MedidasConsulta):
+    """
+    Cubo mensal de consultas por clínica × núcleo × abordagem × modalidade
+    (dimensões do terapeuta), derivado de ConsultaMensal. Atende o drill-down
+    do dashboard sem agrupar consultas por dimensão a cada requisição.
+    """
+    pk_consulta_dimensao = models.AutoField(primary_key=True, verbose_name="ID")
+    mes = models.DateField(verbose_name="Mês", help_text="Primeiro dia do mês")
+    fk_clinica = models.ForeignKey(
+        Clinica,
+        on_delete=models.CASCADE,
+        db_column='fk_clinica',
+        verbose_name="Clínica"
+    )
+    fk_nucleo = models.ForeignKey(
+        Nucleo,
+        on_delete=models.CASCADE,
+        db_column='fk_nucleo',
+        verbose_name="Núcleo"
+    )
+    fk_abordagem = models.ForeignKey(
+        Abordagem,
+        on_delete=models.CASCADE,
+        db_column='fk_abordagem',
+        verbose_name="Abordagem"
+    )
+    fk_modalidade = models.ForeignKey(
+        Modalidade,
+        on_delete=models.CASCADE,
+        db_column='fk_modalidade',
+        verbose_name="Modalidade"
+    )
+
+    class Meta:
+        db_table = "consultas_dimensoes_mensais"
+        verbose_name = "Consulta por Dimensão (Mensal)"
+        verbose_name_plural = "Consultas por Dimensão (Mensal)"
+        ordering = ['mes']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['mes', 'fk_clinica', 'fk_nucleo', 'fk_abordagem', 'fk_modalidade'],
+                name='unique_consulta_dimensao_mes'
+            ),
+        ]
+        # Filtro por qualquer dimensão + intervalo de meses
+        indexes = [
+            models.Index(fields=['fk_clinica', 'mes'], name='idx_dimensao_clinica_mes'),
+            models.Index(fields=['fk_nucleo', 'mes'], name='idx_dimensao_nucleo_mes'),
+            models.Index(fields=['fk_abordagem', 'mes'], name='idx_dimensao_abordagem_mes'),
+            models.Index(fields=['fk_modalidade', 'mes'], name='idx_dimensao_modalidade_mes'),
+        ]
+
+    def __str__(self):
+        return (
+            f"{self.mes:%m/%Y} - clínica {self.fk_clinica_id}, núcleo {self.fk_nucleo_id}, "
+            f"abordagem {self.fk_abordagem_id}, modalidade {self.fk_modalidade_id}: "
+            f"{self.total_marcadas} consulta(s)"
+        )
+
+
+# Views materializadas dos relatórios (somente PostgreSQL).
+# Criadas/atualizadas pelo comando atualizar_views_materializadas; ver principais/materializadas.py
+class RelatorioTerapeuta(models.Model):
+    """Totais históricos de consultas por terapeuta (mv_relatorio_terapeuta)"""
+    fk_terapeuta = models.OneToOneField(
+        Terapeuta,
+        primary_key=True,
+        on_delete=models.DO_NOTHING,
+        db_column='fk_terapeuta',
+        related_name='relatorio_materializado',
+        verbose_name="Terapeuta"
+    )
+    consultas_marcadas = models.IntegerField(verbose_name="Consultas Marcadas")
+    consultas_realizadas = models.IntegerField(verbose_name="Consultas Realizadas")
+    valor_recebido = models.DecimalField(max_digits=14, decimal_places=2, verbose_name="Valor Recebido")
+    pacientes_atendidos = models.IntegerField(verbose_name="Pacientes Atendidos")
+    receita_acordada = models.DecimalField(max_digits=14, decimal_places=2, verbose_name="Receita Acordada")
+
+    class Meta:
+        managed = False
+        db_table = "mv_relatorio_terapeuta"
+        verbose_name = "Relatório por Terapeuta"
+        verbose_name_plural = "Relatórios por Terapeuta"
+
+
+class RelatorioCaptacao(models.Model):
+    """Pacientes por captação (mv_relatorio_captacao)"""
+    fk_captacao = models.OneToOneField(
+        Captacao,
+        primary_key=True,
+        on_delete=models.DO_NOTHING,
+        db_column='fk_captacao',
+        related_name='relatorio_materializado',
+        verbose_name="Captação"
+    )
+    total_pacientes = models.IntegerField(verbose_name="Pacientes Ativos")
+    total_pacientes_inativos = models.IntegerField(verbose_name="Pacientes Inativos")
+    total_geral = models.IntegerField(verbose_name="Total de Pacientes")
+
+    class Meta:
+        managed = False
+        db_table = "mv_relatorio_captacao"
+        verbose_name = "Relatório por Captação"
+        verbose_name_plural = "Relatórios por Captação"
+
+
+class RelatorioResumo(models.Model):
+    """Totais gerais de consultas (mv_relatorio_resumo, linha única)"""
+    id = models.IntegerField(primary_key=True)
+    total_consultas_marcadas = models.IntegerField(verbose_name="Consultas Marcadas")
+    total_consultas_realizadas = models.IntegerField(verbose_name="Consultas Realizadas")
+    receita_total = models.DecimalField(max_digits=14, decimal_places=2, verbose_name="Receita Total Recebida")
+
+    class Meta:
+        managed = False
+        db_table = "mv_relatorio_resumo"
+        verbose_name = "Resumo de Consultas"
+        verbose_name_plural = "Resumo de Consultas"
+
+
 class Altadesistencia(models.Model):
     pk_alta_desistencia = models.AutoField(primary_key=True, verbose_name="ID")
     fk_terapeuta = models.ForeignKey(
@@ -355,6 +622,12 @@ class Altadesistencia(models.Model):
         db_table = "altadesistencia"
         verbose_name = "Altadesistencia"
         verbose_name_plural = "Altadesistencia"
+        indexes = [
+            # Filtro de período dos relatórios
+            models.Index(fields=['dat_sessao'], name='idx_altadesistencia_data'),
+            # Exportação incremental (delta)
+            models.Index(fields=['updated_at'], name='idx_altadesist_updated_at'),
+        ]
 
 
 class Avaliacao(models.Model):
@@ -434,6 +707,12 @@ class Avaliacao(models.Model):
         db_table = "avaliação"
         verbose_name = "Avaliação"
         verbose_name_plural = "Avaliações"
+        indexes = [
+            # Filtro de período dos relatórios e paginação por cursor da API
+            models.Index(fields=['dat_consulta', 'pk_avaliacao'], name='idx_avaliacao_data'),
+            # Exportação incremental (delta)
+            models.Index(fields=['updated_at'], name='idx_avaliacao_updated_at'),
+        ]
 
 
 
@@ -543,12 +822,134 @@ class Selecao(models.Model):
         verbose_name="Insight & Potência",
         help_text="Avalie a capacidade do terapeuta em gerar insights e potência terapêutica."
     )
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Data de Atualização")
     
     class Meta:
         db_table = "selecao"
         verbose_name = "Seleção"
         verbose_name_plural = "Seleções"
         ordering = ['-dat_avaliacao']
+        indexes = [
+            # Ordenação padrão, filtro de período dos relatórios e paginação por cursor da API
+            models.Index(fields=['dat_avaliacao', 'pk_selecao'], name='idx_selecao_data'),
+            # Exportação incremental (delta)
+            models.Index(fields=['updated_at'], name='idx_selecao_updated_at'),
+        ]
     
     def __str__(self):
         return f"Seleção: {self.fk_terapeuta_avaliador} -> {self.fk_associado_avaliado} ({self.dat_avaliacao})"
+
+
+class RelatorioJob(models.Model):
+    """
+    Exportação de relatório processada fora da requisição: a view cria o job,
+    o comando processar_relatorios gera o arquivo em disco e a view de
+    download o entrega quando o status é concluído. Depois de
+    RELATORIOS_JOB_RETENCAO o arquivo é apagado e o job fica expirado.
+    """
+    PENDENTE = 'pendente'
+    PROCESSANDO = 'processando'
+    CONCLUIDO = 'concluido'
+    ERRO = 'erro'
+    EXPIRADO = 'expirado'
+    STATUS_CHOICES = [
+        (PENDENTE, 'Pendente'),
+        (PROCESSANDO, 'Processando'),
+        (CONCLUIDO, 'Concluído'),
+        (ERRO, 'Erro'),
+        (EXPIRADO, 'Expirado'),
+    ]
+
+    pk_relatorio_job = models.AutoField(primary_key=True, verbose_name="ID")
+    tipo = models.CharField(max_length=50, verbose_name="Tipo de Relatório")
+    formato = models.CharField(
+        max_length=10,
+        choices=[
+            ('csv', 'CSV'),
+            ('excel', 'Excel'),
+            ('csv.gz', 'CSV compactado (gzip)'),
+            ('parquet', 'Parquet'),
+        ],
+        verbose_name="Formato"
+    )
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDENTE, verbose_name="Status")
+    fk_usuario = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        db_column='fk_usuario',
+        verbose_name="Solicitante"
+    )
+    nome_arquivo = models.CharField(max_length=255, verbose_name="Nome do Arquivo")
+    arquivo = models.CharField(
+        max_length=255,
+        blank=True,
+        default='',
+        verbose_name="Arquivo Gerado",
+        help_text="Caminho relativo a RELATORIOS_DIR"
+    )
+    filtros = models.JSONField(default=dict, blank=True, verbose_name="Filtros")
+    linhas_processadas = models.PositiveIntegerField(default=0, verbose_name="Linhas Processadas")
+    erro = models.TextField(null=True, blank=True, verbose_name="Erro")
+    iniciado_em = models.DateTimeField(null=True, blank=True, verbose_name="Início do Processamento")
+    concluido_em = models.DateTimeField(null=True, blank=True, verbose_name="Fim do Processamento")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Data de Criação")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Data de Atualização")
+
+    class Meta:
+        db_table = "relatorio_jobs"
+        verbose_name = "Relatório em Segundo Plano"
+        verbose_name_plural = "Relatórios em Segundo Plano"
+        ordering = ['-created_at']
+        indexes = [
+            # Fila do worker: próximo job pendente mais antigo
+            models.Index(fields=['status', 'created_at'], name='idx_relatorio_job_fila'),
+        ]
+
+    def __str__(self):
+        return f"{self.tipo} ({self.formato}) - {self.get_status_display()}"
+
+
+class RegistroExclusao(models.Model):
+    """
+    Registro de exclusão (tombstone) gravado pelo signal post_delete dos modelos
+    exportados de forma incremental: a API de delta informa as exclusões desde
+    o cursor para o BI remover as linhas correspondentes.
+    """
+    pk_registro_exclusao = models.BigAutoField(primary_key=True, verbose_name="ID")
+    modelo = models.CharField(max_length=100, verbose_name="Modelo")  # app_label.model_name
+    registro_id = models.BigIntegerField(verbose_name="ID do Registro Excluído")
+    excluido_em = models.DateTimeField(auto_now_add=True, verbose_name="Excluído em")
+
+    class Meta:
+        db_table = "registro_exclusoes"
+        verbose_name = "Registro de Exclusão"
+        verbose_name_plural = "Registros de Exclusão"
+        indexes = [
+            # Exclusões de um modelo desde o cursor
+            models.Index(fields=['modelo', 'excluido_em'], name='idx_exclusao_modelo_data'),
+        ]
+
+    def __str__(self):
+        return f"{self.modelo} #{self.registro_id} excluído em {self.excluido_em}"
+
+
+class VersaoDados(models.Model):
+    """
+    Versões dos dados usadas nas chaves dos caches de métricas e de relatórios
+    e no ETag do dashboard. Ficam no banco para valer em todos os processos
+    (workers do gunicorn) e sobreviver a reinícios; a ausência da linha
+    equivale à versão 1.
+    """
+    chave = models.CharField(max_length=150, primary_key=True, verbose_name="Chave")
+    versao = models.BigIntegerField(default=1, verbose_name="Versão")
+    modificado_em = models.DateTimeField(default=timezone.now, verbose_name="Última Alteração")
+
+    class Meta:
+        db_table = "versoes_dados"
+        verbose_name = "Versão dos Dados"
+        verbose_name_plural = "Versões dos Dados"
+
+    def __str__(self):
+        return f"{self.chave}: v{self.versao}"
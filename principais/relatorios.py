@@ -0,0 +1,1233 @@
+import csv
+import importlib.util
+import itertools
+import queue
+import tempfile
+import threading
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import connection, connections
+from django.db.models import Case, CharField, F, Func, Value, When
+from django.db.models.functions import Cast, NullIf
+from django.http import StreamingHttpResponse, FileResponse
+from django.utils import timezone
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill, Border, Side, NamedStyle
+from openpyxl.utils import get_column_letter
+from . import models, materializadas
+from .filtros_relatorio import (
+    RELATORIO_COMPLETO, filtro_relatorio, filtro_pacientes_captacao, filtros_dashboard, filtros_metricas_terapeuta
+)
+
+# Linhas acumuladas antes de cada envio ao cliente
+LINHAS_POR_ENVIO = 500
+
+
+def _iterar(queryset, *campos):
+    """Tuplas dos campos pedidos, lidas do banco em blocos (sem cache de instâncias)"""
+    return queryset.values_list(*campos).iterator(chunk_size=settings.RELATORIOS_CHUNK_SIZE)
+
+
+def _vazio(valor):
+    return valor or ''
+
+
+# Modelo principal de cada relatório lido direto da tabela
+MODELOS_RELATORIO = {
+    'associado': models.Associado,
+    'paciente': models.Paciente,
+    'terapeuta': models.Terapeuta,
+    'avaliacao': models.Avaliacao,
+    'consulta': models.Consulta,
+    'altadesistencia': models.Altadesistencia,
+    'selecao': models.Selecao,
+}
+
+
+def _registros(tipo, filtros):
+    """Queryset do relatório com os filtros no WHERE (datas, clínica, terapeuta...)"""
+    queryset = MODELOS_RELATORIO[tipo].objects.filter(filtro_relatorio(tipo, filtros))
+    # Sem ordering no modelo a ordem ficaria a critério do plano: o COPY e o caminho
+    # padrão (e as exportações repetidas) sairiam com as linhas em ordens diferentes
+    return queryset if queryset.ordered else queryset.order_by('pk')
+
+
+def _captacoes(filtros):
+    return materializadas.captacoes_com_contagem(filtro_pacientes_captacao(filtros))
+
+
+def _totais_dashboard(filtros):
+    """(resumo de consultas, pacientes ativos, terapeutas ativos) com os filtros"""
+    consultas, pacientes, terapeutas = filtros_dashboard(filtros)
+    return (
+        materializadas.resumo_consultas(consultas),
+        models.Paciente.objects.filter(pacientes, is_active=True).count(),
+        models.Terapeuta.objects.filter(terapeutas, is_active=True).count(),
+    )
+
+
+def _metricas_terapeuta(filtros):
+    return materializadas.metricas_por_terapeuta(*filtros_metricas_terapeuta(filtros))
+
+
+# LINHAS CSV - cabeçalho seguido das linhas de dados de cada relatório
+def _csv_associado(filtros):
+    yield ['ID', 'Nome', 'Email', 'Telefone', 'CPF', 'Endereco', 'Sexo', 'Data Nascimento', 'Setores', 'Ativo', 'Data Criacao']
+    # Setores (M2M) vêm por prefetch a cada bloco do iterator
+    associados = _registros('associado', filtros).only(
+        'pk_associado', 'nome', 'email', 'telefone', 'cpf', 'endereco', 'sexo',
+        'dat_nascimento', 'is_active', 'created_at'
+    ).prefetch_related('setores').iterator(chunk_size=settings.RELATORIOS_CHUNK_SIZE)
+    for assoc in associados:
+        setores = ', '.join([setor.setor for setor in assoc.setores.all()])
+        yield [
+            assoc.pk_associado, assoc.nome, assoc.email or '', assoc.telefone,
+            assoc.cpf or '', assoc.endereco, assoc.sexo,
+            assoc.dat_nascimento or '', setores, assoc.is_active, assoc.created_at
+        ]
+
+
+def _csv_altadesistencia(filtros):
+    yield [
+        'ID', 'Terapeuta', 'Paciente', 'Data Sessão', 'Cancelador',
+        'Motivo Cancelamento', 'Momento', 'Alta/Desistência', 'Data Criação'
+    ]
+    linhas = _iterar(
+        _registros('altadesistencia', filtros),
+        'pk_alta_desistencia', 'fk_terapeuta__fk_associado__nome', 'fk_paciente__nome',
+        'dat_sessao', 'cancelador', 'motivo_cancel', 'momento', 'alta_desistencia', 'created_at'
+    )
+    for pk, terapeuta, paciente, dat_sessao, cancelador, motivo, momento, alta, created_at in linhas:
+        yield [
+            pk, terapeuta, paciente, _vazio(dat_sessao), _vazio(cancelador),
+            _vazio(motivo), _vazio(momento), _vazio(alta), created_at
+        ]
+
+
+CAMPOS_AVALIACAO_SELECAO = (
+    'estagio_mudanca', 'estrutura', 'encerramento', 'acolhimento', 'seguranca_terapeuta',
+    'seguranca_metodo', 'aprofundar', 'hipoteses', 'interpretacao', 'frase_timing',
+    'corpo_setting', 'insight_potencia',
+)
+
+
+def _csv_selecao(filtros):
+    yield [
+        'ID', 'Avaliador', 'Avaliado', 'Data Avaliação', 'Estágio Mudança',
+        'Estrutura', 'Encerramento', 'Acolhimento', 'Segurança Terapeuta',
+        'Segurança Método', 'Aprofundar', 'Hipóteses', 'Interpretação',
+        'Frase & Timing', 'Corpo & Setting', 'Insight & Potência',
+        'Média Geral', 'Data Criação'
+    ]
+    linhas = _iterar(
+        _registros('selecao', filtros),
+        'pk_selecao', 'fk_terapeuta_avaliador__fk_associado__nome', 'fk_associado_avaliado__nome',
+        'dat_avaliacao', *CAMPOS_AVALIACAO_SELECAO
+    )
+    for pk, avaliador, avaliado, dat_avaliacao, *notas in linhas:
+        media_geral = sum(notas) / len(notas)
+        # Selecao não tem created_at: a coluna é mantida vazia por compatibilidade
+        yield [pk, avaliador, avaliado, dat_avaliacao, *notas, f'{media_geral:.2f}', '']
+
+
+def _csv_captacao(filtros):
+    captacoes_com_contagem = _captacoes(filtros)
+
+    yield [
+        'ID', 'Nome da Captação', 'Pacientes Ativos', 'Pacientes Inativos',
+        'Total de Pacientes', 'Ativo', 'Data Criação'
+    ]
+    for captacao in captacoes_com_contagem:
+        yield [
+            captacao.pk_captacao,
+            captacao.nome,
+            captacao.total_pacientes,
+            captacao.total_pacientes_inativos,
+            captacao.total_geral,
+            'Sim' if captacao.is_active else 'Não',
+            captacao.created_at
+        ]
+
+    # Estatísticas resumo
+    yield []
+    yield ['=== ESTATÍSTICAS RESUMO ===']
+
+    total_captacoes_ativas = captacoes_com_contagem.filter(is_active=True).count()
+    total_captacoes_inativas = captacoes_com_contagem.filter(is_active=False).count()
+    captacao_mais_usada = captacoes_com_contagem.first()
+
+    yield ['Total de Captações Ativas', total_captacoes_ativas]
+    yield ['Total de Captações Inativas', total_captacoes_inativas]
+    if captacao_mais_usada:
+        yield ['Captação Mais Utilizada', f'{captacao_mais_usada.nome} ({captacao_mais_usada.total_pacientes} pacientes)']
+
+
+def _csv_paciente(filtros):
+    yield ['ID', 'Nome', 'Email', 'Telefone', 'Clinica', 'Modalidade', 'Captacao', 'Valor Sessao', 'Data Nascimento', 'Ativo', 'Data Criacao']
+    linhas = _iterar(
+        _registros('paciente', filtros),
+        'pk_paciente', 'nome', 'email', 'telefone', 'fk_clinica__clinica', 'fk_modalidade__modalidade',
+        'fk_captacao__nome', 'vlr_sessao', 'dat_nascimento', 'is_active', 'created_at'
+    )
+    for pk, nome, email, telefone, clinica, modalidade, captacao, vlr_sessao, dat_nascimento, ativo, created_at in linhas:
+        yield [
+            pk, nome, _vazio(email), telefone, clinica, modalidade, captacao,
+            vlr_sessao, _vazio(dat_nascimento), ativo, created_at
+        ]
+
+
+def _csv_terapeuta(filtros):
+    yield ['ID', 'Nome', 'Decano', 'Abordagem', 'Nucleo', 'Clinica', 'Modalidade', 'Ativo', 'Data Criacao']
+    yield from _iterar(
+        _registros('terapeuta', filtros),
+        'pk_terapeuta', 'fk_associado__nome', 'fk_decano__nome', 'fk_abordagem__abordagem',
+        'fk_nucleo__nucleo', 'fk_clinica__clinica', 'fk_modalidade__modalidade', 'is_active', 'created_at'
+    )
+
+
+def _csv_avaliacao(filtros):
+    yield ['ID', 'Terapeuta', 'Paciente', 'Data Consulta', 'Individual', 'Interpessoal', 'Social', 'Geral', 'Qualidade Geral', 'Momento', 'Data Criacao']
+    linhas = _iterar(
+        _registros('avaliacao', filtros),
+        'pk_avaliacao', 'fk_terapeuta__fk_associado__nome', 'fk_paciente__nome', 'dat_consulta',
+        'individual', 'interpessoal', 'social', 'geral', 'qualidade_geral', 'momento', 'created_at'
+    )
+    for pk, terapeuta, paciente, dat_consulta, individual, interpessoal, social, geral, qualidade, momento, created_at in linhas:
+        yield [
+            pk, terapeuta, paciente, dat_consulta, _vazio(individual), _vazio(interpessoal),
+            _vazio(social), _vazio(geral), _vazio(qualidade), momento, created_at
+        ]
+
+
+def _csv_consulta(filtros):
+    yield ['ID', 'Terapeuta', 'Paciente', 'Data Consulta', 'Valor Consulta', 'Valor Pago', 'Realizada', 'Data Criacao']
+    linhas = _iterar(
+        _registros('consulta', filtros),
+        'pk_consulta', 'fk_terapeuta__fk_associado__nome', 'fk_paciente__nome', 'dat_consulta',
+        'vlr_consulta', 'vlr_pago', 'is_realizado', 'created_at'
+    )
+    for pk, terapeuta, paciente, dat_consulta, vlr_consulta, vlr_pago, realizado, created_at in linhas:
+        yield [pk, terapeuta, paciente, dat_consulta, vlr_consulta, _vazio(vlr_pago), realizado, created_at]
+
+
+def _csv_dashboard(filtros):
+    resumo, pacientes_ativos, terapeutas_ativos = _totais_dashboard(filtros)
+    total_consultas_marcadas = resumo['total_consultas_marcadas']
+    total_consultas_realizadas = resumo['total_consultas_realizadas']
+    taxa_adesao = (total_consultas_realizadas / total_consultas_marcadas * 100) if total_consultas_marcadas > 0 else 0
+    receita_total = resumo['receita_total'] or 0
+
+    yield ['Metrica', 'Valor']
+    yield ['Total Consultas Marcadas', total_consultas_marcadas]
+    yield ['Total Consultas Realizadas', total_consultas_realizadas]
+    yield ['Taxa de Adesao (%)', f'{taxa_adesao:.2f}']
+    yield ['Receita Total Recebida', f'{receita_total:.2f}']
+    yield ['Pacientes Ativos', pacientes_ativos]
+    yield ['Terapeutas Ativos', terapeutas_ativos]
+    yield ['Data Geracao', timezone.now().strftime('%Y-%m-%d %H:%M:%S')]
+
+
+def _csv_metricas_terapeuta(filtros):
+    yield ['Terapeuta', 'Pacientes Ativos', 'Consultas Marcadas', 'Consultas Realizadas', 'Taxa Adesao (%)', 'Valor Recebido', 'Receita Acordada']
+    for metrica in _metricas_terapeuta(filtros):
+        consultas_marcadas = metrica['consultas_marcadas']
+        taxa_adesao = (metrica['consultas_realizadas'] / consultas_marcadas * 100) if consultas_marcadas > 0 else 0
+        yield [
+            metrica['nome'],
+            metrica['pacientes_ativos'],
+            consultas_marcadas,
+            metrica['consultas_realizadas'],
+            f'{taxa_adesao:.2f}',
+            f'{metrica["valor_recebido"]:.2f}',
+            f'{metrica["receita_acordada"]:.2f}'
+        ]
+
+
+RELATORIOS_CSV = {
+    'associado': _csv_associado,
+    'paciente': _csv_paciente,
+    'terapeuta': _csv_terapeuta,
+    'avaliacao': _csv_avaliacao,
+    'consulta': _csv_consulta,
+    'dashboard': _csv_dashboard,
+    'metricas_terapeuta': _csv_metricas_terapeuta,
+    'altadesistencia': _csv_altadesistencia,
+    'selecao': _csv_selecao,
+    'captacao': _csv_captacao,
+}
+
+
+class _Eco:
+    """Pseudo-arquivo: csv.writer devolve a linha formatada em vez de gravá-la"""
+
+    def write(self, valor):
+        return valor
+
+
+def _conteudo_csv(linhas, bom=True):
+    writer = csv.writer(_Eco())
+    if bom:
+        yield '\ufeff'  # BOM para UTF-8 (Excel)
+
+    bloco = []
+    for linha in linhas:
+        bloco.append(writer.writerow(linha))
+        if len(bloco) >= LINHAS_POR_ENVIO:
+            yield ''.join(bloco)
+            bloco = []
+    if bloco:
+        yield ''.join(bloco)
+
+
+def _com_progresso(linhas, progresso):
+    """Repassa as linhas avisando progresso(total) a cada LINHAS_POR_ENVIO linhas"""
+    total = 0
+    for linha in linhas:
+        yield linha
+        total += 1
+        if total % LINHAS_POR_ENVIO == 0:
+            progresso(total)
+    progresso(total)
+
+
+def _com_progresso_somado(membros, progresso):
+    """Como _com_progresso, somando as linhas de vários relatórios gravados em sequência"""
+    total = 0
+
+    def contar(linhas):
+        nonlocal total
+        for linha in linhas:
+            yield linha
+            total += 1
+            if total % LINHAS_POR_ENVIO == 0:
+                progresso(total)
+        progresso(total)
+
+    return [contar(linhas) for linhas in membros]
+
+
+def resposta_streaming(tipo, formato, filename, filtros=None):
+    """
+    StreamingHttpResponse com o relatório em CSV ou CSV.gz: o primeiro byte
+    sai antes da primeira query terminar e a memória não cresce com o
+    tamanho da tabela.
+    """
+    response = StreamingHttpResponse(blocos_streaming(tipo, formato, filtros), content_type=content_type(tipo, formato))
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+# EXCEL - workbooks write-only (linhas vão direto para arquivo temporário)
+
+# Linhas usadas para medir as larguras das colunas: o write-only grava as
+# larguras antes da primeira linha, então elas saem do cabeçalho + início dos dados
+LINHAS_AMOSTRA_LARGURA = 1000
+LARGURA_MAXIMA = 50
+EXCEL_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+class Titulo(list):
+    """Linha destacada no meio da planilha (ex.: início do resumo)"""
+
+
+def _data(valor):
+    return valor.strftime('%d/%m/%Y') if valor else ''
+
+
+def _data_hora(valor):
+    return valor.strftime('%d/%m/%Y %H:%M')
+
+
+def _sim_nao(valor):
+    return 'Sim' if valor else 'Não'
+
+
+def _excel_associado(filtros):
+    yield ['ID', 'Nome', 'Email', 'Telefone', 'CPF', 'Endereço', 'Sexo', 'Data Nascimento', 'Setores', 'Ativo', 'Data Criação']
+    associados = _registros('associado', filtros).only(
+        'pk_associado', 'nome', 'email', 'telefone', 'cpf', 'endereco', 'sexo',
+        'dat_nascimento', 'is_active', 'created_at'
+    ).prefetch_related('setores').iterator(chunk_size=settings.RELATORIOS_CHUNK_SIZE)
+    for assoc in associados:
+        setores = ', '.join([setor.setor for setor in assoc.setores.all()])
+        yield [
+            assoc.pk_associado, assoc.nome, assoc.email or '', assoc.telefone,
+            assoc.cpf or '', assoc.endereco, assoc.sexo,
+            assoc.dat_nascimento or '', setores, _sim_nao(assoc.is_active),
+            _data_hora(assoc.created_at)
+        ]
+
+
+def _excel_altadesistencia(filtros):
+    yield [
+        'ID', 'Terapeuta', 'Paciente', 'Data Sessão', 'Cancelador',
+        'Motivo Cancelamento', 'Momento', 'Alta/Desistência', 'Data Criação'
+    ]
+    linhas = _iterar(
+        _registros('altadesistencia', filtros),
+        'pk_alta_desistencia', 'fk_terapeuta__fk_associado__nome', 'fk_paciente__nome',
+        'dat_sessao', 'cancelador', 'motivo_cancel', 'momento', 'alta_desistencia', 'created_at'
+    )
+    for pk, terapeuta, paciente, dat_sessao, cancelador, motivo, momento, alta, created_at in linhas:
+        yield [
+            pk, terapeuta, paciente, _data(dat_sessao), _vazio(cancelador),
+            _vazio(motivo), _vazio(momento), _vazio(alta), _data_hora(created_at)
+        ]
+
+
+def _excel_selecao(filtros):
+    yield [
+        'ID', 'Avaliador', 'Avaliado', 'Data Avaliação', 'Estágio Mudança',
+        'Estrutura', 'Encerramento', 'Acolhimento', 'Segurança Terapeuta',
+        'Segurança Método', 'Aprofundar', 'Hipóteses', 'Interpretação',
+        'Frase & Timing', 'Corpo & Setting', 'Insight & Potência',
+        'Média Geral'
+    ]
+    linhas = _iterar(
+        _registros('selecao', filtros),
+        'pk_selecao', 'fk_terapeuta_avaliador__fk_associado__nome', 'fk_associado_avaliado__nome',
+        'dat_avaliacao', *CAMPOS_AVALIACAO_SELECAO
+    )
+    for pk, avaliador, avaliado, dat_avaliacao, *notas in linhas:
+        media_geral = sum(notas) / len(notas)
+        yield [pk, avaliador, avaliado, _data(dat_avaliacao), *notas, f'{media_geral:.2f}']
+
+
+def _excel_captacao(filtros):
+    captacoes_com_contagem = _captacoes(filtros)
+
+    yield [
+        'ID', 'Nome da Captação', 'Pacientes Ativos', 'Pacientes Inativos',
+        'Total de Pacientes', 'Ativo', 'Data Criação'
+    ]
+    for captacao in captacoes_com_contagem:
+        yield [
+            captacao.pk_captacao,
+            captacao.nome,
+            captacao.total_pacientes,
+            captacao.total_pacientes_inativos,
+            captacao.total_geral,
+            _sim_nao(captacao.is_active),
+            _data_hora(captacao.created_at)
+        ]
+
+    # Estatísticas resumo (duas linhas em branco antes)
+    yield []
+    yield []
+    yield Titulo(['ESTATÍSTICAS RESUMO'])
+
+    captacao_mais_usada = captacoes_com_contagem.first()
+    yield ['Total de Captações Ativas', captacoes_com_contagem.filter(is_active=True).count()]
+    yield ['Total de Captações Inativas', captacoes_com_contagem.filter(is_active=False).count()]
+    if captacao_mais_usada:
+        yield ['Captação Mais Utilizada', f'{captacao_mais_usada.nome} ({captacao_mais_usada.total_pacientes} pacientes)']
+
+
+def _excel_paciente(filtros):
+    yield ['ID', 'Nome', 'Email', 'Telefone', 'Clínica', 'Modalidade', 'Captação', 'Valor Sessão', 'Data Nascimento', 'Ativo', 'Data Criação']
+    linhas = _iterar(
+        _registros('paciente', filtros),
+        'pk_paciente', 'nome', 'email', 'telefone', 'fk_clinica__clinica', 'fk_modalidade__modalidade',
+        'fk_captacao__nome', 'vlr_sessao', 'dat_nascimento', 'is_active', 'created_at'
+    )
+    for pk, nome, email, telefone, clinica, modalidade, captacao, vlr_sessao, dat_nascimento, ativo, created_at in linhas:
+        yield [
+            pk, nome, _vazio(email), telefone, clinica, modalidade, captacao,
+            float(vlr_sessao), _vazio(dat_nascimento), _sim_nao(ativo), _data_hora(created_at)
+        ]
+
+
+def _excel_terapeuta(filtros):
+    yield ['ID', 'Nome', 'Decano', 'Abordagem', 'Núcleo', 'Clínica', 'Modalidade', 'Ativo', 'Data Criação']
+    linhas = _iterar(
+        _registros('terapeuta', filtros),
+        'pk_terapeuta', 'fk_associado__nome', 'fk_decano__nome', 'fk_abordagem__abordagem',
+        'fk_nucleo__nucleo', 'fk_clinica__clinica', 'fk_modalidade__modalidade', 'is_active', 'created_at'
+    )
+    for *dados, ativo, created_at in linhas:
+        yield [*dados, _sim_nao(ativo), _data_hora(created_at)]
+
+
+def _excel_avaliacao(filtros):
+    yield ['ID', 'Terapeuta', 'Paciente', 'Data Consulta', 'Individual', 'Interpessoal', 'Social', 'Geral', 'Qualidade Geral', 'Momento', 'Data Criação']
+    linhas = _iterar(
+        _registros('avaliacao', filtros),
+        'pk_avaliacao', 'fk_terapeuta__fk_associado__nome', 'fk_paciente__nome', 'dat_consulta',
+        'individual', 'interpessoal', 'social', 'geral', 'qualidade_geral', 'momento', 'created_at'
+    )
+    for pk, terapeuta, paciente, dat_consulta, individual, interpessoal, social, geral, qualidade, momento, created_at in linhas:
+        yield [
+            pk, terapeuta, paciente, _data(dat_consulta), _vazio(individual), _vazio(interpessoal),
+            _vazio(social), _vazio(geral), _vazio(qualidade), momento, _data_hora(created_at)
+        ]
+
+
+def _excel_consulta(filtros):
+    yield ['ID', 'Terapeuta', 'Paciente', 'Data Consulta', 'Valor Consulta', 'Valor Pago', 'Realizada', 'Data Criação']
+    linhas = _iterar(
+        _registros('consulta', filtros),
+        'pk_consulta', 'fk_terapeuta__fk_associado__nome', 'fk_paciente__nome', 'dat_consulta',
+        'vlr_consulta', 'vlr_pago', 'is_realizado', 'created_at'
+    )
+    for pk, terapeuta, paciente, dat_consulta, vlr_consulta, vlr_pago, realizado, created_at in linhas:
+        yield [
+            pk, terapeuta, paciente, _data(dat_consulta), float(vlr_consulta),
+            float(vlr_pago) if vlr_pago else '', _sim_nao(realizado), _data_hora(created_at)
+        ]
+
+
+def _excel_dashboard(filtros):
+    resumo, pacientes_ativos, terapeutas_ativos = _totais_dashboard(filtros)
+    total_consultas_marcadas = resumo['total_consultas_marcadas']
+    total_consultas_realizadas = resumo['total_consultas_realizadas']
+    taxa_adesao = (total_consultas_realizadas / total_consultas_marcadas * 100) if total_consultas_marcadas > 0 else 0
+    receita_total = resumo['receita_total'] or 0
+
+    yield ['Métrica', 'Valor']
+    yield ['Total Consultas Marcadas', total_consultas_marcadas]
+    yield ['Total Consultas Realizadas', total_consultas_realizadas]
+    yield ['Taxa de Adesão (%)', f'{taxa_adesao:.2f}%']
+    yield ['Receita Total Recebida', f'R$ {receita_total:.2f}']
+    yield ['Pacientes Ativos', pacientes_ativos]
+    yield ['Terapeutas Ativos', terapeutas_ativos]
+    yield ['Data Geração', timezone.now().strftime('%d/%m/%Y %H:%M:%S')]
+
+
+def _excel_metricas_terapeuta(filtros):
+    yield ['Terapeuta', 'Pacientes Ativos', 'Consultas Marcadas', 'Consultas Realizadas', 'Taxa Adesão (%)', 'Valor Recebido (R$)', 'Receita Acordada (R$)']
+    for metrica in _metricas_terapeuta(filtros):
+        consultas_marcadas = metrica['consultas_marcadas']
+        taxa_adesao = (metrica['consultas_realizadas'] / consultas_marcadas * 100) if consultas_marcadas > 0 else 0
+        yield [
+            metrica['nome'],
+            metrica['pacientes_ativos'],
+            consultas_marcadas,
+            metrica['consultas_realizadas'],
+            f'{taxa_adesao:.2f}%',
+            f'R$ {metrica["valor_recebido"]:.2f}',
+            f'R$ {metrica["receita_acordada"]:.2f}'
+        ]
+
+
+# tipo -> (título da planilha, gerador de linhas, larguras fixas ou None para medir)
+RELATORIOS_EXCEL = {
+    'associado': ('Associados', _excel_associado, None),
+    'paciente': ('Pacientes', _excel_paciente, None),
+    'terapeuta': ('Terapeutas', _excel_terapeuta, None),
+    'avaliacao': ('Avaliações', _excel_avaliacao, None),
+    'consulta': ('Consultas', _excel_consulta, None),
+    'dashboard': ('Dashboard Métricas', _excel_dashboard, [30, 20]),
+    'metricas_terapeuta': ('Métricas por Terapeuta', _excel_metricas_terapeuta, None),
+    'altadesistencia': ('Alta_Desistencia', _excel_altadesistencia, None),
+    'selecao': ('Selecoes', _excel_selecao, None),
+    'captacao': ('Captacoes', _excel_captacao, None),
+}
+
+
+def _criar_workbook():
+    """Workbook write-only com os estilos nomeados compartilhados por todas as células"""
+    wb = Workbook(write_only=True)
+    fonte = Font(bold=True, color="FFFFFF")
+    preenchimento = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+    borda = Border(
+        left=Side(style='thin'),
+        right=Side(style='thin'),
+        top=Side(style='thin'),
+        bottom=Side(style='thin')
+    )
+    wb.add_named_style(NamedStyle(name='relatorio_cabecalho', font=fonte, fill=preenchimento, border=borda))
+    wb.add_named_style(NamedStyle(name='relatorio_titulo', font=fonte, fill=preenchimento))
+    wb.add_named_style(NamedStyle(name='relatorio_dado', border=borda))
+    return wb
+
+
+def _celulas(ws, valores, estilo):
+    celulas = []
+    for valor in valores:
+        celula = WriteOnlyCell(ws, value=valor)
+        celula.style = estilo
+        celulas.append(celula)
+    return celulas
+
+
+def _medir(larguras, linha):
+    for indice, valor in enumerate(linha):
+        tamanho = len(str(valor))
+        if indice >= len(larguras):
+            larguras.append(tamanho)
+        elif tamanho > larguras[indice]:
+            larguras[indice] = tamanho
+
+
+def gravar_planilha(wb, titulo, linhas, larguras_fixas=None):
+    """
+    Grava as linhas (cabeçalho primeiro) em uma nova planilha write-only.
+    As larguras são medidas enquanto as primeiras linhas chegam; o restante
+    passa direto para o arquivo, sem manter células em memória.
+    """
+    ws = wb.create_sheet(title=titulo)
+    linhas = iter(linhas)
+    cabecalho = next(linhas)
+
+    amostra = list(itertools.islice(linhas, LINHAS_AMOSTRA_LARGURA))
+    if larguras_fixas:
+        larguras = [largura - 2 for largura in larguras_fixas]
+    else:
+        larguras = []
+        _medir(larguras, cabecalho)
+        for linha in amostra:
+            _medir(larguras, linha)
+    for indice, largura in enumerate(larguras, 1):
+        ws.column_dimensions[get_column_letter(indice)].width = min(largura + 2, LARGURA_MAXIMA)
+
+    ws.append(_celulas(ws, cabecalho, 'relatorio_cabecalho'))
+    for linha in itertools.chain(amostra, linhas):
+        estilo = 'relatorio_titulo' if isinstance(linha, Titulo) else 'relatorio_dado'
+        ws.append(_celulas(ws, linha, estilo))
+    return ws
+
+
+def _gravar_excel(tipo, arquivo, linhas):
+    titulo, _, larguras_fixas = RELATORIOS_EXCEL[tipo]
+    wb = _criar_workbook()
+    gravar_planilha(wb, titulo, linhas, larguras_fixas)
+    wb.save(arquivo)
+
+
+# COLUNAR - parquet e csv.gz para BI (pandas/DuckDB): colunas tipadas, sem formatação
+
+# (nome da coluna, campo em values_list, tipo)
+COLUNAS_CONSULTA = [
+    ('id', 'pk_consulta', 'int'),
+    ('terapeuta', 'fk_terapeuta__fk_associado__nome', 'string'),
+    ('paciente', 'fk_paciente__nome', 'string'),
+    ('dat_consulta', 'dat_consulta', 'date'),
+    ('vlr_consulta', 'vlr_consulta', 'decimal'),
+    ('vlr_pago', 'vlr_pago', 'decimal'),
+    ('realizada', 'is_realizado', 'bool'),
+    ('created_at', 'created_at', 'timestamp'),
+]
+COLUNAS_PACIENTE = [
+    ('id', 'pk_paciente', 'int'),
+    ('nome', 'nome', 'string'),
+    ('email', 'email', 'string'),
+    ('telefone', 'telefone', 'string'),
+    ('clinica', 'fk_clinica__clinica', 'string'),
+    ('modalidade', 'fk_modalidade__modalidade', 'string'),
+    ('captacao', 'fk_captacao__nome', 'string'),
+    ('vlr_sessao', 'vlr_sessao', 'decimal'),
+    ('dat_nascimento', 'dat_nascimento', 'date'),
+    ('ativo', 'is_active', 'bool'),
+    ('created_at', 'created_at', 'timestamp'),
+]
+COLUNAS_TERAPEUTA = [
+    ('id', 'pk_terapeuta', 'int'),
+    ('nome', 'fk_associado__nome', 'string'),
+    ('decano', 'fk_decano__nome', 'string'),
+    ('abordagem', 'fk_abordagem__abordagem', 'string'),
+    ('nucleo', 'fk_nucleo__nucleo', 'string'),
+    ('clinica', 'fk_clinica__clinica', 'string'),
+    ('modalidade', 'fk_modalidade__modalidade', 'string'),
+    ('ativo', 'is_active', 'bool'),
+    ('created_at', 'created_at', 'timestamp'),
+]
+COLUNAS_AVALIACAO = [
+    ('id', 'pk_avaliacao', 'int'),
+    ('terapeuta', 'fk_terapeuta__fk_associado__nome', 'string'),
+    ('paciente', 'fk_paciente__nome', 'string'),
+    ('dat_consulta', 'dat_consulta', 'date'),
+    ('individual', 'individual', 'int'),
+    ('interpessoal', 'interpessoal', 'int'),
+    ('social', 'social', 'int'),
+    ('geral', 'geral', 'int'),
+    ('qualidade_geral', 'qualidade_geral', 'int'),
+    ('momento', 'momento', 'string'),
+    ('created_at', 'created_at', 'timestamp'),
+]
+COLUNAS_ALTADESISTENCIA = [
+    ('id', 'pk_alta_desistencia', 'int'),
+    ('terapeuta', 'fk_terapeuta__fk_associado__nome', 'string'),
+    ('paciente', 'fk_paciente__nome', 'string'),
+    ('dat_sessao', 'dat_sessao', 'date'),
+    ('cancelador', 'cancelador', 'string'),
+    ('motivo_cancelamento', 'motivo_cancel', 'string'),
+    ('momento', 'momento', 'string'),
+    ('alta_desistencia', 'alta_desistencia', 'string'),
+    ('created_at', 'created_at', 'timestamp'),
+]
+COLUNAS_CAPTACAO = [
+    ('id', 'pk_captacao', 'int'),
+    ('nome', 'nome', 'string'),
+    ('pacientes_ativos', 'total_pacientes', 'int'),
+    ('pacientes_inativos', 'total_pacientes_inativos', 'int'),
+    ('total_pacientes', 'total_geral', 'int'),
+    ('ativo', 'is_active', 'bool'),
+    ('created_at', 'created_at', 'timestamp'),
+]
+
+
+def _por_campos(colunas, registros):
+    """Relatório colunar lido direto de values_list: (colunas, gerador de tuplas)"""
+    return (
+        [(nome, tipo) for nome, _, tipo in colunas],
+        lambda filtros: _iterar(registros(filtros), *[campo for _, campo, _ in colunas]),
+    )
+
+
+def _colunar_associado(filtros):
+    associados = _registros('associado', filtros).only(
+        'pk_associado', 'nome', 'email', 'telefone', 'cpf', 'endereco', 'sexo',
+        'dat_nascimento', 'is_active', 'created_at'
+    ).prefetch_related('setores').iterator(chunk_size=settings.RELATORIOS_CHUNK_SIZE)
+    for assoc in associados:
+        yield (
+            assoc.pk_associado, assoc.nome, assoc.email, assoc.telefone, assoc.cpf,
+            assoc.endereco, assoc.sexo, assoc.dat_nascimento,
+            ', '.join([setor.setor for setor in assoc.setores.all()]),
+            assoc.is_active, assoc.created_at
+        )
+
+
+def _colunar_selecao(filtros):
+    linhas = _iterar(
+        _registros('selecao', filtros),
+        'pk_selecao', 'fk_terapeuta_avaliador__fk_associado__nome', 'fk_associado_avaliado__nome',
+        'dat_avaliacao', *CAMPOS_AVALIACAO_SELECAO
+    )
+    for pk, avaliador, avaliado, dat_avaliacao, *notas in linhas:
+        yield (pk, avaliador, avaliado, dat_avaliacao, *notas, sum(notas) / len(notas))
+
+
+def _colunar_dashboard(filtros):
+    resumo, pacientes_ativos, terapeutas_ativos = _totais_dashboard(filtros)
+    total_consultas_marcadas = resumo['total_consultas_marcadas']
+    total_consultas_realizadas = resumo['total_consultas_realizadas']
+    taxa_adesao = (total_consultas_realizadas / total_consultas_marcadas * 100) if total_consultas_marcadas > 0 else 0
+
+    yield ('total_consultas_marcadas', float(total_consultas_marcadas))
+    yield ('total_consultas_realizadas', float(total_consultas_realizadas))
+    yield ('taxa_adesao', float(taxa_adesao))
+    yield ('receita_total_recebida', float(resumo['receita_total'] or 0))
+    yield ('pacientes_ativos', float(pacientes_ativos))
+    yield ('terapeutas_ativos', float(terapeutas_ativos))
+
+
+def _colunar_metricas_terapeuta(filtros):
+    for metrica in _metricas_terapeuta(filtros):
+        consultas_marcadas = metrica['consultas_marcadas']
+        taxa_adesao = (metrica['consultas_realizadas'] / consultas_marcadas * 100) if consultas_marcadas > 0 else 0
+        yield (
+            metrica['nome'], metrica['pacientes_ativos'], consultas_marcadas,
+            metrica['consultas_realizadas'], float(taxa_adesao),
+            metrica['valor_recebido'], metrica['receita_acordada']
+        )
+
+
+# tipo -> ([(coluna, tipo)], gerador de tuplas na ordem das colunas)
+RELATORIOS_COLUNARES = {
+    'associado': (
+        [
+            ('id', 'int'), ('nome', 'string'), ('email', 'string'), ('telefone', 'string'),
+            ('cpf', 'string'), ('endereco', 'string'), ('sexo', 'string'), ('dat_nascimento', 'date'),
+            ('setores', 'string'), ('ativo', 'bool'), ('created_at', 'timestamp'),
+        ],
+        _colunar_associado,
+    ),
+    'paciente': _por_campos(COLUNAS_PACIENTE, lambda filtros: _registros('paciente', filtros)),
+    'terapeuta': _por_campos(COLUNAS_TERAPEUTA, lambda filtros: _registros('terapeuta', filtros)),
+    'avaliacao': _por_campos(COLUNAS_AVALIACAO, lambda filtros: _registros('avaliacao', filtros)),
+    'consulta': _por_campos(COLUNAS_CONSULTA, lambda filtros: _registros('consulta', filtros)),
+    'dashboard': ([('metrica', 'string'), ('valor', 'float')], _colunar_dashboard),
+    'metricas_terapeuta': (
+        [
+            ('terapeuta', 'string'), ('pacientes_ativos', 'int'), ('consultas_marcadas', 'int'),
+            ('consultas_realizadas', 'int'), ('taxa_adesao', 'float'),
+            ('valor_recebido', 'decimal'), ('receita_acordada', 'decimal'),
+        ],
+        _colunar_metricas_terapeuta,
+    ),
+    'altadesistencia': _por_campos(COLUNAS_ALTADESISTENCIA, lambda filtros: _registros('altadesistencia', filtros)),
+    'selecao': (
+        [
+            ('id', 'int'), ('avaliador', 'string'), ('avaliado', 'string'), ('dat_avaliacao', 'date'),
+            *[(campo, 'int') for campo in CAMPOS_AVALIACAO_SELECAO],
+            ('media_geral', 'float'),
+        ],
+        _colunar_selecao,
+    ),
+    'captacao': _por_campos(COLUNAS_CAPTACAO, _captacoes),
+}
+
+# pyarrow só é importado ao gerar parquet (evita o custo no boot dos workers)
+PARQUET_DISPONIVEL = importlib.util.find_spec('pyarrow') is not None
+
+
+def _schema_parquet(colunas):
+    import pyarrow as pa
+
+    tipos = {
+        'int': pa.int64(),
+        'float': pa.float64(),
+        'string': pa.string(),
+        'bool': pa.bool_(),
+        'date': pa.date32(),
+        'decimal': pa.decimal128(14, 2),
+        'timestamp': pa.timestamp('us', tz='UTC' if settings.USE_TZ else None),
+    }
+    return pa.schema([(nome, tipos[tipo]) for nome, tipo in colunas])
+
+
+def _gravar_parquet(tipo, arquivo, linhas):
+    """Grava em lotes de RELATORIOS_CHUNK_SIZE linhas (um row group por lote)"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _schema_parquet(RELATORIOS_COLUNARES[tipo][0])
+    linhas = iter(linhas)
+    with pq.ParquetWriter(arquivo, schema, compression='zstd') as writer:
+        while True:
+            lote = list(itertools.islice(linhas, settings.RELATORIOS_CHUNK_SIZE))
+            if not lote:
+                break
+            writer.write_batch(pa.record_batch(
+                [pa.array(valores, type=campo.type) for valores, campo in zip(zip(*lote), schema)],
+                schema=schema
+            ))
+
+
+def _linhas_colunares(tipo, filtros):
+    colunas, gerador = RELATORIOS_COLUNARES[tipo]
+    yield [nome for nome, _ in colunas]
+    yield from gerador(filtros)
+
+
+def _blocos_gzip(linhas):
+    """CSV (sem BOM, valores sem formatação) comprimido em gzip, em blocos de bytes"""
+    compressor = zlib.compressobj(wbits=31)  # wbits=31: cabeçalho gzip
+    for bloco in _conteudo_csv(linhas, bom=False):
+        dados = compressor.compress(bloco.encode('utf-8'))
+        if dados:
+            yield dados
+    yield compressor.flush()
+
+
+# COMPLETO - os relatórios de RELATORIO_COMPLETO em uma saída só: Excel com uma
+# planilha por relatório; CSV, CSV.gz e parquet com um arquivo por relatório em um zip
+
+FORMATOS_COMPLETO = ('excel', 'csv', 'csv.gz', 'parquet')
+# Lotes de LINHAS_POR_ENVIO que cada thread adianta antes de o relatório dela ser gravado
+LOTES_POR_FILA = 4
+BLOCO_ZIP = 64 * 1024
+_FIM = object()
+
+
+def _colocar(fila, item, cancelado):
+    """Coloca o item na fila; False se a leitura foi interrompida enquanto esperava"""
+    # Espera em intervalos curtos para encerrar se a gravação foi interrompida
+    while not cancelado.is_set():
+        try:
+            fila.put(item, timeout=1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _produzir(linhas, fila, cancelado):
+    """Executa a query do relatório (na thread) e coloca as linhas na fila em lotes"""
+    try:
+        linhas = iter(linhas)
+        while True:
+            lote = list(itertools.islice(linhas, LINHAS_POR_ENVIO))
+            if not lote:
+                break
+            if not _colocar(fila, lote, cancelado):
+                return
+        _colocar(fila, _FIM, cancelado)
+    except Exception as e:
+        _colocar(fila, e, cancelado)
+    finally:
+        # Conexões abertas por esta thread
+        connections.close_all()
+
+
+def _consumir(fila):
+    while True:
+        item = fila.get()
+        if item is _FIM:
+            return
+        if isinstance(item, Exception):
+            raise item
+        yield from item
+
+
+@contextmanager
+def _em_paralelo(geradores):
+    """
+    Executa os geradores de linhas em até RELATORIOS_COMPLETO_THREADS threads,
+    cada uma com sua conexão ao banco, e devolve na mesma ordem os iteradores
+    das linhas. As filas são limitadas: uma thread adiantada espera a gravação
+    do seu relatório e a memória não cresce com o tamanho das tabelas.
+    """
+    cancelado = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=settings.RELATORIOS_COMPLETO_THREADS, thread_name_prefix='relatorio')
+    filas = []
+    for linhas in geradores:
+        fila = queue.Queue(maxsize=LOTES_POR_FILA)
+        executor.submit(_produzir, linhas, fila, cancelado)
+        filas.append(fila)
+    try:
+        yield [_consumir(fila) for fila in filas]
+    finally:
+        cancelado.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _gravar_excel_completo(arquivo, membros):
+    wb = _criar_workbook()
+    for tipo, linhas in membros:
+        titulo, _, larguras_fixas = RELATORIOS_EXCEL[tipo]
+        gravar_planilha(wb, titulo, linhas, larguras_fixas)
+    wb.save(arquivo)
+
+
+class _Saida:
+    """Destino (não posicionável) do zip em streaming: guarda os bytes até o próximo envio"""
+
+    def __init__(self):
+        self.partes = []
+
+    def write(self, dados):
+        self.partes.append(bytes(dados))
+        return len(dados)
+
+    def flush(self):
+        pass
+
+    def esvaziar(self):
+        dados = b''.join(self.partes)
+        self.partes = []
+        return dados
+
+
+def _blocos_parquet(tipo, linhas):
+    # O rodapé do parquet depende do arquivo inteiro: grava no temporário e lê em blocos
+    with tempfile.TemporaryFile() as temporario:
+        _gravar_parquet(tipo, temporario, linhas)
+        temporario.seek(0)
+        while bloco := temporario.read(BLOCO_ZIP):
+            yield bloco
+
+
+def _blocos_zip(formato, membros):
+    """Zip com um arquivo por relatório, em blocos de bytes enviados enquanto as linhas chegam"""
+    saida = _Saida()
+    data_hora = timezone.localtime().timetuple()[:6]
+    with zipfile.ZipFile(saida, 'w') as zf:
+        for tipo, linhas in membros:
+            if formato == 'parquet':
+                # parquet já é comprimido (zstd)
+                info = zipfile.ZipInfo(f'{tipo}.parquet', date_time=data_hora)
+                blocos = _blocos_parquet(tipo, linhas)
+            elif formato == 'csv.gz':
+                # Cada membro já sai em gzip: o zip só armazena
+                info = zipfile.ZipInfo(f'{tipo}.csv.gz', date_time=data_hora)
+                blocos = _blocos_gzip(linhas)
+            else:
+                info = zipfile.ZipInfo(f'{tipo}.csv', date_time=data_hora)
+                info.compress_type = zipfile.ZIP_DEFLATED
+                blocos = (bloco.encode('utf-8') for bloco in _conteudo_csv(linhas))
+            with zf.open(info, 'w', force_zip64=True) as destino:
+                for bloco in blocos:
+                    destino.write(bloco)
+                    dados = saida.esvaziar()
+                    if dados:
+                        yield dados
+    # Restante do último arquivo e diretório central
+    yield saida.esvaziar()
+
+
+def _linhas_completo(formato, filtros):
+    return [_linhas_do_formato(tipo, formato, filtros) for tipo in RELATORIO_COMPLETO]
+
+
+def _blocos_completo(formato, filtros):
+    with _em_paralelo(_linhas_completo(formato, filtros)) as membros:
+        yield from _blocos_zip(formato, zip(RELATORIO_COMPLETO, membros))
+
+
+def _gravar_completo(formato, arquivo, progresso, filtros):
+    with _em_paralelo(_linhas_completo(formato, filtros)) as membros:
+        if progresso:
+            membros = _com_progresso_somado(membros, progresso)
+        membros = zip(RELATORIO_COMPLETO, membros)
+        if formato == 'excel':
+            _gravar_excel_completo(arquivo, membros)
+        else:
+            for bloco in _blocos_zip(formato, membros):
+                arquivo.write(bloco)
+
+
+# COPY - no PostgreSQL o CSV das tabelas grandes sai pronto do banco (COPY ... TO
+# STDOUT), sem criar uma tupla Python por linha. Os nomes vêm pelos joins do queryset
+# e a formatação no SQL reproduz a do csv.writer sobre os valores do caminho padrão.
+
+BLOCO_COPY = 64 * 1024
+
+
+class _DataHoraTexto(Func):
+    """str() do datetime em UTC: 2025-05-04 13:30:15.123456+00:00 (sem fração quando zero)"""
+    template = (
+        "to_char(%(expressions)s AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI:SS')"
+        " || CASE WHEN date_trunc('second', %(expressions)s) = %(expressions)s THEN ''"
+        " ELSE to_char(%(expressions)s AT TIME ZONE 'UTC', '.US') END || '+00:00'"
+    )
+    output_field = CharField()
+
+
+def _coluna_copy(campo, formato):
+    if formato == 'texto':
+        # NULL sai vazio; '' também (o COPY escreveria "")
+        return NullIf(F(campo), Value(''))
+    if formato == 'numero':
+        return Cast(F(campo), CharField())
+    if formato == 'numero_vazio':
+        # Equivalente a _vazio(): zero e NULL ficam vazios
+        return Cast(NullIf(F(campo), Value(0)), CharField())
+    if formato == 'data':
+        return Func(F(campo), Value('YYYY-MM-DD'), function='to_char', output_field=CharField())
+    if formato == 'data_hora':
+        return _DataHoraTexto(F(campo))
+    if formato == 'bool':
+        return Case(
+            When(**{campo: True}, then=Value('True')),
+            When(**{campo: False}, then=Value('False')),
+            output_field=CharField()
+        )
+    return F(campo)
+
+
+# tipo -> [(campo, formato)] nas colunas de RELATORIOS_CSV[tipo]
+RELATORIOS_COPY = {
+    'consulta': [
+        ('pk_consulta', 'inteiro'), ('fk_terapeuta__fk_associado__nome', 'texto'), ('fk_paciente__nome', 'texto'),
+        ('dat_consulta', 'data'), ('vlr_consulta', 'numero'), ('vlr_pago', 'numero_vazio'),
+        ('is_realizado', 'bool'), ('created_at', 'data_hora'),
+    ],
+    'paciente': [
+        ('pk_paciente', 'inteiro'), ('nome', 'texto'), ('email', 'texto'), ('telefone', 'texto'),
+        ('fk_clinica__clinica', 'texto'), ('fk_modalidade__modalidade', 'texto'), ('fk_captacao__nome', 'texto'),
+        ('vlr_sessao', 'numero'), ('dat_nascimento', 'data'), ('is_active', 'bool'), ('created_at', 'data_hora'),
+    ],
+    'avaliacao': [
+        ('pk_avaliacao', 'inteiro'), ('fk_terapeuta__fk_associado__nome', 'texto'), ('fk_paciente__nome', 'texto'),
+        ('dat_consulta', 'data'), ('individual', 'numero_vazio'), ('interpessoal', 'numero_vazio'),
+        ('social', 'numero_vazio'), ('geral', 'numero_vazio'), ('qualidade_geral', 'numero_vazio'),
+        ('momento', 'texto'), ('created_at', 'data_hora'),
+    ],
+}
+
+
+def _usa_copy(tipo, formato):
+    return (
+        formato == 'csv' and tipo in RELATORIOS_COPY
+        and settings.RELATORIOS_COPY and connection.vendor == 'postgresql'
+    )
+
+
+class _LinhasCopy:
+    """
+    Arquivo que recebe o COPY (o psycopg2 chama write uma vez por linha): junta as
+    linhas em blocos de BLOCO_COPY bytes para `enviar` e conta as linhas gravadas.
+    O COPY termina as linhas com LF; o csv.writer do caminho padrão (e do
+    cabeçalho) com CRLF, então o fim de cada linha é trocado aqui.
+    """
+
+    def __init__(self, enviar, progresso=None):
+        self.enviar = enviar
+        self.progresso = progresso
+        self.partes = []
+        self.tamanho = 0
+        self.linhas = 0
+
+    def write(self, dados):
+        # Só o terminador: quebras dentro de campos entre aspas ficam como o csv.writer as grava
+        if dados.endswith(b'\n'):
+            dados = dados[:-1] + b'\r\n'
+        self.partes.append(dados)
+        self.tamanho += len(dados)
+        self.linhas += 1
+        if self.tamanho >= BLOCO_COPY:
+            self.flush()
+
+    def flush(self):
+        if self.partes:
+            self.enviar(b''.join(self.partes))
+            self.partes = []
+            self.tamanho = 0
+        if self.progresso:
+            self.progresso(self.linhas)
+
+
+def _cabecalho_copy(tipo, filtros):
+    # O gerador do caminho padrão devolve o cabeçalho antes de qualquer query
+    cabecalho = next(RELATORIOS_CSV[tipo](filtros))
+    return b''.join(bloco.encode('utf-8') for bloco in _conteudo_csv([cabecalho]))
+
+
+def _copiar(tipo, filtros, saida):
+    """Executa o COPY do relatório (filtros no WHERE) gravando as linhas em saida"""
+    colunas = RELATORIOS_COPY[tipo]
+    queryset = _registros(tipo, filtros).values(
+        **{f'c{indice}': _coluna_copy(campo, formato) for indice, (campo, formato) in enumerate(colunas)}
+    )
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        consulta = cursor.mogrify(sql, params).decode('utf-8')
+        cursor.copy_expert(f'COPY ({consulta}) TO STDOUT WITH (FORMAT csv)', saida)
+    saida.flush()
+
+
+class _Interrompido(Exception):
+    pass
+
+
+def _blocos_copy(tipo, filtros):
+    """
+    CSV do relatório pelo COPY: o copy_expert só retorna no fim, então ele roda
+    em uma thread que entrega os blocos por uma fila limitada enquanto são enviados.
+    """
+    yield _cabecalho_copy(tipo, filtros)
+
+    cancelado = threading.Event()
+    fila = queue.Queue(maxsize=LOTES_POR_FILA)
+
+    def enviar(bloco):
+        if not _colocar(fila, [bloco], cancelado):
+            # Cliente desconectou: aborta o COPY
+            raise _Interrompido()
+
+    def executar():
+        try:
+            _copiar(tipo, filtros, _LinhasCopy(enviar))
+            _colocar(fila, _FIM, cancelado)
+        except _Interrompido:
+            pass
+        except Exception as e:
+            _colocar(fila, e, cancelado)
+        finally:
+            connections.close_all()
+
+    thread = threading.Thread(target=executar, name='relatorio-copy')
+    thread.start()
+    try:
+        yield from _consumir(fila)
+    finally:
+        cancelado.set()
+        thread.join()
+
+
+# FORMATOS
+EXTENSOES = {'csv': 'csv', 'excel': 'xlsx', 'csv.gz': 'csv.gz', 'parquet': 'parquet'}
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'excel': EXCEL_CONTENT_TYPE,
+    'csv.gz': 'application/gzip',
+    'parquet': 'application/vnd.apache.parquet',
+}
+ZIP_CONTENT_TYPE = 'application/zip'
+# Formatos enviados em streaming; os demais são gravados em arquivo antes do envio
+FORMATOS_STREAMING = ('csv', 'csv.gz')
+_RELATORIOS_POR_FORMATO = {
+    'csv': RELATORIOS_CSV,
+    'excel': RELATORIOS_EXCEL,
+    'csv.gz': RELATORIOS_COLUNARES,
+    'parquet': RELATORIOS_COLUNARES,
+}
+
+
+def formato_valido(tipo, formato):
+    if tipo == 'completo':
+        return formato in FORMATOS_COMPLETO
+    return tipo in _RELATORIOS_POR_FORMATO.get(formato, ())
+
+
+def _em_zip(tipo, formato):
+    return tipo == 'completo' and formato != 'excel'
+
+
+def extensao(tipo, formato):
+    return 'zip' if _em_zip(tipo, formato) else EXTENSOES[formato]
+
+
+def content_type(tipo, formato):
+    return ZIP_CONTENT_TYPE if _em_zip(tipo, formato) else CONTENT_TYPES[formato]
+
+
+def _linhas_do_formato(tipo, formato, filtros):
+    if formato == 'excel':
+        return RELATORIOS_EXCEL[tipo][1](filtros)
+    if formato == 'csv.gz':
+        return _linhas_colunares(tipo, filtros)
+    if formato == 'parquet':
+        return RELATORIOS_COLUNARES[tipo][1](filtros)
+    return RELATORIOS_CSV[tipo](filtros)
+
+
+def _codificar(formato, linhas):
+    """Bytes dos formatos de streaming (csv e csv.gz)"""
+    if formato == 'csv.gz':
+        return _blocos_gzip(linhas)
+    return (bloco.encode('utf-8') for bloco in _conteudo_csv(linhas))
+
+
+def blocos_streaming(tipo, formato, filtros=None):
+    """Conteúdo do relatório em blocos de bytes (csv e csv.gz; zip de CSVs ou CSV.gz no completo)"""
+    if tipo == 'completo':
+        return _blocos_completo(formato, filtros or {})
+    if _usa_copy(tipo, formato):
+        return _blocos_copy(tipo, filtros or {})
+    return _codificar(formato, _linhas_do_formato(tipo, formato, filtros or {}))
+
+
+def gravar_relatorio(tipo, formato, arquivo, progresso=None, filtros=None):
+    """
+    Grava o relatório no arquivo binário informado (jobs em segundo plano e
+    cache em disco). progresso(linhas), se informado, recebe o total de
+    linhas já gravadas a cada bloco e ao final.
+    """
+    if tipo == 'completo':
+        _gravar_completo(formato, arquivo, progresso, filtros or {})
+        return
+    if _usa_copy(tipo, formato):
+        arquivo.write(_cabecalho_copy(tipo, filtros or {}))
+        _copiar(tipo, filtros or {}, _LinhasCopy(arquivo.write, progresso))
+        return
+
+    linhas = _linhas_do_formato(tipo, formato, filtros or {})
+    if progresso:
+        linhas = _com_progresso(linhas, progresso)
+
+    if formato == 'excel':
+        _gravar_excel(tipo, arquivo, linhas)
+    elif formato == 'parquet':
+        _gravar_parquet(tipo, arquivo, linhas)
+    else:
+        for bloco in _codificar(formato, linhas):
+            arquivo.write(bloco)
+
+
+def resposta_em_arquivo(tipo, formato, filename, filtros=None):
+    """
+    Relatório (Excel ou parquet) gravado em arquivo temporário e enviado em
+    blocos (FileResponse): a memória do worker não depende do número de linhas.
+    """
+    arquivo = tempfile.TemporaryFile(suffix=f'.{extensao(tipo, formato)}')
+    gravar_relatorio(tipo, formato, arquivo, filtros=filtros)
+    arquivo.seek(0)
+    # O arquivo temporário é apagado quando o FileResponse o fecha
+    return FileResponse(arquivo, as_attachment=True, filename=filename, content_type=content_type(tipo, formato))
@@ -0,0 +1,220 @@
+from pathlib import Path
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from app.metrics_cache import get_model_versions
+from . import relatorios
+from .filtros_relatorio import RELATORIO_COMPLETO
+import hashlib
+import logging
+import os
+import re
+import tempfile
+
+logger = logging.getLogger('principais')
+
+# Modelos lidos por cada relatório: a escrita em qualquer um deles (signals)
+# muda a chave do arquivo em cache. 'materializadas' muda a cada REFRESH.
+# queryset.update() e bulk_update não disparam signals: todo caminho de escrita
+# em lote precisa incrementar a versão (signals.registros_alterados_em_lote).
+# O dashboard fica fora do cache: ele imprime a data de geração, e um arquivo
+# guardado devolveria um horário antigo.
+DEPENDENCIAS = {
+    'associado': ('principais.associado', 'acessorios.setor'),
+    'paciente': ('principais.paciente', 'acessorios.clinica', 'acessorios.modalidade', 'acessorios.captacao'),
+    'terapeuta': (
+        'principais.terapeuta', 'principais.associado', 'acessorios.abordagem',
+        'acessorios.nucleo', 'acessorios.clinica', 'acessorios.modalidade'
+    ),
+    'avaliacao': ('principais.avaliacao', 'principais.terapeuta', 'principais.associado', 'principais.paciente'),
+    'consulta': ('principais.consulta', 'principais.terapeuta', 'principais.associado', 'principais.paciente'),
+    'metricas_terapeuta': (
+        'principais.consulta', 'principais.terapeuta', 'principais.associado',
+        'principais.paciente', 'materializadas'
+    ),
+    'altadesistencia': ('principais.altadesistencia', 'principais.terapeuta', 'principais.associado', 'principais.paciente'),
+    'selecao': ('principais.selecao', 'principais.terapeuta', 'principais.associado'),
+    'captacao': ('acessorios.captacao', 'principais.paciente', 'materializadas'),
+}
+DEPENDENCIAS['completo'] = tuple(sorted({label for tipo in RELATORIO_COMPLETO for label in DEPENDENCIAS[tipo]}))
+MODELOS_RELATORIOS = frozenset(label for labels in DEPENDENCIAS.values() for label in labels)
+# O filtro por terapeuta em pacientes/captações passa pelas consultas do terapeuta
+RELATORIOS_FILTRO_TERAPEUTA_POR_CONSULTA = ('paciente', 'captacao')
+
+BLOCO_LEITURA = 64 * 1024
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def pasta_cache():
+    pasta = Path(settings.RELATORIOS_CACHE_DIR)
+    pasta.mkdir(parents=True, exist_ok=True)
+    return pasta
+
+
+def em_cache(tipo):
+    """Se o relatório passa pelo cache em disco (os que têm dependências declaradas)"""
+    return tipo in DEPENDENCIAS
+
+
+def chave_relatorio(tipo, formato, filtros=None):
+    """Assinatura do relatório: tipo, formato, filtros e versão de cada modelo lido"""
+    dependencias = DEPENDENCIAS[tipo]
+    if filtros and 'terapeuta' in filtros and tipo in RELATORIOS_FILTRO_TERAPEUTA_POR_CONSULTA:
+        dependencias += ('principais.consulta',)
+    # Versões no banco (VersaoDados): iguais em todos os workers e após reinícios
+    versoes = sorted(get_model_versions(dependencias).items())
+    partes = repr((tipo, formato, sorted((filtros or {}).items()), versoes)).encode('utf-8')
+    return hashlib.sha1(partes).hexdigest()
+
+
+def _liberar_espaco(manter):
+    """
+    Remove os arquivos usados há mais tempo até caber em RELATORIOS_CACHE_MAX_MB
+    (LRU por mtime). O arquivo recém-gravado (manter) nunca é removido aqui.
+    """
+    limite = settings.RELATORIOS_CACHE_MAX_MB * 1024 * 1024
+    arquivos = []
+    for arquivo in pasta_cache().iterdir():
+        if arquivo.suffix == '.parcial' or arquivo == manter:
+            continue
+        try:
+            info = arquivo.stat()
+        except FileNotFoundError:
+            continue
+        arquivos.append((info.st_mtime, info.st_size, arquivo))
+
+    total = sum(tamanho for _, tamanho, _ in arquivos) + manter.stat().st_size
+    for _, tamanho, arquivo in sorted(arquivos, key=lambda item: item[0]):
+        if total <= limite:
+            break
+        arquivo.unlink(missing_ok=True)
+        total -= tamanho
+        logger.info(f"Cache de relatórios: {arquivo.name} removido ({tamanho} bytes)")
+
+
+def _arquivo_parcial(destino):
+    descritor, caminho = tempfile.mkstemp(dir=destino.parent, prefix=f'{destino.name}.', suffix='.parcial')
+    return os.fdopen(descritor, 'wb'), Path(caminho)
+
+
+def _streaming_com_copia(tipo, formato, destino, filtros):
+    """Envia os blocos (CSV/CSV.gz) ao cliente gravando a mesma sequência no cache"""
+    arquivo, parcial = _arquivo_parcial(destino)
+    completo = False
+    try:
+        with arquivo:
+            for bloco in relatorios.blocos_streaming(tipo, formato, filtros):
+                arquivo.write(bloco)
+                yield bloco
+        os.replace(parcial, destino)
+        completo = True
+        _liberar_espaco(destino)
+    finally:
+        # Cliente desconectou ou erro no meio: nada incompleto fica no cache
+        if not completo:
+            parcial.unlink(missing_ok=True)
+
+
+def _gravar_no_cache(tipo, formato, destino, filtros):
+    arquivo, parcial = _arquivo_parcial(destino)
+    try:
+        with arquivo:
+            relatorios.gravar_relatorio(tipo, formato, arquivo, filtros=filtros)
+        os.replace(parcial, destino)
+    except Exception:
+        parcial.unlink(missing_ok=True)
+        raise
+    _liberar_espaco(destino)
+
+
+def _intervalo(request, tamanho, etag):
+    """
+    (inicio, fim) do cabeçalho Range (um único intervalo em bytes), None para
+    enviar o arquivo inteiro ou False quando o intervalo não é atendível.
+    """
+    cabecalho = request.META.get('HTTP_RANGE', '')
+    correspondencia = _RANGE.match(cabecalho.strip())
+    if not correspondencia:
+        return None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range and if_range != etag:
+        return None
+
+    inicio, fim = correspondencia.groups()
+    if not inicio and not fim:
+        return None
+    if not inicio:
+        # Sufixo: os últimos N bytes
+        quantidade = int(fim)
+        if quantidade == 0:
+            return False
+        return max(tamanho - quantidade, 0), tamanho - 1
+    inicio = int(inicio)
+    fim = min(int(fim), tamanho - 1) if fim else tamanho - 1
+    if inicio >= tamanho or inicio > fim:
+        return False
+    return inicio, fim
+
+
+def _ler_trecho(arquivo, quantidade):
+    with arquivo:
+        while quantidade > 0:
+            bloco = arquivo.read(min(BLOCO_LEITURA, quantidade))
+            if not bloco:
+                break
+            quantidade -= len(bloco)
+            yield bloco
+
+
+def resposta_arquivo(request, caminho, filename, content_type, etag):
+    """Arquivo do cache com Content-Length, ETag e suporte a Range (206/416)"""
+    tamanho = caminho.stat().st_size
+    intervalo = _intervalo(request, tamanho, etag)
+
+    if intervalo is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{tamanho}'
+    elif intervalo:
+        inicio, fim = intervalo
+        arquivo = open(caminho, 'rb')
+        arquivo.seek(inicio)
+        response = StreamingHttpResponse(_ler_trecho(arquivo, fim - inicio + 1), status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {inicio}-{fim}/{tamanho}'
+        response['Content-Length'] = str(fim - inicio + 1)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    else:
+        # FileResponse preenche Content-Length a partir do arquivo
+        response = FileResponse(open(caminho, 'rb'), as_attachment=True, filename=filename, content_type=content_type)
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    return response
+
+
+def resposta_relatorio(request, tipo, formato, filename, filtros=None):
+    """
+    Relatório servido do cache em disco quando já existe um arquivo com a
+    mesma chave; caso contrário ele é gerado, guardado e enviado. CSV e
+    CSV.gz novos seguem em streaming enquanto são copiados para o cache.
+    """
+    chave = chave_relatorio(tipo, formato, filtros)
+    destino = pasta_cache() / f'{tipo}_{chave}.{relatorios.extensao(tipo, formato)}'
+    etag = f'"{chave}"'
+    content_type = relatorios.content_type(tipo, formato)
+
+    if destino.exists():
+        # Acerto: renova o mtime, que define a ordem de remoção (LRU)
+        try:
+            os.utime(destino)
+            return resposta_arquivo(request, destino, filename, content_type, etag)
+        except FileNotFoundError:
+            # Removido por outro processo entre a verificação e a leitura
+            pass
+
+    if formato in relatorios.FORMATOS_STREAMING:
+        response = StreamingHttpResponse(_streaming_com_copia(tipo, formato, destino, filtros), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        response['ETag'] = etag
+        return response
+
+    _gravar_no_cache(tipo, formato, destino, filtros)
+    return resposta_arquivo(request, destino, filename, content_type, etag)
@@ -1,21 +1,159 @@
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
 from rest_framework import serializers
+from app.campos_dinamicos import CamposDinamicosSerializerMixin
 from . import models
+from .signals import consultas_salvas_em_lote
 
+# Linhas por INSERT no bulk_create dos lotes
+LOTE_INSERT = 1000
 
-class ConsultaSerializer(serializers.ModelSerializer):
+
+def _id_do_lote(valor):
+    """ID inteiro informado no item (int ou string de dígitos); None se não for um ID"""
+    if isinstance(valor, str) and valor.isdigit():
+        return int(valor)
+    if isinstance(valor, int) and not isinstance(valor, bool):
+        return valor
+    return None
+
+
+class RelacionadoEmLoteField(serializers.PrimaryKeyRelatedField):
+    """
+    PrimaryKeyRelatedField que, na validação de um lote, busca o objeto nos
+    já carregados pela LoteListSerializer (context['relacionados']) em vez
+    de fazer uma query por item. Fora do lote funciona como o original.
+    """
+    def to_internal_value(self, data):
+        carregados = self.context.get('relacionados', {}).get(self.field_name)
+        if carregados is None:
+            return super().to_internal_value(data)
+        pk = _id_do_lote(data)
+        if pk is None:
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if pk not in carregados:
+            self.fail('does_not_exist', pk_value=data)
+        return carregados[pk]
+
+
+class LoteListSerializer(serializers.ListSerializer):
+    """
+    Lista JSON validada de uma vez (many=True): limitada a API_LOTE_MAX itens
+    e com os objetos das relações carregados em uma query por campo.
+    """
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            if len(data) > settings.API_LOTE_MAX:
+                raise serializers.ValidationError({
+                    'non_field_errors': [f'Lote com {len(data)} itens; o máximo é {settings.API_LOTE_MAX}.']
+                })
+            self._carregar_lote(data)
+        return super().to_internal_value(data)
+
+    def _carregar_lote(self, data):
+        """Carrega de uma vez o que a validação de cada item buscaria no banco"""
+        self._context['relacionados'] = self._carregar_relacionados(data)
+
+    def _carregar_relacionados(self, data):
+        relacionados = {}
+        for nome, campo in self.child.fields.items():
+            if not isinstance(campo, RelacionadoEmLoteField) or campo.read_only:
+                continue
+            ids = {_id_do_lote(item.get(nome)) for item in data if isinstance(item, dict)}
+            ids.discard(None)
+            relacionados[nome] = campo.get_queryset().in_bulk(ids)
+        return relacionados
+
+
+class ConsultaLoteSerializer(LoteListSerializer):
+    """
+    Criação em lote (bulk_create) e atualização parcial em lote (bulk_update)
+    na transação, sem um save() por consulta. Na atualização, `instance` é o
+    queryset de onde saem as consultas citadas pelo pk_consulta de cada item.
+    """
+    def _carregar_lote(self, data):
+        super()._carregar_lote(data)
+        if self.instance is not None:
+            pks = {_id_do_lote(item.get('pk_consulta')) for item in data if isinstance(item, dict)}
+            pks.discard(None)
+            self._consultas = self.instance.in_bulk(pks)
+            self._citadas = set()
+
+    def run_child_validation(self, data):
+        if self.instance is None or not isinstance(data, dict):
+            return super().run_child_validation(data)
+
+        pk = _id_do_lote(data.get('pk_consulta'))
+        if pk is None:
+            raise serializers.ValidationError({'pk_consulta': ['Informe o pk_consulta da consulta a alterar.']})
+        if pk not in self._consultas:
+            raise serializers.ValidationError({'pk_consulta': [f'Consulta {pk} não encontrada.']})
+        if pk in self._citadas:
+            raise serializers.ValidationError({'pk_consulta': [f'Consulta {pk} repetida no lote.']})
+        self._citadas.add(pk)
+
+        self.child.instance = self._consultas[pk]
+        self.child.initial_data = data
+        return {**super().run_child_validation(data), 'pk_consulta': pk}
+
+    def update(self, instance, validated_data):
+        consultas = []
+        campos = set()
+        # (dia, terapeuta) de antes e de depois: data e terapeuta também podem mudar
+        chaves = set()
+        for dados in validated_data:
+            consulta = self._consultas[dados.pop('pk_consulta')]
+            chaves.add((consulta.dat_consulta, consulta.fk_terapeuta_id))
+            for campo, valor in dados.items():
+                setattr(consulta, campo, valor)
+            chaves.add((consulta.dat_consulta, consulta.fk_terapeuta_id))
+            campos.update(dados)
+            consultas.append(consulta)
+
+        if campos:
+            # bulk_update não preenche auto_now (usado pela exportação incremental)
+            agora = timezone.now()
+            for consulta in consultas:
+                consulta.updated_at = agora
+            with transaction.atomic():
+                models.Consulta.objects.bulk_update(consultas, [*sorted(campos), 'updated_at'], batch_size=LOTE_INSERT)
+                consultas_salvas_em_lote(chaves)
+        return consultas
+
+    def create(self, validated_data):
+        consultas = [models.Consulta(**dados) for dados in validated_data]
+        with transaction.atomic():
+            consultas = models.Consulta.objects.bulk_create(consultas, batch_size=LOTE_INSERT)
+            if consultas:
+                consultas_salvas_em_lote({(consulta.dat_consulta, consulta.fk_terapeuta_id) for consulta in consultas})
+        return consultas
+
+
+class ConsultaSerializer(CamposDinamicosSerializerMixin, serializers.ModelSerializer):
     # ✅ Dados relacionados para evitar queries extras
     terapeuta_nome = serializers.CharField(source='fk_terapeuta.fk_associado.nome', read_only=True)
     paciente_nome = serializers.CharField(source='fk_paciente.nome', read_only=True)
     abordagem_nome = serializers.CharField(source='fk_terapeuta.fk_abordagem.abordagem', read_only=True)
     clinica_nome = serializers.CharField(source='fk_terapeuta.fk_clinica.clinica', read_only=True)
     decano_nome = serializers.CharField(source='fk_terapeuta.fk_decano.nome', read_only=True)
+    # Relações resolvidas em uma query por campo quando a lista vem em lote
+    serializer_related_field = RelacionadoEmLoteField
 
     class Meta:
         model = models.Consulta
         fields = '__all__'
+        list_serializer_class = ConsultaLoteSerializer
+        # ?expand=: relações que podem vir como objeto em vez do ID
+        expansiveis = {
+            'fk_terapeuta': 'principais.serializers.TerapeutaSerializer',
+            'fk_paciente': 'principais.serializers.PacienteSerializer',
+        }
+        # Mesma regra da constraint check_vlr_pago_greater_equal_0 (400 em vez de IntegrityError)
+        extra_kwargs = {'vlr_pago': {'min_value': 0}}
 
 
-class AssociadoSerializer(serializers.ModelSerializer):
+class AssociadoSerializer(CamposDinamicosSerializerMixin, serializers.ModelSerializer):
     # ✅ Representação dos setores relacionados
     setores_nomes = serializers.StringRelatedField(source='setores', many=True, read_only=True)
     
@@ -36,7 +174,7 @@ class AssociadoSerializer(serializers.ModelSerializer):
         return 0
 
 
-class TerapeutaSerializer(serializers.ModelSerializer):
+class TerapeutaSerializer(CamposDinamicosSerializerMixin, serializers.ModelSerializer):
     # ✅ Estatísticas pré-calculadas (vindas das annotations)
     total_consultas = serializers.IntegerField(read_only=True)
     total_pacientes = serializers.IntegerField(read_only=True)
@@ -53,13 +191,21 @@ class TerapeutaSerializer(serializers.ModelSerializer):
     class Meta:
         model = models.Terapeuta
         fields = '__all__'
+        # Anotados pela view (TerapeutaListCreateAPIView.anotacoes); aninhados, ficam de fora
+        campos_anotados = ('total_consultas', 'total_pacientes')
+        expansiveis = {
+            'fk_abordagem': 'acessorios.serializers.AbordagemSerializer',
+            'fk_nucleo': 'acessorios.serializers.NucleoSerializer',
+            'fk_clinica': 'acessorios.serializers.ClinicaSerializer',
+            'fk_modalidade': 'acessorios.serializers.ModalidadeSerializer',
+        }
 
 
-class PacienteSerializer(serializers.ModelSerializer):
+class PacienteSerializer(CamposDinamicosSerializerMixin, serializers.ModelSerializer):
     # ✅ Dados relacionados para evitar queries extras
     clinica_nome = serializers.CharField(source='fk_clinica.clinica', read_only=True)
     modalidade_nome = serializers.CharField(source='fk_modalidade.modalidade', read_only=True)
-    captacao_nome = serializers.CharField(source='fk_captacao.captacao', read_only=True)
+    captacao_nome = serializers.CharField(source='fk_captacao.nome', read_only=True)
     
     # ✅ Estatísticas pré-calculadas (vindas das annotations)
     total_consultas = serializers.IntegerField(read_only=True)
@@ -67,9 +213,15 @@ class PacienteSerializer(serializers.ModelSerializer):
     class Meta:
         model = models.Paciente
         fields = '__all__'
+        campos_anotados = ('total_consultas',)
+        expansiveis = {
+            'fk_clinica': 'acessorios.serializers.ClinicaSerializer',
+            'fk_captacao': 'acessorios.serializers.CaptacaoSerializer',
+            'fk_modalidade': 'acessorios.serializers.ModalidadeSerializer',
+        }
 
 
-class AvaliacaoSerializer(serializers.ModelSerializer):
+class AvaliacaoSerializer(CamposDinamicosSerializerMixin, serializers.ModelSerializer):
     # ✅ Dados relacionados para evitar queries extras
     terapeuta_nome = serializers.CharField(source='fk_terapeuta.fk_associado.nome', read_only=True)
     paciente_nome = serializers.CharField(source='fk_paciente.nome', read_only=True)
@@ -77,24 +229,35 @@ class AvaliacaoSerializer(serializers.ModelSerializer):
     class Meta:
         model = models.Avaliacao
         fields = '__all__'
+        expansiveis = {
+            'fk_terapeuta': 'principais.serializers.TerapeutaSerializer',
+            'fk_paciente': 'principais.serializers.PacienteSerializer',
+        }
 
 
-class AltadesistenciaSerializer(serializers.ModelSerializer):
+class AltadesistenciaSerializer(CamposDinamicosSerializerMixin, serializers.ModelSerializer):
     terapeuta_nome = serializers.CharField(source='fk_terapeuta.fk_associado.nome', read_only=True)
     paciente_nome = serializers.CharField(source='fk_paciente.nome', read_only=True)
 
     class Meta:
         model = models.Altadesistencia
         fields = '__all__'
+        expansiveis = {
+            'fk_terapeuta': 'principais.serializers.TerapeutaSerializer',
+            'fk_paciente': 'principais.serializers.PacienteSerializer',
+        }
 
 
-class SelecaoSerializer(serializers.ModelSerializer):
+class SelecaoSerializer(CamposDinamicosSerializerMixin, serializers.ModelSerializer):
     avaliador_nome = serializers.CharField(source='fk_terapeuta_avaliador.fk_associado.nome', read_only=True)
     avaliado_nome = serializers.CharField(source='fk_associado_avaliado.nome', read_only=True)
     
     class Meta:
         model = models.Selecao
         fields = '__all__'
+        expansiveis = {
+            'fk_terapeuta_avaliador': 'principais.serializers.TerapeutaSerializer',
+        }
         
 
 
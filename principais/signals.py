@@ -1,6 +1,11 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
 from django.dispatch import receiver
-from .models import Altadesistencia
+from .models import Altadesistencia, Consulta, Paciente, Terapeuta, Match
+from .agregados import atualizar_consulta_diaria, atualizar_consultas_em_lote, dimensoes_terapeuta, reconstruir_consultas_dimensoes, CAMPOS_DIMENSAO
+from .relatorios_cache import MODELOS_RELATORIOS
+from .delta import MODELOS_DELTA, registrar_exclusao
+from app.metrics_cache import bump_data_version, bump_model_version
 import logging
 
 logger = logging.getLogger('principais')
@@ -31,3 +36,162 @@ def desativar_paciente_alta_desistencia(sender, instance, created, **kwargs):
             logger.error(
                 f"ERRO ao desativar paciente na alta/desistência ID {instance.pk_alta_desistencia}: {str(e)}"
             )
+
+
+@receiver(pre_save, sender=Consulta)
+def guardar_chave_consulta_diaria(sender, instance, **kwargs):
+    """
+    Guarda o (dia, terapeuta) anterior da consulta para que uma mudança
+    de data ou terapeuta também atualize o agregado antigo
+    """
+    instance._chave_consulta_diaria_anterior = None
+    if instance.pk:
+        anterior = Consulta.objects.filter(pk=instance.pk).values_list('dat_consulta', 'fk_terapeuta_id').first()
+        if anterior:
+            instance._chave_consulta_diaria_anterior = anterior
+
+
+@receiver(post_save, sender=Consulta)
+def atualizar_consulta_diaria_ao_salvar(sender, instance, **kwargs):
+    """Mantém ConsultaDiaria atualizada quando uma consulta é criada ou alterada"""
+    chaves = {(str(instance.dat_consulta), instance.fk_terapeuta_id)}
+    anterior = getattr(instance, '_chave_consulta_diaria_anterior', None)
+    if anterior:
+        chaves.add((str(anterior[0]), anterior[1]))
+
+    transaction.on_commit(lambda: _atualizar_chaves(chaves))
+
+
+@receiver(post_delete, sender=Consulta)
+def atualizar_consulta_diaria_ao_excluir(sender, instance, **kwargs):
+    """Mantém ConsultaDiaria atualizada quando uma consulta é excluída"""
+    chaves = {(str(instance.dat_consulta), instance.fk_terapeuta_id)}
+    transaction.on_commit(lambda: _atualizar_chaves(chaves))
+
+
+def registros_alterados_em_lote(modelo):
+    """
+    queryset.update() não dispara post_save: agenda as mesmas invalidações dos
+    signals de escrita (cache de métricas e versão do modelo nos relatórios)
+    """
+    if modelo in (Consulta, Paciente, Terapeuta, Match):
+        invalidar_cache_metricas(modelo)
+    invalidar_cache_relatorios(modelo)
+
+
+def consultas_salvas_em_lote(chaves):
+    """
+    bulk_create/bulk_update não disparam post_save: recebe os (dia, terapeuta)
+    afetados pelo lote e agenda uma vez o que os signals fariam por consulta
+    (agregado diário e invalidação dos caches de métricas e de relatórios)
+    """
+    chaves = {(str(dat_consulta), terapeuta_id) for dat_consulta, terapeuta_id in chaves}
+    transaction.on_commit(lambda: _atualizar_lote(chaves))
+    transaction.on_commit(_incrementar_versao_metricas)
+    transaction.on_commit(lambda: _incrementar_versao_relatorios(Consulta._meta.label_lower))
+
+
+def _atualizar_lote(chaves):
+    try:
+        atualizar_consultas_em_lote(chaves)
+    except Exception as e:
+        logger.error(f"ERRO ao atualizar os agregados do lote de consultas ({len(chaves)} chave(s)): {str(e)}")
+
+
+def _atualizar_chaves(chaves):
+    for dat_consulta, terapeuta_id in chaves:
+        try:
+            atualizar_consulta_diaria(dat_consulta, terapeuta_id)
+        except Exception as e:
+            logger.error(
+                f"ERRO ao atualizar ConsultaDiaria ({dat_consulta}, terapeuta {terapeuta_id}): {str(e)}"
+            )
+
+
+@receiver(pre_save, sender=Terapeuta)
+def guardar_dimensoes_terapeuta(sender, instance, **kwargs):
+    """Guarda clínica/núcleo/abordagem/modalidade anteriores para detectar mudanças"""
+    instance._dimensoes_anteriores = None
+    if instance.pk:
+        anterior = Terapeuta.objects.filter(pk=instance.pk).only(*CAMPOS_DIMENSAO).first()
+        if anterior:
+            instance._dimensoes_anteriores = dimensoes_terapeuta(anterior)
+
+
+@receiver(post_save, sender=Terapeuta)
+def atualizar_dimensoes_ao_salvar_terapeuta(sender, instance, created, **kwargs):
+    """Move as consultas do terapeuta para a nova combinação de dimensões no cubo"""
+    anteriores = getattr(instance, '_dimensoes_anteriores', None)
+    atuais = dimensoes_terapeuta(instance)
+    if created or not anteriores or anteriores == atuais:
+        return
+
+    transaction.on_commit(lambda: _reconstruir_dimensoes([anteriores, atuais]))
+
+
+@receiver(post_delete, sender=Terapeuta)
+def atualizar_dimensoes_ao_excluir_terapeuta(sender, instance, **kwargs):
+    """Remove do cubo as consultas do terapeuta excluído"""
+    dimensoes = dimensoes_terapeuta(instance)
+    transaction.on_commit(lambda: _reconstruir_dimensoes([dimensoes]))
+
+
+def _reconstruir_dimensoes(combinacoes):
+    for dimensoes in combinacoes:
+        try:
+            reconstruir_consultas_dimensoes(dimensoes=dimensoes)
+        except Exception as e:
+            logger.error(f"ERRO ao reconstruir ConsultaDimensaoMensal {dimensoes}: {str(e)}")
+
+
+@receiver(post_save, sender=Consulta)
+@receiver(post_delete, sender=Consulta)
+@receiver(post_save, sender=Paciente)
+@receiver(post_delete, sender=Paciente)
+@receiver(post_save, sender=Terapeuta)
+@receiver(post_delete, sender=Terapeuta)
+@receiver(post_save, sender=Match)
+@receiver(post_delete, sender=Match)
+def invalidar_cache_metricas(sender, **kwargs):
+    """
+    Incrementa a versão dos dados do dashboard, invalidando as métricas em cache.
+    Registrado depois dos signals dos agregados, então roda após a atualização deles.
+    """
+    transaction.on_commit(_incrementar_versao_metricas)
+
+
+def _incrementar_versao_metricas():
+    try:
+        bump_data_version()
+    except Exception as e:
+        logger.error(f"ERRO ao invalidar o cache de métricas: {str(e)}")
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def invalidar_cache_relatorios(sender, **kwargs):
+    """Incrementa a versão do modelo alterado, mudando a chave dos relatórios que o leem"""
+    label = sender._meta.label_lower
+    if label in MODELOS_RELATORIOS:
+        transaction.on_commit(lambda: _incrementar_versao_relatorios(label))
+
+
+@receiver(post_delete)
+def registrar_exclusao_delta(sender, instance, **kwargs):
+    """Tombstone da exclusão para a exportação incremental (mesma transação do DELETE)"""
+    if sender in MODELOS_DELTA.values():
+        registrar_exclusao(instance)
+
+
+@receiver(m2m_changed)
+def invalidar_cache_relatorios_m2m(sender, instance, action, **kwargs):
+    # Ex.: setores do associado; o sender é a tabela intermediária
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidar_cache_relatorios(type(instance))
+
+
+def _incrementar_versao_relatorios(label):
+    try:
+        bump_model_version(label)
+    except Exception as e:
+        logger.error(f"ERRO ao invalidar o cache de relatórios ({label}): {str(e)}")
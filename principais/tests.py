@@ -0,0 +1,545 @@
+import gzip
+import io
+import shutil
+import tempfile
+import threading
+import unittest
+import zipfile
+from datetime import date, timedelta
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import connection, connections
+from django.db.models import Q
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from app.metrics_cache import get_data_version, get_model_version
+from acessorios.models import Abordagem, Captacao, Clinica, Modalidade, Nucleo
+from . import agregados, delta, jobs, materializadas, relatorios, relatorios_cache
+from .filtros_api import FILTROS_CONSULTA, q_filtros_api
+from .models import Associado, Avaliacao, Consulta, ConsultaDiaria, ConsultaMensal, Paciente, RelatorioJob, Terapeuta
+
+
+def criar_terapeutas(quantidade, inicio=0):
+    """Terapeutas ativos, cada um com um paciente e duas consultas (uma realizada e paga)"""
+    clinica = Clinica.objects.get_or_create(clinica='Centro')[0]
+    modalidade = Modalidade.objects.get_or_create(modalidade='Online')[0]
+    nucleo = Nucleo.objects.get_or_create(nucleo='Núcleo Teste')[0]
+    abordagem = Abordagem.objects.get_or_create(abordagem='Abordagem Teste')[0]
+    captacao = Captacao.objects.get_or_create(nome='Instagram')[0]
+    decano = Associado.objects.get_or_create(
+        nome='Decano', defaults={'telefone': '31988553344', 'sexo': 'M', 'endereco': 'Rua A'}
+    )[0]
+
+    for i in range(inicio, inicio + quantidade):
+        associado = Associado.objects.create(
+            nome=f'Terapeuta {i:02d}', telefone='31988553344', sexo='F', endereco='Rua A', email=f'terapeuta{i}@teste.com'
+        )
+        terapeuta = Terapeuta.objects.create(
+            fk_associado=associado, fk_decano=decano, fk_abordagem=abordagem, fk_nucleo=nucleo,
+            fk_clinica=clinica, fk_modalidade=modalidade
+        )
+        paciente = Paciente.objects.create(
+            nome=f'Paciente {i}', fk_clinica=clinica, fk_captacao=captacao,
+            fk_modalidade=modalidade, telefone='31988553344', vlr_sessao=Decimal('80.00')
+        )
+        Consulta.objects.create(
+            fk_terapeuta=terapeuta, fk_paciente=paciente, vlr_consulta=Decimal('80.00'),
+            vlr_pago=Decimal('80.00'), is_realizado=True, dat_consulta=date(2025, 3, 10)
+        )
+        Consulta.objects.create(
+            fk_terapeuta=terapeuta, fk_paciente=paciente, vlr_consulta=Decimal('80.00'),
+            vlr_pago=Decimal('0.00'), is_realizado=False, dat_consulta=date(2025, 4, 10)
+        )
+
+
+class MetricasPorTerapeutaTest(TestCase):
+    """metricas_por_terapeuta: uma query, qualquer que seja o número de terapeutas"""
+
+    def _verificar(self, quantidade, **filtros):
+        with self.assertNumQueries(1):
+            linhas = materializadas.metricas_por_terapeuta(**filtros)
+        self.assertEqual(len(linhas), quantidade)
+        return linhas
+
+    @override_settings(RELATORIOS_VIEWS_MATERIALIZADAS=False)
+    def test_query_ao_vivo(self):
+        criar_terapeutas(3)
+        linhas = self._verificar(3)
+        self.assertEqual(linhas[0], {
+            'nome': 'Terapeuta 00', 'pacientes_ativos': 1, 'consultas_marcadas': 2, 'consultas_realizadas': 1,
+            'valor_recebido': Decimal('80.00'), 'receita_acordada': Decimal('160.00'),
+        })
+
+        criar_terapeutas(5, inicio=3)
+        self._verificar(8)
+
+    def test_query_com_filtro_de_consultas(self):
+        criar_terapeutas(3)
+        filtro = Q(consulta__dat_consulta__gte=date(2025, 4, 1))
+        linhas = self._verificar(3, filtro_consultas=filtro)
+        self.assertEqual(linhas[0]['consultas_marcadas'], 1)
+
+        criar_terapeutas(5, inicio=3)
+        self._verificar(8, filtro_consultas=filtro)
+
+    @unittest.skipUnless(connection.vendor == 'postgresql', 'Views materializadas só existem no PostgreSQL')
+    def test_views_materializadas(self):
+        criar_terapeutas(3)
+        materializadas.criar_views_materializadas(recriar=True)
+        materializadas.atualizar_views_materializadas(concorrente=False)
+        self.addCleanup(setattr, materializadas, '_disponiveis', False)
+        self._verificar(3)
+
+        criar_terapeutas(5, inicio=3)
+        materializadas.atualizar_views_materializadas(concorrente=False)
+        linhas = self._verificar(8)
+        self.assertEqual(linhas[-1]['consultas_marcadas'], 2)
+
+
+class ExpirarRelatoriosTest(TestCase):
+    """Arquivos dos relatórios em segundo plano saem do disco depois de RELATORIOS_JOB_RETENCAO"""
+
+    def setUp(self):
+        pasta = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, pasta, ignore_errors=True)
+        configuracao = override_settings(RELATORIOS_DIR=pasta, RELATORIOS_JOB_RETENCAO=3600)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+        self.pasta = Path(pasta)
+
+    def _job_concluido(self, horas_atras):
+        job = RelatorioJob.objects.create(tipo='consulta', formato='csv', nome_arquivo='consulta.csv')
+        arquivo = f'{job.pk}_consulta.csv'
+        (self.pasta / arquivo).write_text('ID\n')
+        RelatorioJob.objects.filter(pk=job.pk).update(
+            status=RelatorioJob.CONCLUIDO, arquivo=arquivo, concluido_em=timezone.now() - timedelta(hours=horas_atras)
+        )
+        return job.pk, self.pasta / arquivo
+
+    def test_expira_so_os_vencidos(self):
+        antigo, arquivo_antigo = self._job_concluido(horas_atras=2)
+        recente, arquivo_recente = self._job_concluido(horas_atras=0)
+
+        self.assertEqual(jobs.expirar_relatorios(), 1)
+        self.assertFalse(arquivo_antigo.exists())
+        self.assertTrue(arquivo_recente.exists())
+        self.assertEqual(RelatorioJob.objects.get(pk=antigo).status, RelatorioJob.EXPIRADO)
+        self.assertEqual(RelatorioJob.objects.get(pk=recente).status, RelatorioJob.CONCLUIDO)
+        # Segunda passada não encontra mais nada
+        self.assertEqual(jobs.expirar_relatorios(), 0)
+
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@teste.com', 'senha'))
+        response = self.client.get(reverse('relatorio-job-download', args=[antigo]))
+        self.assertEqual(response.status_code, 410)
+        self.assertIsNone(response.json()['download_url'])
+        self.assertEqual(self.client.get(reverse('relatorio-job-download', args=[recente])).status_code, 200)
+
+
+class CacheRelatoriosTest(TestCase):
+    """Arquivos do cache de relatórios seguem a versão dos dados gravada no banco"""
+
+    def setUp(self):
+        pasta = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, pasta, ignore_errors=True)
+        # Sem COPY: no PostgreSQL ele roda em outra conexão, fora da transação do teste
+        configuracao = override_settings(RELATORIOS_CACHE=True, RELATORIOS_CACHE_DIR=pasta, RELATORIOS_COPY=False)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+        self.pasta = Path(pasta)
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@teste.com', 'senha'))
+
+    def _linhas(self, tipo):
+        response = self.client.get(reverse('gerar-relatorio'), {'tipo': tipo, 'formato': 'csv'})
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode('utf-8-sig').splitlines()
+
+    def test_escrita_depois_de_reinicio_gera_arquivo_novo(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            criar_terapeutas(2)
+        self.assertEqual(len(self._linhas('consulta')), 5)
+        self.assertEqual(len(list(self.pasta.iterdir())), 1)
+
+        # Reinício do processo: caches em memória vazios, arquivos ainda no disco
+        for cache in caches.all():
+            cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            criar_terapeutas(1, inicio=2)
+
+        self.assertEqual(len(self._linhas('consulta')), 7)
+        self.assertEqual(len(list(self.pasta.iterdir())), 2)
+
+    def test_acao_em_lote_do_admin(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            criar_terapeutas(2)
+        self.assertTrue(all(linha.split(',')[9] == 'True' for linha in self._linhas('paciente')[1:]))
+
+        # queryset.update() não dispara post_save: a ação incrementa a versão por conta própria
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('admin:principais_paciente_changelist'), {
+                'action': 'desativar_pacientes',
+                '_selected_action': list(Paciente.objects.values_list('pk', flat=True)),
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(all(linha.split(',')[9] == 'False' for linha in self._linhas('paciente')[1:]))
+
+    def test_dashboard_fora_do_cache(self):
+        self.assertFalse(relatorios_cache.em_cache('dashboard'))
+        self.assertIn('Data Geracao', self._linhas('dashboard')[-1])
+        self.assertEqual(list(self.pasta.iterdir()), [])
+
+
+class RelatorioCompletoTest(TestCase):
+    """tipo=completo em CSV.gz: zip com um .csv.gz por relatório"""
+
+    def test_zip_de_csv_gz(self):
+        # As planilhas do completo são lidas em threads com conexão própria: aqui só a montagem do zip
+        membros = [('associado', iter([['ID', 'Nome'], [1, 'Ana']])), ('consulta', iter([['ID'], [1], [2]]))]
+        conteudo = b''.join(relatorios._blocos_zip('csv.gz', membros))
+
+        with zipfile.ZipFile(io.BytesIO(conteudo)) as zf:
+            self.assertEqual(zf.namelist(), ['associado.csv.gz', 'consulta.csv.gz'])
+            self.assertEqual(zf.getinfo('consulta.csv.gz').compress_type, zipfile.ZIP_STORED)
+            consultas = gzip.decompress(zf.read('consulta.csv.gz')).decode('utf-8').splitlines()
+        self.assertEqual(consultas, ['ID', '1', '2'])
+
+    def test_formato_aceito(self):
+        self.assertTrue(relatorios.formato_valido('completo', 'csv.gz'))
+        self.assertEqual(relatorios.extensao('completo', 'csv.gz'), 'zip')
+        self.assertEqual(relatorios.content_type('completo', 'csv.gz'), 'application/zip')
+
+
+class DeltaTest(TestCase):
+    """Cursor da API de delta não perde transações confirmadas depois da margem"""
+
+    def _ids(self, pagina):
+        return {linha['pk_consulta'] for linha in pagina['alterados']}
+
+    def test_transacao_confirmada_com_atraso(self):
+        criar_terapeutas(2)
+        agora = timezone.now()
+        Consulta.objects.update(updated_at=agora - timedelta(hours=1))
+
+        alterados, excluidos, horizonte, limite = delta.ler_parametros({'desde': (agora - timedelta(hours=2)).isoformat()})
+        pagina = delta.pagina_delta('consulta', alterados, excluidos, limite, horizonte)
+        self.assertEqual(len(pagina['alterados']), 4)
+        self.assertFalse(pagina['tem_mais'])
+
+        # save() há 1 minuto, commit só agora: updated_at já ficou atrás do cursor entregue
+        criar_terapeutas(1, inicio=2)
+        atrasadas = set(Consulta.objects.filter(updated_at__gt=agora - timedelta(minutes=5)).values_list('pk', flat=True))
+        Consulta.objects.filter(pk__in=atrasadas).update(updated_at=agora - timedelta(minutes=1))
+
+        alterados, excluidos, horizonte, limite = delta.ler_parametros({'cursor': pagina['cursor']})
+        pagina = delta.pagina_delta('consulta', alterados, excluidos, limite, horizonte)
+        self.assertEqual(self._ids(pagina), atrasadas)
+
+    def test_acao_em_lote_do_admin(self):
+        criar_terapeutas(2)
+        Paciente.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+        parametros = {'desde': (timezone.now() - timedelta(minutes=30)).isoformat()}
+        alterados, excluidos, horizonte, limite = delta.ler_parametros(parametros)
+        self.assertEqual(delta.pagina_delta('paciente', alterados, excluidos, limite, horizonte)['alterados'], [])
+
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@teste.com', 'senha'))
+        pacientes = list(Paciente.objects.values_list('pk', flat=True))
+        self.client.post(reverse('admin:principais_paciente_changelist'), {
+            'action': 'desativar_pacientes', '_selected_action': pacientes,
+        })
+
+        # Fora da margem de transações abertas
+        with override_settings(RELATORIOS_DELTA_MARGEM=0):
+            pagina = delta.pagina_delta('paciente', alterados, excluidos, limite, horizonte)
+        self.assertEqual({linha['pk_paciente'] for linha in pagina['alterados']}, set(pacientes))
+        self.assertTrue(all(not linha['is_active'] for linha in pagina['alterados']))
+
+    def test_paginas_do_ciclo_mantem_o_horizonte(self):
+        criar_terapeutas(2)
+        Consulta.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+
+        parametros = {'desde': (timezone.now() - timedelta(hours=2)).isoformat(), 'limite': '3'}
+        alterados, excluidos, horizonte, limite = delta.ler_parametros(parametros)
+        primeira = delta.pagina_delta('consulta', alterados, excluidos, limite, horizonte)
+        self.assertTrue(primeira['tem_mais'])
+
+        alterados, excluidos, horizonte, limite = delta.ler_parametros({'cursor': primeira['cursor'], 'limite': '3'})
+        segunda = delta.pagina_delta('consulta', alterados, excluidos, limite, horizonte)
+        self.assertFalse(segunda['tem_mais'])
+        self.assertEqual(self._ids(primeira) | self._ids(segunda), set(Consulta.objects.values_list('pk', flat=True)))
+        self.assertFalse(self._ids(primeira) & self._ids(segunda))
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'COPY só existe no PostgreSQL')
+class CsvCopyTest(TransactionTestCase):
+    """O CSV do COPY tem os mesmos bytes do csv.writer do caminho padrão"""
+
+    def setUp(self):
+        # O COPY roda em outra conexão: os dados precisam estar confirmados
+        criar_terapeutas(2)
+        terapeuta = Terapeuta.objects.first()
+        paciente = Paciente.objects.first()
+        Paciente.objects.filter(pk=paciente.pk).update(nome='Ana "Bia"\nSilva', email='')
+        Paciente.objects.exclude(pk=paciente.pk).update(email=None)
+        consulta = Consulta.objects.create(
+            fk_terapeuta=terapeuta, fk_paciente=paciente, vlr_consulta=Decimal('80.50'),
+            vlr_pago=Decimal('0.00'), is_realizado=False, dat_consulta=date(2025, 5, 4)
+        )
+        # Um created_at com microssegundos e outro sem fração
+        Consulta.objects.filter(pk=consulta.pk).update(created_at=timezone.now().replace(microsecond=123456))
+        Consulta.objects.exclude(pk=consulta.pk).update(created_at=timezone.now().replace(microsecond=0))
+        Avaliacao.objects.create(
+            fk_terapeuta=terapeuta, fk_paciente=paciente, dat_consulta=date(2025, 5, 4), individual=0,
+            interpessoal=7, momento='Durante o acompanhamento terapêutico'
+        )
+
+    def test_mesmos_bytes_do_caminho_padrao(self):
+        for tipo in ('consulta', 'paciente', 'avaliacao'):
+            with self.subTest(tipo=tipo):
+                copy = b''.join(relatorios._blocos_copy(tipo, {}))
+                with override_settings(RELATORIOS_COPY=False):
+                    padrao = b''.join(relatorios.blocos_streaming(tipo, 'csv', {}))
+                self.assertEqual(copy, padrao)
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'Transações concorrentes precisam do PostgreSQL')
+class AgregadosConcorrentesTest(TransactionTestCase):
+    """Duas atualizações da mesma chave (dia × terapeuta) não deixam o agregado com um total antigo"""
+
+    def test_recalculo_intercalado(self):
+        criar_terapeutas(1)
+        consulta = Consulta.objects.first()
+        dia, terapeuta_id = consulta.dat_consulta, consulta.fk_terapeuta_id
+        # Chave ainda sem linha diária: as duas atualizações disputam a primeira criação
+        ConsultaDiaria.objects.all().delete()
+        ConsultaMensal.objects.all().delete()
+
+        pausado, liberar = threading.Event(), threading.Event()
+        gravar = agregados._gravar_agregado
+
+        def gravar_devagar(modelo, filtros, stats):
+            # A primeira atualização leu as consultas e espera antes de gravar
+            if threading.current_thread().name == 'primeira' and modelo is ConsultaDiaria:
+                pausado.set()
+                liberar.wait(timeout=5)
+            return gravar(modelo, filtros, stats)
+
+        def em_thread(nome, funcao):
+            def executar():
+                try:
+                    funcao()
+                finally:
+                    connections.close_all()
+            return threading.Thread(target=executar, name=nome)
+
+        def nova_consulta():
+            # O signal recalcula a mesma chave ao confirmar
+            Consulta.objects.create(
+                fk_terapeuta_id=terapeuta_id, fk_paciente=consulta.fk_paciente, vlr_consulta=Decimal('80.00'),
+                vlr_pago=Decimal('80.00'), is_realizado=True, dat_consulta=dia
+            )
+
+        with mock.patch.object(agregados, '_gravar_agregado', gravar_devagar):
+            primeira = em_thread('primeira', lambda: agregados.atualizar_consulta_diaria(dia, terapeuta_id))
+            primeira.start()
+            self.assertTrue(pausado.wait(timeout=5))
+            segunda = em_thread('segunda', nova_consulta)
+            segunda.start()
+            segunda.join(timeout=0.5)
+            liberar.set()
+            primeira.join()
+            segunda.join()
+
+        total = Consulta.objects.filter(fk_terapeuta_id=terapeuta_id, dat_consulta=dia).count()
+        self.assertEqual(total, 2)
+        self.assertEqual(ConsultaDiaria.objects.get(fk_terapeuta_id=terapeuta_id, dat_consulta=dia).total_marcadas, total)
+        self.assertEqual(ConsultaMensal.objects.get(fk_terapeuta_id=terapeuta_id, mes=dia.replace(day=1)).total_marcadas, total)
+
+
+class ConsultaLoteAPITest(TestCase):
+    """POST e PATCH em lote de /api/v1/consulta/ (lista JSON de consultas)"""
+
+    def setUp(self):
+        criar_terapeutas(2)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_superuser('admin', 'admin@teste.com', 'senha'))
+        self.url = reverse('consulta-list-create-api')
+
+    def _lote(self, quantidade, mes=6):
+        terapeutas = list(Terapeuta.objects.values_list('pk', flat=True))
+        pacientes = list(Paciente.objects.values_list('pk', flat=True))
+        return [
+            {
+                'fk_terapeuta': terapeutas[i % len(terapeutas)], 'fk_paciente': pacientes[i % len(pacientes)],
+                'dat_consulta': f'2025-{mes:02d}-{1 + i % 28:02d}', 'vlr_consulta': '80.00',
+                'vlr_pago': '80.00' if i % 2 else '0.00', 'is_realizado': bool(i % 2),
+            }
+            for i in range(quantidade)
+        ]
+
+    def _post(self, dados):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(self.url, dados, format='json')
+
+    def test_criacao_em_lote(self):
+        antes = get_data_version()
+        response = self._post(self._lote(4))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()), 4)
+        self.assertGreater(get_data_version(), antes)
+
+        # Agregados das chaves do lote atualizados por consultas_salvas_em_lote
+        for item in self._lote(4):
+            diaria = ConsultaDiaria.objects.get(dat_consulta=item['dat_consulta'], fk_terapeuta_id=item['fk_terapeuta'])
+            self.assertEqual(diaria.total_marcadas, 1)
+            self.assertEqual(diaria.total_realizadas, int(item['is_realizado']))
+        mensal = ConsultaMensal.objects.filter(mes=date(2025, 6, 1))
+        self.assertEqual(sum(linha.total_marcadas for linha in mensal), 4)
+
+    def test_lote_invalido_nao_grava_nada(self):
+        lote = self._lote(4)
+        lote[1]['vlr_pago'] = '-1.00'
+        lote[3]['fk_paciente'] = 999999
+        total = Consulta.objects.count()
+
+        response = self._post(lote)
+        self.assertEqual(response.status_code, 400)
+        erros = response.json()
+        self.assertEqual(sorted(erros), ['1', '3'])
+        self.assertIn('vlr_pago', erros['1'])
+        self.assertIn('fk_paciente', erros['3'])
+        self.assertEqual(Consulta.objects.count(), total)
+
+    def test_queries_nao_crescem_com_o_lote(self):
+        # Relações carregadas em uma query por campo; agregados com uma query por nível.
+        # Cada lote em um mês sem agregados: as mesmas gravações (só inserções) nos dois
+        # O primeiro lote também cria as linhas de VersaoDados: fica fora da medição
+        self.assertEqual(self._post(self._lote(1, mes=5)).status_code, 201)
+        pequeno = self._lote(2, mes=6)
+        criar_terapeutas(3, inicio=2)
+        grande = self._lote(20, mes=7)
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(self._post(pequeno).status_code, 201)
+        with self.assertNumQueries(len(consultas)):
+            self.assertEqual(self._post(grande).status_code, 201)
+
+    def _patch(self, dados):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.patch(self.url, dados, format='json')
+
+    def test_lista_obrigatoria(self):
+        consulta = Consulta.objects.first()
+        response = self._patch({'pk_consulta': consulta.pk, 'is_realizado': True})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('non_field_errors', response.json())
+
+    def test_pk_repetido_ou_desconhecido(self):
+        consulta = Consulta.objects.filter(is_realizado=False).first()
+        for lote in (
+            [{'pk_consulta': consulta.pk, 'is_realizado': True}, {'pk_consulta': consulta.pk, 'vlr_pago': '10.00'}],
+            [{'pk_consulta': consulta.pk, 'is_realizado': True}, {'pk_consulta': 999999, 'vlr_pago': '10.00'}],
+            [{'pk_consulta': consulta.pk, 'is_realizado': True}, {'vlr_pago': '10.00'}],
+        ):
+            with self.subTest(lote=lote):
+                response = self._patch(lote)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(list(response.json()), ['1'])
+                self.assertIn('pk_consulta', response.json()['1'])
+                # Tudo ou nada: o item válido também não foi gravado
+                consulta.refresh_from_db()
+                self.assertFalse(consulta.is_realizado)
+
+    @override_settings(API_LOTE_MAX=2)
+    def test_limite_do_lote(self):
+        lote = [{'pk_consulta': pk, 'is_realizado': True} for pk in Consulta.objects.values_list('pk', flat=True)[:3]]
+        response = self._patch(lote)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('máximo é 2', response.json()['non_field_errors'][0])
+
+    def test_mudanca_de_data_e_terapeuta(self):
+        consulta = Consulta.objects.filter(is_realizado=True).first()
+        origem = (consulta.dat_consulta, consulta.fk_terapeuta_id)
+        destino = Terapeuta.objects.exclude(pk=consulta.fk_terapeuta_id).first()
+        antes = (get_data_version(), get_model_version('principais.consulta'), consulta.updated_at)
+
+        response = self._patch([{'pk_consulta': consulta.pk, 'fk_terapeuta': destino.pk, 'dat_consulta': '2025-05-20'}])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]['fk_terapeuta'], destino.pk)
+
+        consulta.refresh_from_db()
+        self.assertGreater(consulta.updated_at, antes[2])
+        self.assertGreater(get_data_version(), antes[0])
+        self.assertGreater(get_model_version('principais.consulta'), antes[1])
+        # Chave antiga ficou sem consultas; a nova recebeu a consulta
+        self.assertFalse(ConsultaDiaria.objects.filter(dat_consulta=origem[0], fk_terapeuta_id=origem[1]).exists())
+        diaria = ConsultaDiaria.objects.get(dat_consulta=date(2025, 5, 20), fk_terapeuta=destino)
+        self.assertEqual((diaria.total_marcadas, diaria.total_realizadas), (1, 1))
+
+
+class FiltrosAPITest(TestCase):
+    """Filtros por query param da listagem de consultas (FILTROS_CONSULTA)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        criar_terapeutas(2)
+        cls.terapeuta = Terapeuta.objects.order_by('pk').first()
+        # Sem valor pago: conta como não pago e não como inadimplente
+        cls.sem_valor = Consulta.objects.create(
+            fk_terapeuta=cls.terapeuta, fk_paciente=Paciente.objects.order_by('pk').first(),
+            vlr_consulta=Decimal('80.00'), vlr_pago=None, is_realizado=True, dat_consulta=date(2025, 5, 10)
+        )
+        cls.usuario = User.objects.create_superuser('admin', 'admin@teste.com', 'senha')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def _pks(self, **parametros):
+        response = self.client.get(reverse('consulta-list-create-api'), parametros)
+        self.assertEqual(response.status_code, 200)
+        return {item['pk_consulta'] for item in response.json()['results']}
+
+    def _esperado(self, q):
+        return set(Consulta.objects.filter(q).values_list('pk', flat=True))
+
+    def test_pago_e_inadimplente(self):
+        pagas = self._esperado(Q(vlr_pago__gt=0))
+        zeradas = self._esperado(Q(vlr_pago=0))
+        self.assertEqual((len(pagas), len(zeradas)), (2, 2))
+
+        self.assertEqual(self._pks(pago='true'), pagas)
+        self.assertEqual(self._pks(pago='false'), zeradas | {self.sem_valor.pk})
+        self.assertEqual(self._pks(inadimplente='sim'), zeradas)
+        self.assertEqual(self._pks(inadimplente='não'), pagas | {self.sem_valor.pk})
+        self.assertEqual(self._pks(pago='false', inadimplente='false'), {self.sem_valor.pk})
+
+    def test_intervalo_de_datas(self):
+        self.assertEqual(self._pks(data_inicio='2025-04-01'), self._esperado(Q(dat_consulta__gte=date(2025, 4, 1))))
+        self.assertEqual(self._pks(data_fim='2025-04-10'), self._esperado(Q(dat_consulta__lte=date(2025, 4, 10))))
+        # Limites inclusivos, combinados com os demais filtros
+        self.assertEqual(
+            self._pks(data_inicio='2025-04-10', data_fim='2025-05-10', terapeuta=str(self.terapeuta.pk)),
+            self._esperado(Q(dat_consulta__range=(date(2025, 4, 10), date(2025, 5, 10)), fk_terapeuta=self.terapeuta)),
+        )
+        # Parâmetro vazio é ignorado
+        self.assertEqual(self._pks(data_inicio=''), self._esperado(Q()))
+
+    def test_valor_invalido_e_400(self):
+        for parametro, valor in (
+            ('terapeuta', 'abc'), ('paciente', '-1'), ('data_inicio', '2025-13-01'),
+            ('data_fim', '10/04/2025'), ('pago', 'talvez'),
+        ):
+            response = self.client.get(reverse('consulta-list-create-api'), {parametro: valor})
+            self.assertEqual(response.status_code, 400, parametro)
+            self.assertIn(parametro, response.json())
+
+    def test_q_filtros_api(self):
+        self.assertEqual(q_filtros_api(FILTROS_CONSULTA, {}), Q())
+        self.assertEqual(
+            q_filtros_api(FILTROS_CONSULTA, {'terapeuta': '7', 'data_fim': '2025-04-10', 'extra': 'x'}),
+            Q(fk_terapeuta=7) & Q(dat_consulta__lte=date(2025, 4, 10)),
+        )
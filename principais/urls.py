@@ -17,6 +17,10 @@ urlpatterns = [
 
     path('match/nova/', views.MatchCreateView.as_view(), name='match-create'),
     path('relatorio/', views.gerar_relatorio, name='gerar-relatorio'),
+    path('relatorio/jobs/', views.relatorio_job_criar, name='relatorio-job-criar'),
+    path('relatorio/jobs/<int:pk>/', views.relatorio_job_status, name='relatorio-job-status'),
+    path('relatorio/jobs/<int:pk>/download/', views.relatorio_job_download, name='relatorio-job-download'),
+    path('delta/<str:tipo>/', views.DeltaAPIView.as_view(), name='delta-api'),
     path('api/v1/paciente/', views.PacienteListCreateAPIView.as_view(), name='paciente-list-create-api'),
     path('api/v1/paciente/<int:pk>/', views.PacienteRetrieveUpdateDestroyAPIView.as_view(), name='paciente-detail-api'),
     